@@ -0,0 +1,9 @@
+"""
+Benchmarks for pyradaiz. Run them from the pyradaiz directory, e.g.:
+
+    python -m benchmarks.timer_drift
+
+benchmarks.suite runs the timer and startup benchmarks together and compares
+them with benchmarks/baseline.json.
+"""
+__author__ = 'Alen Suljkanovic'
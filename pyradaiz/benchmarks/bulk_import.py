@@ -0,0 +1,164 @@
+"""
+Measures bulk import and export. Writes a million tasks and history events
+to CSV and JSON Lines files, plain and gzipped, imports them back into a
+task store and a history database, and samples the resident memory while
+it does. An import should only grow by what it stores: history goes to the
+database, so memory stays flat; tasks grow by the store's own size.
+
+    python -m benchmarks.bulk_import --rows 1000000
+"""
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from model.bulk import TASK_FIELDS, HISTORY_FIELDS, write_rows, \
+    import_tasks, import_history
+from model.history import HistoryStore
+from model.tasks import TaskStore
+from model.utils import rss_mb
+
+__author__ = 'Alen Suljkanovic'
+
+# Megabytes a history import may grow by.
+MAX_HISTORY_GROWTH = 16.0
+
+
+class MemorySampler(object):
+    """
+    Samples the resident memory from a thread until stopped.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_mb = rss_mb()
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, rss_mb())
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.end_mb = rss_mb()
+        self.peak_mb = max(self.peak_mb, self.end_mb)
+
+
+def tasks(rows):
+    for i in range(rows):
+        yield ("Task %d" % i, "Imported from tracker, ticket #%d" % i,
+               i % 17, i % 5 == 0)
+
+
+def events(rows):
+    kinds = ("phase_start", "phase_end")
+    for i in range(rows):
+        yield (1.7e9 + i * 60.0, kinds[i % 2], "work", 1500.0,
+               "Task %d" % (i % 1000), None)
+
+
+def measure(name, function, rows):
+    sampler = MemorySampler()
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+    print("%-24s %8.0f rows/s  %5.1f s  rss %6.1f -> peak %6.1f -> "
+          "%6.1f MB" % (name, rows / elapsed, elapsed, sampler.start_mb,
+                        sampler.peak_mb, sampler.end_mb))
+    return result, sampler
+
+
+def measure_task_import(name, path, rows):
+    """
+    Imports tasks into a store of their own, freed on return.
+    :return:
+        tuple of the tasks the report counts and the tasks stored.
+    """
+    store = TaskStore()
+    report, _ = measure(name, functools.partial(import_tasks, path, store),
+                        rows)
+    return report.imported, len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+    rows = args.rows
+
+    directory = tempfile.mkdtemp(prefix="pyradaiz-bulk-")
+    errors = []
+    try:
+        files = {}
+        for suffix in (".csv", ".jsonl", ".csv.gz"):
+            path = os.path.join(directory, "tasks" + suffix)
+            measure("export tasks" + suffix,
+                    lambda: write_rows(path, TASK_FIELDS, tasks(rows)), rows)
+            files["tasks" + suffix] = path
+        for suffix in (".csv", ".jsonl.gz"):
+            path = os.path.join(directory, "history" + suffix)
+            measure("export history" + suffix,
+                    lambda: write_rows(path, HISTORY_FIELDS, events(rows)),
+                    rows)
+            files["history" + suffix] = path
+        for name, path in sorted(files.items()):
+            print("  %-18s %6.1f MB" % (name,
+                                        os.path.getsize(path) / 2.0 ** 20))
+
+        for suffix in (".csv", ".jsonl", ".csv.gz"):
+            imported, stored = measure_task_import(
+                "import tasks" + suffix, files["tasks" + suffix], rows)
+            if imported != rows or stored != rows:
+                errors.append("tasks%s: imported %d of %d" %
+                              (suffix, stored, rows))
+
+        for suffix in (".csv", ".jsonl.gz"):
+            history = HistoryStore(os.path.join(directory,
+                                                "history%s.sqlite3" % suffix))
+            report, sampler = measure(
+                "import history" + suffix,
+                lambda: import_history(files["history" + suffix], history),
+                rows)
+            count = history.query("SELECT COUNT(*) FROM events")[0][0]
+            history.close()
+            if report.imported != rows or count != rows:
+                errors.append("history%s: imported %d of %d" %
+                              (suffix, count, rows))
+            growth = sampler.peak_mb - sampler.start_mb
+            if growth > MAX_HISTORY_GROWTH:
+                errors.append("history%s: memory grew by %.1f MB" %
+                              (suffix, growth))
+
+        # Every tenth row broken in one way or another.
+        path = os.path.join(directory, "broken.csv")
+        with open(path, "w") as f:
+            f.write("name,description,counter,finished\n")
+            for i in range(100000):
+                if i % 10 == 0:
+                    f.write(",no name,1,true\n" if i % 20 else
+                            "task %d,bad counter,-1,false\n" % i)
+                else:
+                    f.write("task %d,ok,%d,false\n" % (i, i % 7))
+        report = import_tasks(path, TaskStore())
+        print(report.summary())
+        if report.imported != 90000 or report.error_count != 10000:
+            errors.append("broken.csv: %d imported, %d rejected" %
+                          (report.imported, report.error_count))
+    finally:
+        shutil.rmtree(directory)
+
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
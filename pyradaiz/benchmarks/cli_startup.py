@@ -0,0 +1,126 @@
+"""
+Checks the terminal timer's startup. Runs cli.py --once, which loads the
+settings and prints the first frame, in fresh interpreters:
+
+  imports:  python -X importtime, every module the interpreter doesn't load
+            on its own; none of them may be Qt, nor another module only
+            needed later (the history database, the XML parser, ...), and
+            together they must load within MAX_IMPORT_MS
+  startup:  wall time of cli.py --once above a bare interpreter, which
+            must stay within MAX_STARTUP_MS
+
+The settings are saved first, so the cached settings are read, as on every
+start but the first.
+
+    python -m benchmarks.cli_startup --runs 20
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+# Milliseconds the modules the CLI imports may take, and the whole start on
+# top of the interpreter's own.
+MAX_IMPORT_MS = 25.0
+MAX_STARTUP_MS = 50.0
+
+# Packages that must not be imported before the first frame.
+FORBIDDEN = ("PyQt5", "sip", "numpy", "sqlite3", "_sqlite3", "xml",
+             "pyexpat", "json", "logging", "argparse", "csv", "gzip",
+             "random", "model.history", "model.bulk", "model.pyradaiz")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(args, env):
+    """
+    Runs python -X importtime with args.
+    :return:
+        dictionary of module name to its own import time in microseconds.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                             cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, universal_newlines=True,
+                             check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            times[name.strip()] = int(own)
+    return times
+
+
+def wall_ms(args, env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="pyradaiz-cli-")
+    env = dict(os.environ, XDG_CONFIG_HOME=os.path.join(directory, "config"),
+               XDG_DATA_HOME=os.path.join(directory, "data"))
+    errors = []
+    try:
+        # Writes config.xml and the cache.
+        subprocess.run([sys.executable, "-c",
+                        "from model.settings import PyradaizSettings\n"
+                        "s = PyradaizSettings(); s.load(); s.store.save("
+                        "s.as_dict())"], cwd=ROOT, env=env, check=True)
+
+        bare = import_times(["-c", "pass"], env)
+        # The least of a few runs, an import is only ever slower than that.
+        cli = {}
+        for _ in range(5):
+            for name, own in import_times(["cli.py", "--once"], env).items():
+                cli[name] = min(own, cli.get(name, own))
+        added = dict((name, own) for name, own in cli.items()
+                     if name not in bare)
+        total = sum(added.values()) / 1000.0
+        print("imports:  %d modules, %.1f ms" % (len(added), total))
+        for name, own in sorted(added.items(), key=lambda item: -item[1])[:8]:
+            print("  %-28s %6.2f ms" % (name, own / 1000.0))
+        forbidden = sorted(name for name in added
+                           if name.split(".")[0] in FORBIDDEN or
+                           name in FORBIDDEN)
+        if forbidden:
+            errors.append("imported before the first frame: %s" %
+                          ", ".join(forbidden))
+        if total > MAX_IMPORT_MS:
+            errors.append("imports took %.1f ms, more than %.0f ms" %
+                          (total, MAX_IMPORT_MS))
+
+        interpreter = wall_ms(["-c", "pass"], env, args.runs)
+        first_frame = wall_ms(["cli.py", "--once"], env, args.runs)
+        startup = first_frame - interpreter
+        print("startup:  %.1f ms above the interpreter's %.1f ms" %
+              (startup, interpreter))
+        if startup > MAX_STARTUP_MS:
+            errors.append("started in %.1f ms, more than %.0f ms" %
+                          (startup, MAX_STARTUP_MS))
+    finally:
+        shutil.rmtree(directory)
+
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Measures what subscribers of the control endpoint cost. One process holds
+all subscriber connections and timestamps every message it receives; the
+endpoint is handed a new state at a steady rate, the way the GUI hands it
+over. Publish cost is the time the handing thread, the GUI thread in
+pyradaiz, spends per state; fan-out is the endpoint's sending time per
+message and subscriber.
+
+    python -m benchmarks.control_fanout --subscribers 500 --updates 200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from model.control import ControlServer
+from model.core import SessionState, PHASE_WORK
+
+__author__ = 'Alen Suljkanovic'
+
+SUBSCRIBERS = """
+import json, selectors, socket, sys, time
+selector = selectors.DefaultSelector()
+for _ in range(%(count)d):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(%(path)r)
+    sock.sendall(b'{"id":1,"cmd":"subscribe","mode":"change"}\\n')
+    sock.setblocking(False)
+    selector.register(sock, selectors.EVENT_READ, [b""])
+print("ready", flush=True)
+received = {}
+expected = %(updates)d
+while True:
+    events = selector.select(5)
+    if not events:
+        break
+    now = time.monotonic()
+    for key, _ in events:
+        data = key.fileobj.recv(65536)
+        if not data:
+            selector.unregister(key.fileobj)
+            continue
+        lines = (key.data[0] + data).split(b"\\n")
+        key.data[0] = lines.pop()
+        for line in lines:
+            message = json.loads(line)
+            if message.get("event") == "change":
+                received.setdefault(message["remaining"], []).append(now)
+    if not selector.get_map():
+        break
+print(json.dumps(received))
+"""
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01,
+                        help="seconds between states")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "control.sock")
+    server = ControlServer(path, lambda command: None)
+    server.start()
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subscribers = subprocess.Popen(
+        [sys.executable, "-c", SUBSCRIBERS % {"count": args.subscribers,
+                                              "path": path,
+                                              "updates": args.updates}],
+        cwd=cwd, stdout=subprocess.PIPE)
+    subscribers.stdout.readline()
+    while sum(len(s) for s in server.subscribers.values()) < \
+            args.subscribers:
+        time.sleep(0.01)
+
+    published = {}
+    publish_times = []
+    started_cpu = time.process_time()
+    for i in range(1, args.updates + 1):
+        # Every state differs from the last, so each is pushed.
+        state = SessionState(True, PHASE_WORK, 0, i, None, None, None,
+                             time.monotonic() + i)
+        started = time.perf_counter()
+        published[i] = time.monotonic()
+        server.publish(state)
+        publish_times.append(time.perf_counter() - started)
+        time.sleep(args.interval)
+    cpu = time.process_time() - started_cpu
+    server.close()
+    received = json.loads(subscribers.communicate()[0].splitlines()[-1])
+
+    latencies = [t - published[int(i)] for i, times in received.items()
+                 for t in times]
+    delivered = len(latencies)
+    print("subscribers: %d  updates: %d  every %.0f ms" %
+          (args.subscribers, args.updates, args.interval * 1000))
+    print("publish (GUI thread): median %.1f us  max %.1f us" %
+          (statistics.median(publish_times) * 1e6,
+           max(publish_times) * 1e6))
+    print("fan-out per message and subscriber: %.2f us" %
+          (server.fanout_time / max(1, server.sent) * 1e6))
+    print("endpoint process CPU per update: %.1f us (%.2f us per "
+          "subscriber)" % (cpu / args.updates * 1e6,
+                           cpu / args.updates / args.subscribers * 1e6))
+    print("delivery: median %.2f ms  p99 %.2f ms  (%d of %d messages)" %
+          (statistics.median(latencies) * 1000,
+           percentile(latencies, 0.99) * 1000, delivered,
+           args.subscribers * args.updates))
+    if delivered != args.subscribers * args.updates:
+        print("FAILED: messages were lost")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
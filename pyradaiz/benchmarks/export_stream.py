@@ -0,0 +1,177 @@
+"""
+Measures the event exporter. The recording cost is what the timer thread
+pays per event. The stream run then records events while a local stand-in
+collector is down for the first part of the run, and checks that every
+event arrives once it's back, after having been spooled to disk. Last, a
+sink that fails the first few batches checks that the exporter keeps going.
+
+    python -m benchmarks.export_stream --events 20000 --down 1.0
+"""
+import argparse
+import errno
+import gzip
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from model.export import EventExporter, HttpSink
+
+__author__ = 'Alen Suljkanovic'
+
+
+class Collector(object):
+    """
+    Local collector that refuses batches until it's up.
+    """
+    def __init__(self):
+        self.up = False
+        self.events = []
+        self.batches = 0
+        self.bytes = 0
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers["Content-Length"]))
+                if not collector.up:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                lines = gzip.decompress(data).decode("utf-8").splitlines()
+                collector.events += [json.loads(line) for line in lines]
+                collector.batches += 1
+                collector.bytes += len(data)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d/events" % self.server.server_port
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+class NullSink(object):
+    def send(self, data):
+        pass
+
+    def retry(self):
+        pass
+
+
+class FlakySink(object):
+    """
+    Sink that fails the first sends, the way a full disk does.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        self.events = 0
+
+    def send(self, data):
+        if self.failures:
+            self.failures -= 1
+            raise OSError(errno.ENOSPC, "No space left on device")
+        self.events += gzip.decompress(data).count(b"\n")
+
+    def retry(self):
+        pass
+
+
+def record_cost(events):
+    """
+    Returns seconds per recorded event.
+    """
+    exporter = EventExporter(NullSink(), flush_interval=0.1)
+    record = exporter.on_history_event
+    started = time.perf_counter()
+    for i in range(events):
+        record(1.7e9 + i, "phase_end", "work", 1500.0, "task", "main")
+    elapsed = time.perf_counter() - started
+    exporter.close()
+    return elapsed / events
+
+
+def stream(events, down, rate):
+    collector = Collector()
+    spool = tempfile.mkdtemp()
+    sink = HttpSink(collector.url, spool_directory=spool)
+    # Retries quickly, so the run doesn't take minutes.
+    sink.backoff = 0.2
+    exporter = EventExporter(sink, batch_size=500, flush_interval=0.2,
+                             retry_interval=0.2)
+    started = time.monotonic()
+    spooled = 0
+    for i in range(events):
+        if not collector.up and time.monotonic() - started >= down:
+            spooled = len(sink.spool.files())
+            collector.up = True
+        exporter.on_history_event(1.7e9 + i, "phase_end", "work", 1500.0,
+                                  "task %d" % (i % 20), "main")
+        if i % 100 == 0:
+            time.sleep(100.0 / rate)
+    collector.up = True
+    deadline = time.monotonic() + 10
+    while len(collector.events) < events and time.monotonic() < deadline:
+        time.sleep(0.05)
+    exporter.close()
+    collector.server.shutdown()
+
+    raw = sum(len(json.dumps(event)) + 1 for event in collector.events)
+    print("stream: %d events, collector down for %.1f s" % (events, down))
+    print("batches sent: %d  spooled while down: %d  failed posts: %d" %
+          (collector.batches, spooled, sink.failures))
+    print("compressed: %d bytes (%.1f bytes per event, %.0fx smaller)" %
+          (collector.bytes, collector.bytes / max(1, events),
+           raw / max(1, collector.bytes)))
+    seen = len(set(event["ts"] for event in collector.events))
+    if len(collector.events) != events or seen != events:
+        return ["%d of %d events arrived, %d distinct" %
+                (len(collector.events), events, seen)]
+    return []
+
+
+def sink_errors(events, failures):
+    sink = FlakySink(failures)
+    exporter = EventExporter(sink, batch_size=500, flush_interval=0.05,
+                             retry_interval=0.05)
+    exporter.backoff = 0.05
+    for i in range(events):
+        exporter.on_history_event(1.7e9 + i, "phase_end", "work", 1500.0,
+                                  "task", "main")
+    deadline = time.monotonic() + 10
+    while sink.events < events and time.monotonic() < deadline:
+        time.sleep(0.05)
+    exporter.close()
+    print("sink errors: %d  events delivered: %d of %d" %
+          (exporter.errors, sink.events, events))
+    if sink.events != events or exporter.errors != failures:
+        return ["%d of %d events delivered after %d sink errors" %
+                (sink.events, events, exporter.errors)]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--down", type=float, default=1.0,
+                        help="seconds the collector is down")
+    parser.add_argument("--rate", type=float, default=10000,
+                        help="events per second")
+    args = parser.parse_args()
+
+    print("record: %.2f us per event" % (record_cost(200000) * 1e6))
+    errors = stream(args.events, args.down, args.rate)
+    errors += sink_errors(5000, 3)
+    for error in errors:
+        print("FAILED: %s" % error)
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
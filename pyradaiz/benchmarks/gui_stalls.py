@@ -0,0 +1,117 @@
+"""
+Runs the main window with the watchdog on, stalls its GUI thread on purpose
+and checks that every stall is caught: one spent in Python, which the
+watchdog samples, one sleeping, and the always on top toggle, which
+recreates the native window. Reports the stalls, the tick delivery latency
+and what a heartbeat costs, and leaves the trace file behind.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.gui_stalls --seconds 6
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.suite import isolate
+
+__author__ = 'Alen Suljkanovic'
+
+
+def busy(seconds):
+    """
+    Keeps the GUI thread busy in Python.
+    """
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--seconds", type=float, default=6.0)
+    parser.add_argument("--stall", type=float, default=0.3,
+                        help="seconds each injected stall lasts")
+    parser.add_argument("--threshold-ms", type=int, default=100)
+    parser.add_argument("--trace", help="trace file, a temporary file by "
+                                        "default")
+    args = parser.parse_args()
+
+    isolate()
+    trace = args.trace or os.path.join(tempfile.mkdtemp(), "trace.json")
+    os.environ["PYRADAIZ_WATCHDOG"] = trace
+    os.environ["PYRADAIZ_STALL_MS"] = str(args.threshold_ms)
+
+    from PyQt5 import QtCore, QtWidgets
+    from model.consts import ALWAYS_ON_TOP_NO, ALWAYS_ON_TOP_YES
+    from model.pyradaiz import PyradaizGui
+    from model.watchdog import StallWatchdog
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    view = PyradaizGui()
+    view.show()
+    view.timer_thread.start_session()
+    watchdog = view.watchdog
+
+    toggles = []
+
+    def toggle():
+        for i in range(10):
+            started = time.perf_counter()
+            view.settings.always_on_top = \
+                ALWAYS_ON_TOP_YES if i % 2 == 0 else ALWAYS_ON_TOP_NO
+            toggles.append(time.perf_counter() - started)
+
+    injected = [(1.0, "python", lambda: busy(args.stall)),
+                (2.5, "sleep", lambda: time.sleep(args.stall)),
+                (4.0, "always on top x10", toggle)]
+    for at, _, function in injected:
+        QtCore.QTimer.singleShot(int(at * 1000), function)
+    QtCore.QTimer.singleShot(int(args.seconds * 1000), app.quit)
+    app.exec_()
+    view.timer_thread.stop()
+    view.notifier.close()
+    view.stop_control()
+    watchdog.close()
+
+    # What a beat costs, on a watchdog that isn't running.
+    idle = StallWatchdog()
+    beats = 100000
+    started = time.perf_counter()
+    for _ in range(beats):
+        idle.beat()
+    beat_cost = (time.perf_counter() - started) / beats
+
+    stalls = [e for e in watchdog.events if e["name"] == "stall"]
+    print("stall threshold: %d ms  injected: %s" %
+          (args.threshold_ms, ", ".join(name for _, name, _ in injected)))
+    for stall in stalls:
+        print("  stall at %6.3f s: %6.1f ms" %
+              (stall["ts"] / 1e6, stall["args"]["ms"]))
+    print("always on top toggle: median %.1f ms" %
+          (sorted(toggles)[len(toggles) // 2] * 1000 if toggles else 0))
+    print("stack samples: %d" % watchdog.samples)
+    for stack, count in watchdog.folded.most_common(3):
+        print("  %3d  ...%s" % (count, stack[-90:]))
+    delivery = watchdog.delivery
+    if delivery.count:
+        print("tick delivery: %d ticks  mean %.2f ms  max %.2f ms" %
+              (delivery.count, delivery.total / delivery.count * 1000,
+               delivery.max * 1000))
+    print("heartbeat: %.2f us" % (beat_cost * 1e6))
+    print("trace: %s (+ .folded)" % trace)
+
+    errors = []
+    if len([s for s in stalls if s["args"]["ms"] >= args.stall * 1000]) < 2:
+        errors.append("the injected stalls weren't all caught")
+    if not any("busy" in stack for stack in watchdog.folded):
+        errors.append("the busy loop wasn't sampled")
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
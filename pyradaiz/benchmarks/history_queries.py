@@ -0,0 +1,88 @@
+"""
+Fills a temporary history database with years of generated events through
+the batched writer and times range queries on it.
+
+    python -m benchmarks.history_queries --rows 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from model.history import HistoryStore, PHASE_START, PHASE_END
+from model.core import PHASE_WORK, PHASE_SHORT_BREAK
+
+__author__ = 'Alen Suljkanovic'
+
+WEEK = 7 * 24 * 3600
+
+
+def fill(store, rows, tasks, users, years):
+    """
+    Records `rows` phase events spread evenly over the given years.
+    """
+    rng = random.Random(0)
+    end = time.time()
+    start = end - years * 365 * 24 * 3600
+    step = (end - start) / rows
+    ts = start
+    for i in range(rows // 2):
+        phase = PHASE_WORK if i % 2 == 0 else PHASE_SHORT_BREAK
+        task = "task-%d" % rng.randrange(tasks)
+        session = "user-%d" % rng.randrange(users)
+        store.record(PHASE_START, phase, 1500, task, session, ts)
+        ts += step
+        store.record(PHASE_END, phase, 1500, task, session, ts)
+        ts += step
+    return end
+
+
+def timed(function, *args, repeat=20):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--years", type=float, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = HistoryStore(os.path.join(directory, "history.sqlite3"))
+        started = time.perf_counter()
+        end = fill(store, args.rows, args.tasks, args.users, args.years)
+        queued = time.perf_counter() - started
+        store.flush()
+        written = time.perf_counter() - started
+        print("record():            %.2f us per event on the caller" %
+              (queued / args.rows * 1e6))
+        print("written:             %d rows in %.2f s (%.0f rows/s)" %
+              (args.rows, written, args.rows / written))
+
+        ms, result = timed(store.pomodoros_per_task, end - WEEK, end)
+        print("pomodoros per task:  %.2f ms (week, %d tasks)" %
+              (ms, len(result)))
+        ms, result = timed(store.pomodoros_per_day, end - 4 * WEEK, end)
+        print("pomodoros per day:   %.2f ms (4 weeks, %d days)" %
+              (ms, len(result)))
+        ms, result = timed(store.events, end - WEEK, end, "task-1")
+        print("events for one task: %.2f ms (week, %d rows)" %
+              (ms, len(result)))
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
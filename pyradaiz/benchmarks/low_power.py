@@ -0,0 +1,52 @@
+"""
+Compares timer wake ups per minute with the window visible and hidden (low
+power mode), replaying the timer thread loop against a simulated clock.
+
+    python -m benchmarks.low_power --hours 2
+"""
+import argparse
+
+from model.clock import VirtualClock
+from model.core import PomodoroSession
+from model.instrumentation import WakeupCounter
+
+__author__ = 'Alen Suljkanovic'
+
+
+def run(hours, low_power):
+    """
+    Runs the timer loop for the given number of simulated hours.
+    :return:
+        (wake ups per minute, display updates, phase changes)
+    """
+    clock = VirtualClock()
+    wakeups = WakeupCounter(clock, window=hours * 3600)
+    events = {"tick": 0, "phase": 0}
+
+    def listener(session, event, value):
+        events["tick" if event == "tick" else "phase"] += 1
+
+    session = PomodoroSession(25, 5, 15, clock=clock, wall_clock=clock.time)
+    session.subscribe(listener)
+    session.ticks = not low_power
+    session.start()
+    while clock.now < hours * 3600:
+        session.poll()
+        clock.advance(session.next_wakeup())
+        wakeups.count()
+    return wakeups.per_minute(), events["tick"], events["phase"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--hours", type=float, default=2)
+    args = parser.parse_args()
+
+    for name, low_power in (("visible", False), ("hidden", True)):
+        per_minute, ticks, phases = run(args.hours, low_power)
+        print("%-8s wake ups/min: %7.2f  display updates: %6d  phase "
+              "changes: %d" % (name, per_minute, ticks, phases))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Measures the notification pipeline with a fast sink standing in for the
+tray, a log file, a slow local webhook and a sound command that hangs. The
+posting thread stands in for the GUI thread: the time post takes is the
+time the GUI would be held up. Notices of a kind replace each other while
+they wait, and phases change every few notices, so notices a slow sink
+couldn't get to in time are dropped as stale.
+
+    python -m benchmarks.notify_dispatch --notices 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from model.core import EVENT_GO_ON, EVENT_TAKE_A_BREAK, PHASE_WORK, \
+    PHASE_SHORT_BREAK
+from model.notifications import NotificationDispatcher, Notification, \
+    CallbackSink, LogSink, CommandSink, WebhookSink
+
+__author__ = 'Alen Suljkanovic'
+
+
+def webhook_server(delay):
+    """
+    Starts a local webhook that answers after delay seconds.
+    :return:
+        (server, url)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d/" % server.server_port
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--notices", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005,
+                        help="seconds between notices")
+    parser.add_argument("--phase-every", type=int, default=10,
+                        help="notices per phase")
+    parser.add_argument("--webhook-delay", type=float, default=0.05)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    server, url = webhook_server(args.webhook_delay)
+    directory = tempfile.mkdtemp()
+    shown = []
+    phase = [PHASE_WORK]
+    sinks = [CallbackSink("tray", shown.append),
+             LogSink(os.path.join(directory, "notices.log")),
+             WebhookSink(url, timeout=1.0),
+             CommandSink("sleep 10", timeout=0.2)]
+    dispatcher = NotificationDispatcher(sinks, backoff=0.5,
+                                        current_phase=lambda: phase[0])
+
+    post_times = []
+    for i in range(args.notices):
+        if i % args.phase_every == 0:
+            phase[0] = PHASE_SHORT_BREAK if phase[0] == PHASE_WORK \
+                else PHASE_WORK
+        if phase[0] == PHASE_WORK:
+            notification = Notification(EVENT_GO_ON, "Go on",
+                                        phase=PHASE_WORK)
+        else:
+            notification = Notification(EVENT_TAKE_A_BREAK, "Break",
+                                        phase=PHASE_SHORT_BREAK)
+        started = time.perf_counter()
+        dispatcher.post(notification)
+        post_times.append(time.perf_counter() - started)
+        time.sleep(args.interval)
+    # Lets the webhook catch up with the last phase.
+    time.sleep(args.webhook_delay * 2 + 0.1)
+    stats = dispatcher.stats()
+    dispatcher.close()
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps({"post": {"median": statistics.median(post_times),
+                                   "max": max(post_times)},
+                          "sinks": stats}, indent=2))
+        return
+    print("notices: %d  every %.0f ms  %d per phase" %
+          (args.notices, args.interval * 1000, args.phase_every))
+    print("post (GUI thread): median %.1f us  p99 %.1f us  max %.1f us" %
+          (statistics.median(post_times) * 1e6,
+           percentile(post_times, 0.99) * 1e6, max(post_times) * 1e6))
+    print("%-8s %9s %8s %8s %8s %7s %7s %6s %7s %8s" %
+          ("sink", "delivered", "p50 ms", "p99 ms", "max ms", "merged",
+           "dropped", "stale", "skipped", "timeouts"))
+    for name, sink in stats.items():
+        latency = sink["latency"]
+        # Percentiles are bucket bounds, they can't be above the maximum.
+        columns = ["-"] * 3
+        if latency["count"]:
+            columns = ["%.2f" % (min(latency[k], latency["max"]) * 1000)
+                       for k in ("p50", "p99", "max")]
+        print("%-8s %9d %8s %8s %8s %7d %7d %6d %7d %8d" % (
+            name, sink["delivered"], columns[0], columns[1], columns[2],
+            sink["coalesced"], sink["dropped"], sink["stale"],
+            sink["skipped"], sink["timeouts"]))
+    if len(shown) != stats["tray"]["delivered"]:
+        print("FAILED: tray shown %d of %d notices" %
+              (len(shown), stats["tray"]["delivered"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
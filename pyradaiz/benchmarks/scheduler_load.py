@@ -0,0 +1,108 @@
+"""
+Runs many sessions on one Scheduler thread, the way the session server does,
+and reports the cost of inserting and cancelling timers and how late phase
+switches happen.
+
+Phases are very short and of slightly different length, so the boundaries of
+all sessions are spread over the run and keep the wheel busy.
+
+    python -m benchmarks.scheduler_load --sessions 10000 --duration 10
+"""
+import argparse
+import sys
+import time
+
+from model.core import (PomodoroSession, Scheduler, EVENT_TAKE_A_BREAK,
+                        EVENT_GO_ON)
+
+__author__ = 'Alen Suljkanovic'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_sessions(count, phase, clock):
+    sessions = []
+    for i in range(count):
+        minutes = phase * (1 + (i % 100) / 100.0)
+        session = PomodoroSession(minutes, minutes, minutes,
+                                  name="session-%d" % i, clock=clock)
+        session.ticks = False
+        sessions.append(session)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds")
+    parser.add_argument("--phase", type=float, default=0.02,
+                        help="shortest phase length in minutes")
+    parser.add_argument("--max-late", type=float, default=0.1,
+                        help="allowed p99 lateness of a phase switch in "
+                             "seconds")
+    args = parser.parse_args()
+
+    scheduler = Scheduler(clock=time.monotonic)
+    sessions = make_sessions(args.sessions, args.phase, time.monotonic)
+    lateness = []
+
+    def on_event(session, event, value):
+        if event in (EVENT_TAKE_A_BREAK, EVENT_GO_ON):
+            # The new phase was chained to the boundary that just passed.
+            boundary = session.timer.deadline - value * 60
+            lateness.append(time.monotonic() - boundary)
+
+    for session in sessions:
+        session.subscribe(on_event)
+
+    started = time.perf_counter()
+    for session in sessions:
+        scheduler.schedule(session)
+    insert = (time.perf_counter() - started) / len(sessions)
+
+    started = time.perf_counter()
+    for session in sessions:
+        scheduler.cancel(session)
+        scheduler.schedule(session)
+    cancel = (time.perf_counter() - started) / len(sessions)
+
+    started = time.perf_counter()
+    scheduler.start()
+    time.sleep(args.duration)
+    scheduler.stop()
+    elapsed = time.perf_counter() - started
+
+    expected = 0
+    for session in sessions:
+        expected += int(elapsed / (session.pomodoro_duration * 60))
+
+    print("sessions:        %d" % len(sessions))
+    print("schedule:        %.2f us" % (insert * 1e6))
+    print("cancel+schedule: %.2f us" % (cancel * 1e6))
+    print("phase switches:  %d of about %d (%.0f/s)" %
+          (len(lateness), expected, len(lateness) / elapsed))
+    errors = []
+    if not lateness:
+        errors.append("no phase switches")
+    else:
+        p99 = percentile(lateness, 0.99)
+        print("late p50:        %.1f ms" % (percentile(lateness, 0.5) * 1000))
+        print("late p99:        %.1f ms" % (p99 * 1000))
+        print("late max:        %.1f ms" % (max(lateness) * 1000))
+        if p99 > args.max_late:
+            errors.append("p99 lateness %.3f s over %.3f s" %
+                          (p99, args.max_late))
+        if len(lateness) < expected * 0.9:
+            errors.append("only %d of about %d phase switches" %
+                          (len(lateness), expected))
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Load generator for the session server. Opens many client connections, each
+subscribed to its own session, sends a steady stream of commands and reports
+command latency percentiles and the rate of pushed phase events.
+
+Unless --unix or --port is given, a server with very short phases is started
+in a subprocess on a temporary Unix socket.
+
+    python -m benchmarks.server_load --clients 2000 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from server import encode, decode
+
+__author__ = 'Alen Suljkanovic'
+
+COMMANDS = ("status", "stop", "start", "status")
+
+
+class Client(object):
+    """
+    One connection. Replies are matched to requests by id, events are
+    counted.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending = {}
+        self.events = 0
+
+    async def read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = decode(line)
+            if "event" in message:
+                self.events += 1
+            else:
+                self.pending.pop(message["id"]).set_result(message)
+
+    async def request(self, cmd, session):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(encode({"id": request_id, "cmd": cmd,
+                                  "session": session}))
+        return await future
+
+
+async def connect(args):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+async def run_client(index, args, latencies, deadline):
+    client = Client(*await connect(args))
+    reader = asyncio.ensure_future(client.read())
+    session = "session-%s" % index
+    await client.request("subscribe", session)
+    await client.request("start", session)
+
+    interval = 1.0 / args.rate
+    for cmd in itertools.cycle(COMMANDS):
+        if time.perf_counter() >= deadline:
+            break
+        started = time.perf_counter()
+        reply = await client.request(cmd, session)
+        latencies.append(time.perf_counter() - started)
+        assert reply["ok"], reply
+        await asyncio.sleep(interval)
+    # Leave the session running, so it keeps producing events.
+    await client.request("start", session)
+
+    client.writer.close()
+    reader.cancel()
+    return client.events
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args):
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    clients = [run_client(i, args, latencies, deadline)
+               for i in range(args.clients)]
+    events = sum(await asyncio.gather(*clients))
+    elapsed = time.perf_counter() - started
+
+    print("clients:       %d" % args.clients)
+    print("commands:      %d (%.0f/s)" % (len(latencies),
+                                          len(latencies) / elapsed))
+    print("latency p50:   %.3f ms" % (percentile(latencies, 0.5) * 1000))
+    print("latency p99:   %.3f ms" % (percentile(latencies, 0.99) * 1000))
+    print("events:        %d (%.0f/s)" % (events, events / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds")
+    parser.add_argument("--rate", type=float, default=5,
+                        help="commands per second per client")
+    parser.add_argument("--unix", help="Unix socket of a running server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int,
+                        help="TCP port of a running server")
+    parser.add_argument("--phase", type=float, default=0.02,
+                        help="phase length in minutes of the spawned server")
+    args = parser.parse_args()
+
+    server = None
+    if not args.unix and not args.port:
+        args.unix = os.path.join(tempfile.mkdtemp(), "pyradaiz.sock")
+        phase = str(args.phase)
+        server = subprocess.Popen(
+            [sys.executable, "server.py", "--unix", args.unix, "--pomodoro",
+             phase, "--short-break", phase, "--long-break", phase],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        while not os.path.exists(args.unix):
+            time.sleep(0.01)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measures cold-start settings load time. Every sample runs in a fresh
+interpreter, so module imports are part of the measurement, as they are
+when pyradaiz starts.
+
+  before: ElementTree parse of config.xml, the way PyradaizSettings used to
+  xml:    SettingsStore.load when the cache is stale
+  cached: SettingsStore.load from the marshal cache
+
+    python -m benchmarks.settings_load --runs 20
+"""
+import argparse
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from model.settings_store import SettingsStore
+from model.utils import get_root_path
+
+__author__ = 'Alen Suljkanovic'
+
+BEFORE = """
+import time
+start = time.perf_counter()
+from xml.etree.ElementTree import ElementTree
+with open(%(path)r) as f:
+    tree = ElementTree()
+    tree.parse(f)
+    root = tree.getroot()
+    values = [int(root.find("pomodoro_duration").text),
+              int(root.find("short_break").text),
+              int(root.find("long_break").text),
+              root.find("always_on_top").text]
+print(time.perf_counter() - start)
+"""
+
+AFTER = """
+import os, time
+%(touch)s
+start = time.perf_counter()
+from model.settings_store import SettingsStore
+values = SettingsStore(%(directory)r).load()
+print(time.perf_counter() - start)
+"""
+
+# Touches the XML before the measurement starts, so it's no longer the
+# file the cache was made from.
+TOUCH = "os.utime(%r)"
+
+
+def sample(code, runs):
+    cwd = get_root_path()
+    times = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=cwd)
+        times.append(float(out) * 1000)
+    return statistics.median(times), min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = SettingsStore(directory)
+        store.save(store.load())
+        path = store.path
+
+        cases = (
+            ("before", BEFORE % {"path": path}),
+            ("xml", AFTER % {"directory": directory,
+                             "touch": TOUCH % path}),
+            ("cached", AFTER % {"directory": directory, "touch": ""}),
+        )
+        for name, code in cases:
+            median, best = sample(code, args.runs)
+            print("%-7s median: %6.3f ms  min: %6.3f ms" % (name, median,
+                                                           best))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Measures settings hot reload: what a check costs while config.xml stays the
+same, what parsing and applying a changed one costs, and how long a file
+pushed by another process takes to reach a running window, replaced by a
+rename and edited in place. Also checks that the window's own saves aren't
+reloaded, that a reload while a phase runs leaves the phase alone, and
+times switching between profiles.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.settings_reload
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.suite import close_gui, isolate
+
+__author__ = 'Alen Suljkanovic'
+
+CONFIG = """<config><pomodoro_duration>%d</pomodoro_duration>\
+<short_break>%d</short_break><long_break>%d</long_break>\
+<always_on_top>No</always_on_top><profiles>\
+<profile name="Classic" pomodoro_duration="25" short_break="5" \
+long_break="15" /><profile name="Deep work" pomodoro_duration="50" \
+short_break="10" long_break="30" /><profile name="Sprint" \
+pomodoro_duration="15" short_break="3" long_break="10" />\
+</profiles></config>"""
+
+# Milliseconds a pushed file may take to apply.
+MAX_LATENCY_MS = 1000
+
+
+def timed(function, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(times)
+
+
+def wait_for(app, condition, timeout=5.0):
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            return None
+        app.processEvents()
+        time.sleep(0.001)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    isolate()
+    from PyQt5 import QtWidgets
+    from model.pyradaiz import PyradaizGui
+    from model.settings_store import atomic_write
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    view = PyradaizGui()
+    settings = view.settings
+    store = settings.store
+    watcher = view.config_watcher
+    errors = []
+
+    atomic_write(store.path, (CONFIG % (25, 5, 15)).encode())
+    settings.reload()
+    print("watching: %s" % watcher.as_dict()["mode"])
+
+    unchanged = timed(settings.reload, args.runs)
+    print("check, unchanged:       %7.1f us" % unchanged)
+
+    def change():
+        # The size stays the same, only the inode tells the versions apart.
+        minutes = 20 + change.count % 10
+        change.count += 1
+        atomic_write(store.path, (CONFIG % (minutes, 5, 15)).encode())
+        started = time.perf_counter()
+        if not settings.reload():
+            errors.append("a changed file wasn't applied")
+        change.time += time.perf_counter() - started
+    change.count, change.time = 0, 0.0
+    runs = min(args.runs, 200)
+    for _ in range(runs):
+        change()
+    print("reload, changed:        %7.1f us" % (change.time / runs * 1e6))
+
+    def switch():
+        switch.count += 1
+        settings.apply_profile(("Classic", "Deep work")[switch.count % 2])
+    switch.count = 0
+    print("profile switch:         %7.1f us" % timed(switch, args.runs))
+    view.fill_context_menu()
+    view.fill_profiles_menu()
+    names = [action.name for action in view.profiles_menu.actions()]
+    if names != ["Classic", "Deep work", "Sprint"]:
+        errors.append("profiles menu lists %s" % names)
+
+    # The window's own save, written after its delay.
+    settings.update({"short_break": 7})
+    store.flush()
+    app.processEvents()
+    if store.changed():
+        errors.append("the window's own save looks like a change")
+
+    # A running work phase keeps its deadline; the durations apply from
+    # the next phase on.
+    session = view.timer_thread.runner.session
+    view.timer_thread.start_session()
+    wait_for(app, lambda: session.running)
+    deadline = session.timer.deadline
+    atomic_write(store.path, (CONFIG % (50, 10, 30)).encode())
+    latency = wait_for(app, lambda: session.plan.durations[0] == 50 * 60)
+    print("pushed by rename:       %7.1f ms" % (latency or -1))
+    if latency is None or latency > MAX_LATENCY_MS:
+        errors.append("a renamed file took %s ms to apply" % latency)
+    if session.timer.deadline != deadline or not session.running:
+        errors.append("the reload changed the running phase")
+
+    with open(store.path, "r+b") as f:
+        f.write((CONFIG % (45, 10, 30)).encode())
+    latency = wait_for(app, lambda: session.plan.durations[0] == 45 * 60)
+    print("pushed in place:        %7.1f ms" % (latency or -1))
+    if latency is None or latency > MAX_LATENCY_MS:
+        errors.append("a file edited in place took %s ms to apply" % latency)
+    print("watcher: %s" % watcher.as_dict())
+    close_gui(view)
+
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
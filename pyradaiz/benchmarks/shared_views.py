@@ -0,0 +1,106 @@
+"""
+Measures how fast a state change reaches views attached to the shared state:
+the owner publishes and rings, and every view, a separate process, reads the
+block when its doorbell rings. Latency is the time from the write to the
+view having read it; both sides use the system wide monotonic clock.
+
+    python -m benchmarks.shared_views --views 16 --updates 500
+"""
+import argparse
+import json
+import os
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from model.core import SessionState, PHASE_WORK
+from model.shared import SharedState, Doorbell
+
+__author__ = 'Alen Suljkanovic'
+
+VIEW = """
+import json, select, sys, time
+from model.shared import SharedState, DoorbellClient
+state = SharedState.attach(%(name)r)
+client = DoorbellClient(%(path)r)
+latencies = []
+last = None
+started = time.process_time()
+while True:
+    select.select([client], [], [])
+    alive = client.drain()
+    raw = state.read_raw()
+    if raw[6] != last:
+        last = raw[6]
+        latencies.append(time.monotonic() - raw[6])
+    if not alive:
+        break
+print(json.dumps({"latencies": latencies,
+                  "cpu": time.process_time() - started}))
+state.close()
+"""
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--views", type=int, default=16)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.01,
+                        help="seconds between updates")
+    args = parser.parse_args()
+
+    name = "pyradaiz-bench-%d" % os.getpid()
+    path = os.path.join(tempfile.mkdtemp(), name + ".sock")
+    state = SharedState.create(name)
+    doorbell = Doorbell(path)
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    views = [subprocess.Popen([sys.executable, "-c",
+                               VIEW % {"name": name, "path": path}],
+                              cwd=cwd, stdout=subprocess.PIPE)
+             for _ in range(args.views)]
+    while len(doorbell.views) < args.views:
+        select.select([doorbell], [], [], 5)
+        doorbell.accept()
+
+    write_times = []
+    for i in range(args.updates):
+        snapshot = SessionState(i % 2 == 0, PHASE_WORK, i, 1500 - i,
+                                None, None, None, time.monotonic() + 1500)
+        started = time.perf_counter()
+        state.write(snapshot)
+        doorbell.ring()
+        write_times.append(time.perf_counter() - started)
+        time.sleep(args.interval)
+    doorbell.close()
+
+    latencies = []
+    cpu = []
+    for view in views:
+        result = json.loads(view.communicate()[0])
+        latencies += result["latencies"]
+        cpu.append(result["cpu"])
+    state.close()
+
+    print("views: %d  updates: %d  every %.0f ms" %
+          (args.views, args.updates, args.interval * 1000))
+    print("publish + ring: median %.1f us  max %.1f us" %
+          (statistics.median(write_times) * 1e6, max(write_times) * 1e6))
+    print("propagation: median %.1f us  p99 %.1f us  max %.1f us "
+          "(%d of %d updates seen)" %
+          (statistics.median(latencies) * 1e6,
+           percentile(latencies, 0.99) * 1e6, max(latencies) * 1e6,
+           len(latencies), args.views * args.updates))
+    print("view CPU per update: %.1f us" %
+          (statistics.mean(cpu) / args.updates * 1e6))
+
+
+if __name__ == "__main__":
+    main()
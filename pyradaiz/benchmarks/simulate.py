@@ -0,0 +1,78 @@
+"""
+Replays user actions on the timer over days or weeks of virtual time,
+checking the session's invariants, see model.simulation. Actions come from
+a script replayed every day, or from a random user.
+
+    python -m benchmarks.simulate --weeks 4 --seed 1
+    python -m benchmarks.simulate --script benchmarks/workday.txt --days 30
+"""
+import argparse
+import sys
+
+from model.clock import VirtualClock
+from model.simulation import DAY, Simulation, daily, parse_script, \
+    random_actions
+
+__author__ = 'Alen Suljkanovic'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--script", help="actions of one day")
+    parser.add_argument("--days", type=float,
+                        help="days to simulate, 1 with a script")
+    parser.add_argument("--weeks", type=float, help="weeks to simulate, 4 "
+                                                    "with a random user")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gap", type=float, default=30,
+                        help="minutes between a random user's actions")
+    parser.add_argument("--latency", type=float, default=5,
+                        help="milliseconds the thread may wake up late")
+    parser.add_argument("--durations", type=int, nargs=3,
+                        default=(25, 5, 15), metavar=("POMODORO", "SHORT",
+                                                      "LONG"))
+    args = parser.parse_args()
+
+    if args.weeks is not None:
+        seconds = args.weeks * 7 * DAY
+    elif args.days is not None:
+        seconds = args.days * DAY
+    else:
+        seconds = (1 if args.script else 28) * DAY
+    if args.script:
+        try:
+            with open(args.script) as f:
+                script = parse_script(f)
+        except (OSError, ValueError) as e:
+            parser.error("%s: %s" % (args.script, e))
+        actions = daily(script, int(-(-seconds // DAY)))
+        source = "script %s" % args.script
+    else:
+        actions = random_actions(seconds, args.seed, args.gap * 60)
+        source = "random user, seed %d" % args.seed
+
+    clock = VirtualClock(latency=args.latency / 1000.0, seed=args.seed)
+    simulation = Simulation(*args.durations, clock=clock)
+    simulation.schedule(actions)
+    simulation.run(seconds)
+    report = simulation.report()
+
+    print("%s: %.1f days, %d actions (%s)" % (
+        source, report["simulated_days"], report["actions"],
+        ", ".join("%s %d" % item
+                  for item in sorted(simulation.actions.items()))))
+    print("session: %.1f hours, %d pomodoros, %d wake ups" %
+          (report["session_hours"], report["pomodoros"], report["wakeups"]))
+    print("cpu: %.2f s, %.0f session hours per cpu second, %.0f wake ups "
+          "per cpu second" % (report["cpu_seconds"],
+                              report["session_hours_per_cpu_second"],
+                              report["wakeups_per_cpu_second"]))
+    for violation in simulation.violations:
+        print("  %s" % violation)
+    if report["violations"]:
+        print("FAILED: %d invariant violations" % report["violations"])
+    sys.exit(1 if report["violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Rolls up a generated team history with the NumPy statistics and with a plain
+Python loop over the rows, and times incremental updates of the rollups.
+The history is also written to a SQLite history database and loaded from
+there, as the window does, and the rollups of both must match.
+
+    python -m benchmarks.stats_rollups --members 25 --years 3
+"""
+import argparse
+import collections
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from model.core import PHASE_WORK, PHASE_SHORT_BREAK, PHASE_LONG_BREAK
+from model.history import HistoryStore, PHASE_END
+from model.stats import SessionLog, Rollups, WORK, SHORT_BREAK, \
+    LONG_BREAK, SECONDS_PER_DAY
+
+__author__ = 'Alen Suljkanovic'
+
+# 2020-01-01 00:00 UTC.
+EPOCH = 1577836800
+
+
+def team_log(members, years, seed=0):
+    """
+    Generates a SessionLog of working days with 4 to 12 pomodoros each, most
+    of them followed by a break.
+    """
+    rng = np.random.default_rng(seed)
+    days = int(years * 365)
+    per_day = rng.integers(4, 13, size=(members, days))
+    # Weekends off.
+    per_day[:, (np.arange(days) + 2) % 7 >= 5] = 0
+    pomodoros = int(per_day.sum())
+
+    day = np.repeat(np.tile(np.arange(days), members), per_day.ravel())
+    slot = np.concatenate([np.arange(n) for n in per_day.ravel() if n])
+    work_ts = EPOCH + day * SECONDS_PER_DAY + 8 * 3600 + slot * 1800 + 1500
+    taken = rng.random(pomodoros) < 0.8
+
+    ts = np.concatenate((work_ts, work_ts[taken] + 300))
+    phase = np.concatenate((np.full(pomodoros, WORK, np.int8),
+                            np.where(slot[taken] % 4 == 3, LONG_BREAK,
+                                     SHORT_BREAK).astype(np.int8)))
+    duration = np.where(phase == WORK, 1500, 300).astype(np.float32)
+    task = rng.integers(0, 200, size=len(ts)).astype(np.int32)
+    order = np.argsort(ts, kind="stable")
+    return SessionLog(ts[order], duration[order], phase[order], task[order],
+                      ["task %d" % i for i in range(200)])
+
+
+def write_history(log, path):
+    """
+    Writes the phases of a SessionLog to a history database, with a start
+    and a pause per phase as the timer records them.
+    :return:
+        HistoryStore
+    """
+    names = {WORK: PHASE_WORK, SHORT_BREAK: PHASE_SHORT_BREAK,
+             LONG_BREAK: PHASE_LONG_BREAK}
+    rows = []
+    for ts, duration, phase, task in zip(log.ts.tolist(),
+                                         log.duration.tolist(),
+                                         log.phase.tolist(),
+                                         log.task.tolist()):
+        name, task = names[phase], log.task_names[task]
+        rows.append((ts - duration, "phase_start", name, duration, task,
+                     None))
+        rows.append((ts - duration / 2, "pause", name, duration / 2, task,
+                     None))
+        rows.append((ts, PHASE_END, name, duration, task, None))
+    history = HistoryStore(path)
+    history.insert(rows[i:i + 10000] for i in range(0, len(rows), 10000))
+    return history
+
+
+def python_rollups(log):
+    """
+    Same daily and per-task sums computed row by row.
+    """
+    focus = collections.Counter()
+    pomodoros = collections.Counter()
+    breaks = collections.Counter()
+    tasks = collections.Counter()
+    for ts, duration, phase, task in zip(log.ts.tolist(),
+                                         log.duration.tolist(),
+                                         log.phase.tolist(),
+                                         log.task.tolist()):
+        day = int(ts // SECONDS_PER_DAY)
+        if phase == WORK:
+            focus[day] += duration
+            pomodoros[day] += 1
+            tasks[task] += duration
+        else:
+            breaks[day] += 1
+    return focus, pomodoros, breaks, tasks
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--members", type=int, default=25)
+    parser.add_argument("--years", type=float, default=3)
+    args = parser.parse_args()
+
+    log = team_log(args.members, args.years)
+    print("phases: %d" % len(log))
+    errors = []
+
+    rollups, elapsed = timed(Rollups.from_log, log, 0)
+    print("rollups (numpy):   %8.2f ms" % elapsed)
+
+    directory = tempfile.mkdtemp(prefix="pyradaiz-stats-")
+    try:
+        history = write_history(log, os.path.join(directory,
+                                                  "history.sqlite3"))
+        loaded, elapsed = timed(SessionLog.from_history, history)
+        print("load from history: %8.2f ms (%d of %d events)" %
+              (elapsed, len(loaded), 3 * len(log)))
+        stored, elapsed = timed(Rollups.from_history, history, 0)
+        print("rollups (history): %8.2f ms" % elapsed)
+        history.close()
+    finally:
+        shutil.rmtree(directory)
+    if stored.per_task() != rollups.per_task() or \
+            not np.array_equal(stored.pomodoros, rollups.pomodoros) or \
+            not np.allclose(stored.focus, rollups.focus):
+        errors.append("the rollups loaded from the history differ")
+    _, elapsed = timed(rollups.per_week)
+    print("per week:          %8.2f ms" % elapsed)
+    _, elapsed = timed(rollups.streaks)
+    print("streaks:           %8.2f ms" % elapsed)
+    _, elapsed = timed(rollups.break_adherence)
+    print("break adherence:   %8.2f ms" % elapsed)
+    _, elapsed = timed(python_rollups, log)
+    print("rollups (python):  %8.2f ms" % elapsed)
+
+    rng = random.Random(0)
+    now = float(log.ts[-1])
+    started = time.perf_counter()
+    for i in range(10000):
+        now += 900
+        rollups.add(now, 1500, WORK if i % 2 else SHORT_BREAK,
+                    "task %d" % rng.randrange(200))
+    print("10000 incremental updates: %.2f ms" %
+          ((time.perf_counter() - started) * 1000))
+
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
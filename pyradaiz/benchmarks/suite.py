@@ -0,0 +1,351 @@
+"""
+Benchmark suite for the timer and startup paths. Runs headless on the
+offscreen Qt platform, with the per-user directories pointed at a temporary
+directory, and compares the results with a baseline file.
+
+  time_str:         formatting one mm:ss string
+  tick_loop:        one PyradaizThread.run wake up, on a virtual clock; it
+                    takes TICK_LOOP_SAMPLES samples per run, since a few
+                    microseconds are easily lost to the machine's noise
+  settings:         PyradaizSettings save and load round trip
+  gui_first:        first PyradaizGui, including module imports
+  gui:              PyradaizGui construction up to the first paint
+  settings_dialog:  SettingsDialog open up to the first paint
+  settings_apply:   applying a dialog's changes to all settings, the
+                    always on top flag included
+  peak_rss:         peak resident memory of the suite
+
+Every metric is lower-is-better and is the median of --runs samples. A
+metric whose median is more than --threshold above the baseline, and more
+than the metric's noise floor, is reported as a regression and the exit
+status is 1. The floor keeps the jitter of a metric of a few milliseconds
+from failing the suite. It is an absolute change, a fraction of the
+baseline, or both; tick_loop and settings move by a quarter or more between
+two runs on a busy machine.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+__author__ = 'Alen Suljkanovic'
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "baseline.json")
+
+# Metric, unit and noise floor, the change a regression must also exceed:
+# in that unit and as a fraction of the baseline. In report order.
+METRICS = (("time_str", "us", 0.2, 0.0),
+           ("tick_loop", "us", 2.0, 0.5),
+           ("settings", "ms", 0.5, 0.5),
+           ("gui_first", "ms", 10.0, 0.0),
+           ("gui", "ms", 1.0, 0.0),
+           ("settings_dialog", "ms", 1.0, 0.0),
+           ("settings_apply", "ms", 0.3, 0.0),
+           ("peak_rss", "MB", 5.0, 0.0))
+
+# Simulated hours of one tick loop sample, and samples per run. Many short
+# samples give a much steadier median than a few long ones.
+TICK_LOOP_HOURS = 0.5
+TICK_LOOP_SAMPLES = 4
+
+
+def isolate():
+    """
+    Points the per-user directories and Qt at a temporary directory, so the
+    suite neither reads nor overwrites real settings and history.
+    """
+    root = tempfile.mkdtemp(prefix="pyradaiz-bench-")
+    for name in ("XDG_CONFIG_HOME", "XDG_DATA_HOME", "XDG_CACHE_HOME",
+                 "XDG_RUNTIME_DIR", "APPDATA", "LOCALAPPDATA"):
+        path = os.path.join(root, name.lower())
+        os.makedirs(path, mode=0o700)
+        os.environ[name] = path
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return root
+
+
+def process_until_painted(app, widget):
+    """
+    Shows widget and processes events until it's painted once.
+    """
+    from PyQt5 import QtCore
+
+    painted = []
+
+    class Watcher(QtCore.QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint:
+                painted.append(True)
+            return False
+
+    watcher = Watcher()
+    widget.installEventFilter(watcher)
+    widget.show()
+    deadline = time.perf_counter() + 5
+    while not painted and time.perf_counter() < deadline:
+        app.processEvents()
+    widget.removeEventFilter(watcher)
+
+
+def bench_time_str(runs):
+    from model.utils import time_str
+    number = 100000
+    times = timeit.repeat(lambda: time_str(7, 5), number=number,
+                          repeat=runs)
+    return statistics.median(times) / number * 1e6
+
+
+def bench_tick_loop(app, runs):
+    from PyQt5 import QtCore
+    from model.clock import VirtualClock
+    from model.instrumentation import Instrumentation
+    from model.pyradaiz import PyradaizThread
+
+    class Host(QtCore.QObject):
+        update_display = QtCore.pyqtSignal('QString', float)
+        take_a_break = QtCore.pyqtSignal(['QString'])
+        go_on = QtCore.pyqtSignal(['QString'])
+
+    class Settings(object):
+        pomodoro_duration = 25
+        short_break = 5
+        long_break = 15
+
+    samples = []
+    for _ in range(runs * TICK_LOOP_SAMPLES):
+        clock = VirtualClock()
+        host = Host()
+        host.settings = Settings()
+        host.stats = Instrumentation(enabled=True, clock=clock)
+        thread = PyradaizThread(host, host.update_display,
+                                host.take_a_break, host.go_on, clock=clock)
+        thread.start_session()
+        clock.call_at(TICK_LOOP_HOURS * 3600, thread.submit, None)
+        started = time.perf_counter()
+        # Runs on this thread, the loop never really sleeps.
+        thread.run()
+        elapsed = time.perf_counter() - started
+        samples.append(elapsed / clock.waits * 1e6)
+    return statistics.median(samples)
+
+
+def bench_settings(app, runs):
+    from model.settings import PyradaizSettings
+
+    settings = PyradaizSettings()
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        settings.pomodoro_duration = 20 + i % 10
+        settings.save()
+        settings.store.flush()
+        settings.load()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def create_gui(app):
+    from model.pyradaiz import PyradaizGui
+    gui = PyradaizGui()
+    process_until_painted(app, gui)
+    return gui
+
+
+def close_gui(gui):
+    """
+    Stops everything the window started, its threads included, the way
+    main.py does on quit.
+    """
+    gui.stop_timer()
+    if gui.watchdog is not None:
+        gui.watchdog.close()
+    gui.config_watcher.close()
+    gui.history.close()
+    gui.notifier.close()
+    gui.stop_control()
+    gui.close_shared()
+    gui.tray_icon.hide()
+    gui.close()
+    gui.deleteLater()
+
+
+def first_gui_ms():
+    """
+    Creates the first window of a fresh interpreter.
+    :return:
+        milliseconds, module imports included.
+    """
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication(sys.argv[:1])
+    started = time.perf_counter()
+    gui = create_gui(app)
+    elapsed = (time.perf_counter() - started) * 1000
+    close_gui(gui)
+    return elapsed
+
+
+def bench_gui_first(runs):
+    # Modules are imported once per interpreter, so every sample gets its
+    # own.
+    code = "from benchmarks.suite import first_gui_ms; print(first_gui_ms())"
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return statistics.median(float(subprocess.check_output(
+        [sys.executable, "-c", code], cwd=cwd,
+        stderr=subprocess.DEVNULL).split()[-1]) for _ in range(runs))
+
+
+def bench_gui(app, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        gui = create_gui(app)
+        samples.append((time.perf_counter() - started) * 1000)
+        close_gui(gui)
+        app.processEvents()
+    return statistics.median(samples)
+
+
+def bench_settings_dialog(app, runs):
+    from dialogs import SettingsDialog
+
+    gui = create_gui(app)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        dialog = SettingsDialog(gui)
+        process_until_painted(app, dialog)
+        samples.append((time.perf_counter() - started) * 1000)
+        dialog.close()
+        dialog.deleteLater()
+        app.processEvents()
+    close_gui(gui)
+    return statistics.median(samples)
+
+
+def bench_settings_apply(app, runs):
+    from model.consts import ALWAYS_ON_TOP_NO, ALWAYS_ON_TOP_YES
+
+    gui = create_gui(app)
+    samples = []
+    for i in range(runs):
+        values = {"pomodoro_duration": 20 + i % 2,
+                  "short_break": 3 + i % 2,
+                  "long_break": 10 + i % 2,
+                  "always_on_top": ALWAYS_ON_TOP_NO if i % 2
+                  else ALWAYS_ON_TOP_YES}
+        started = time.perf_counter()
+        gui.settings.update(values)
+        samples.append((time.perf_counter() - started) * 1000)
+        app.processEvents()
+    gui.settings.store.flush()
+    close_gui(gui)
+    return statistics.median(samples)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2.0 ** 20 if sys.platform == "darwin" else rss / 1024.0
+
+
+def run(runs):
+    """
+    Runs the suite.
+    :return:
+        dictionary of metric to value. Qt metrics are missing when PyQt5
+        isn't installed.
+    """
+    results = {"time_str": bench_time_str(runs)}
+    try:
+        from PyQt5 import QtWidgets
+    except ImportError:
+        print("PyQt5 not available, skipping the Qt benchmarks")
+    else:
+        app = QtWidgets.QApplication(sys.argv[:1])
+        results["tick_loop"] = bench_tick_loop(app, runs)
+        results["settings"] = bench_settings(app, runs)
+        results["gui_first"] = bench_gui_first(runs)
+        results["gui"] = bench_gui(app, runs)
+        results["settings_dialog"] = bench_settings_dialog(app, runs)
+        results["settings_apply"] = bench_settings_apply(app, runs)
+    results["peak_rss"] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints results next to the baseline.
+    :return:
+        list of regressed metrics.
+    """
+    regressions = []
+    for name, unit, floor, relative in METRICS:
+        if name not in results:
+            print("%-16s %12s" % (name, "skipped"))
+            continue
+        value = results[name]
+        line = "%-16s %10.2f %-2s" % (name, value, unit)
+        if name in baseline:
+            change = value / baseline[name] - 1 if baseline[name] else 0.0
+            line += "  baseline %10.2f  %+6.1f%%" % (baseline[name],
+                                                     change * 100)
+            if change > threshold and value - baseline[name] > \
+                    max(floor, relative * baseline[name]):
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=10,
+                        help="repetitions per benchmark, the median is used")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown over the baseline, "
+                             "0.25 is 25%%")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline")
+    parser.add_argument("--json", help="also write the results to a file")
+    args = parser.parse_args()
+
+    isolate()
+    results = run(args.runs)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+
+    document = {"python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+        print("baseline saved to %s" % args.baseline)
+    elif regressions:
+        print("regressions over %d%% and the noise floor: %s" %
+              (args.threshold * 100, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
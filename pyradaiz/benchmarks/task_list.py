@@ -0,0 +1,141 @@
+"""
+Compares memory use and scroll latency of the task list implementations with
+a large generated backlog. Each variant runs in its own interpreter, so the
+peak RSS numbers don't mix.
+
+  objects: list of per-instance __dict__ tasks, as before
+  store:   TaskStore columns
+  widget:  QTableWidget with one item per cell, as before (needs PyQt5)
+  model:   QTableView over TaskTableModel (needs PyQt5)
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.task_list --tasks 100000
+"""
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+VARIANTS = ("objects", "store", "widget", "model")
+
+
+class DictTask(object):
+    """
+    Task as it was before, with a per-instance __dict__.
+    """
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.counter = 0
+        self.finished = False
+
+
+def rows(count):
+    for i in range(count):
+        yield "Task %d" % i, "Description of task number %d" % i, i % 7, \
+            i % 5 == 0
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def scroll(view, app, steps):
+    """
+    Scrolls the view to the end in equal steps, painting every frame.
+    :return:
+        list of frame times in milliseconds.
+    """
+    bar = view.verticalScrollBar()
+    frames = []
+    for step in range(1, steps + 1):
+        started = time.perf_counter()
+        if step == steps:
+            view.scrollToBottom()
+        else:
+            bar.setValue(bar.maximum() * step // steps)
+        view.viewport().repaint()
+        app.processEvents()
+        frames.append((time.perf_counter() - started) * 1000)
+    return frames
+
+
+def run_variant(variant, count, steps):
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    frames = None
+
+    if variant == "objects":
+        tasks = [DictTask(name, description)
+                 for name, description, _, _ in rows(count)]
+    elif variant == "store":
+        from model.tasks import TaskStore
+        tasks = TaskStore()
+        tasks.extend(rows(count))
+    else:
+        from PyQt5 import QtWidgets
+        app = QtWidgets.QApplication(sys.argv)
+        if variant == "widget":
+            view = QtWidgets.QTableWidget(count, 3)
+            for row, (name, description, counter, _) in \
+                    enumerate(rows(count)):
+                view.setItem(row, 0, QtWidgets.QTableWidgetItem(name))
+                view.setItem(row, 1, QtWidgets.QTableWidgetItem(description))
+                view.setItem(row, 2, QtWidgets.QTableWidgetItem(str(counter)))
+        else:
+            from model.task_model import TaskTableModel
+            from model.tasks import TaskStore
+            store = TaskStore()
+            store.extend(rows(count))
+            view = QtWidgets.QTableView()
+            view.setModel(TaskTableModel(store, view))
+            view.verticalHeader().setSectionResizeMode(
+                QtWidgets.QHeaderView.Fixed)
+        view.resize(400, 600)
+        view.show()
+        app.processEvents()
+        frames = scroll(view, app, steps)
+
+    built = time.perf_counter() - started
+    print("%-8s build: %8.1f ms  RSS growth: %7.1f MB" %
+          (variant, built * 1000, peak_rss_mb() - baseline), end="")
+    if frames:
+        frames.sort()
+        print("  scroll frame p50: %6.2f ms  max: %6.2f ms" %
+              (statistics.median(frames), frames[-1]), end="")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=100,
+                        help="scroll steps to the end of the list")
+    parser.add_argument("--variant", choices=VARIANTS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.tasks, args.steps)
+        return
+
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    for variant in VARIANTS:
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.task_list", "--variant",
+             variant, "--tasks", str(args.tasks), "--steps", str(args.steps)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True)
+        if result.returncode:
+            print("%-8s skipped (PyQt5 not available?)" % variant)
+        else:
+            print(result.stdout, end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Builds the task search index from a generated corpus and reports build time,
+memory and per-keystroke query latency, next to a linear scan. A keystroke
+costs the query plus the first page of rows handed to the tasks view; the
+time to collect every match is reported separately.
+
+    python -m benchmarks.task_search --tasks 100000
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+from model.search import TaskIndex
+from model.tasks import TaskStore
+
+__author__ = 'Alen Suljkanovic'
+
+SYLLABLES = ("ba", "ce", "di", "fo", "gu", "ka", "le", "mi", "no", "pu",
+             "ra", "se", "ti", "vo", "za", "re", "fa", "to", "ri", "ne")
+
+# Rows the tasks view asks for at once, see model.task_model.FETCH_BATCH.
+PAGE = 256
+
+QUERIES = ("refactor settings", "fix timer", "ka", "2024", "zz")
+
+
+def corpus(count, seed=0):
+    """
+    Yields (name, description, counter, finished) rows made of words from a
+    vocabulary of a few thousand made-up words plus some real ones.
+    """
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+             for _ in range(5000)]
+    words += ["refactor", "fix", "timer", "settings", "release", "review"]
+    for i in range(count):
+        name = " ".join(rng.choice(words) for _ in range(rng.randint(2, 5)))
+        description = " ".join(rng.choice(words)
+                                for _ in range(rng.randint(0, 12)))
+        yield name, "%s %d" % (description, 2000 + i % 30), 0, False
+
+
+def linear_scan(store, text):
+    words = text.lower().split()
+    return {row for row in range(len(store))
+            if all(word in ("%s %s" % (store.names[row],
+                                       store.descriptions[row])).lower()
+                   for word in words)}
+
+
+def keystrokes(query):
+    return [query[:i] for i in range(1, len(query) + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tasks", type=int, default=100000)
+    args = parser.parse_args()
+
+    store = TaskStore()
+    store.extend(corpus(args.tasks))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = TaskIndex(store)
+    built = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("tasks: %d  build: %.2f s  index memory: %.1f MB  tokens: %d" %
+          (args.tasks, built, memory / 2 ** 20, len(index.vocabulary)))
+
+    for query in QUERIES:
+        times = []
+        for text in keystrokes(query):
+            started = time.perf_counter()
+            list(itertools.islice(index.query(text), PAGE))
+            times.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        matches = len(list(index.query(query)))
+        everything = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        linear_scan(store, query)
+        scan = (time.perf_counter() - started) * 1000
+        print("%-20r keystroke median: %6.2f ms  max: %6.2f ms  "
+              "all %6d matches: %7.2f ms  linear scan: %7.2f ms" %
+              (query, statistics.median(times), max(times), matches,
+               everything, scan))
+
+    started = time.perf_counter()
+    for i in range(1000):
+        store.add("new task %d" % i, "added while the index is live")
+    print("1000 incremental inserts: %.2f ms" %
+          ((time.perf_counter() - started) * 1000))
+
+
+if __name__ == "__main__":
+    main()
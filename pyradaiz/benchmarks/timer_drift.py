@@ -0,0 +1,118 @@
+"""
+Measures cumulative drift of the timer loop over many simulated hours.
+
+The legacy loop (decrement a counter, then sleep one second) is compared with
+the deadline based loop used by PyradaizThread. Both run against a simulated
+clock where every tick costs some work time and every sleep overshoots a
+little, the way it does on a loaded machine.
+
+    python -m benchmarks.timer_drift --hours 24
+"""
+import argparse
+import random
+
+from model.timer import DeadlineTimer
+
+__author__ = 'Alen Suljkanovic'
+
+
+class SimulatedClock(object):
+    """
+    Clock that only moves when the loop works or sleeps.
+    """
+    def __init__(self, work, oversleep, seed):
+        self.now = 0.0
+        self.work = work
+        self.oversleep = oversleep
+        self.random = random.Random(seed)
+
+    def __call__(self):
+        return self.now
+
+    def do_work(self):
+        self.now += self.random.uniform(0, 2 * self.work)
+
+    def sleep(self, seconds):
+        self.now += seconds + self.random.uniform(0, 2 * self.oversleep)
+
+
+def phases(pomodoro, short_break, long_break):
+    """
+    Yields phase durations in seconds, in the same order as the timer thread.
+    """
+    cnt = 0
+    while True:
+        yield pomodoro * 60
+        cnt += 1
+        yield (short_break if cnt % 3 != 0 else long_break) * 60
+
+
+def legacy_loop(clock, durations, total):
+    """
+    Replays the old decrement + sleep(1) loop. Returns the ideal and actual
+    time of every phase switch.
+    """
+    ideal = 0.0
+    switches = []
+    for duration in durations:
+        ideal += duration
+        remaining = duration
+        while remaining > 0:
+            clock.do_work()
+            remaining -= 1
+            if remaining:
+                clock.sleep(1)
+        switches.append((ideal, clock()))
+        clock.sleep(1)
+        if ideal >= total:
+            return switches
+
+
+def deadline_loop(clock, durations, total):
+    """
+    Replays the deadline based loop. Returns the ideal and actual time of
+    every phase switch.
+    """
+    timer = DeadlineTimer(clock=clock)
+    ideal = 0.0
+    switches = []
+    durations = iter(durations)
+    duration = next(durations)
+    timer.start(duration)
+    while True:
+        clock.do_work()
+        if timer.remaining_seconds() == 0:
+            ideal += duration
+            switches.append((ideal, clock()))
+            if ideal >= total:
+                return switches
+            duration = next(durations)
+            timer.chain(duration)
+        clock.sleep(timer.next_tick())
+
+
+def report(name, switches):
+    lateness = [actual - ideal for ideal, actual in switches]
+    print("%-10s phases: %5d  final drift: %9.3f s  max phase lateness: "
+          "%7.3f s" % (name, len(switches), lateness[-1], max(lateness)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--hours", type=float, default=24,
+                        help="simulated hours")
+    parser.add_argument("--work", type=float, default=0.002,
+                        help="mean work time per tick in seconds")
+    parser.add_argument("--oversleep", type=float, default=0.0005,
+                        help="mean sleep overshoot in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = args.hours * 3600
+    for name, loop in (("legacy", legacy_loop), ("deadline", deadline_loop)):
+        clock = SimulatedClock(args.work, args.oversleep, args.seed)
+        report(name, loop(clock, phases(25, 5, 15), total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures the tray only mode: the resident memory of a window with the
+tasks panel open, after tearing the window down to the tray icon, and the
+time it takes to rebuild it. The window is torn down and rebuilt a number
+of times while the timer runs, and the memory after the last cycle is
+compared with the first, to catch widgets that outlive the teardown.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.tray_only --cycles 20
+"""
+import argparse
+import sys
+
+from benchmarks.suite import close_gui, isolate, process_until_painted
+
+__author__ = 'Alen Suljkanovic'
+
+# Megabytes the process may grow by over all cycles.
+MAX_GROWTH = 3.0
+
+
+def settle(app):
+    for _ in range(3):
+        app.processEvents()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=5000)
+    args = parser.parse_args()
+
+    isolate()
+    from PyQt5 import QtWidgets
+    from model.pyradaiz import PyradaizGui
+    from model.utils import rss_mb
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    view = PyradaizGui()
+    view.task_store.extend(("task %d" % i, "description %d" % i, 0, False)
+                           for i in range(args.tasks))
+    view.resize(1200, 900)
+    view.show()
+    view.toggle_tasks()
+    process_until_painted(app, view)
+    view.timer_thread.start_session()
+    settle(app)
+
+    window = rss_mb()
+    after, rebuild = [], []
+    for _ in range(args.cycles):
+        view.enter_tray_only()
+        settle(app)
+        after.append(view.tray_report["rss_after_mb"])
+        view.leave_tray_only()
+        process_until_painted(app, view)
+        rebuild.append(view.tray_report["rebuild_ms"])
+    view.enter_tray_only()
+    settle(app)
+    tray = view.tray_report["rss_after_mb"]
+    teardown = view.tray_report["teardown_ms"]
+    running = view.timer_thread.state.running
+    close_gui(view)
+
+    rebuild.sort()
+    print("window with %d tasks: %6.1f MB" % (args.tasks, window))
+    print("tray only:              %6.1f MB (%.1f MB freed, teardown %.1f ms)" %
+          (tray, window - tray, teardown))
+    print("rebuild:                median %.2f ms  max %.2f ms (%d cycles)" %
+          (rebuild[len(rebuild) // 2], rebuild[-1], len(rebuild)))
+    print("tray only after the first and last cycle: %.1f / %.1f MB" %
+          (after[0], after[-1]))
+
+    errors = []
+    if not running:
+        errors.append("the timer stopped")
+    if after[-1] - after[0] > MAX_GROWTH:
+        errors.append("memory grew by %.1f MB over %d cycles" %
+                      (after[-1] - after[0], args.cycles))
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Stress test of the timer thread's command queue: toggles start and stop
+thousands of times per second, and checks that no commands are lost,
+that no threads are created, and that the last state handed to the GUI
+thread matches the session. Command latency is the time from queueing a
+command to the thread running it. Flat out (--rate 0) it mostly measures
+how long the queueing thread holds on to the GIL.
+
+With --restart, a thread started and terminated per toggle, the way the
+actions used to do it, is timed for comparison.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.worker_stress --toggles 20000
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+from PyQt5 import QtCore
+
+from model.core import EVENT_START, EVENT_PAUSE
+from model.instrumentation import Instrumentation
+from model.pyradaiz import PyradaizThread
+
+__author__ = 'Alen Suljkanovic'
+
+
+class Host(QtCore.QObject):
+    update_display = QtCore.pyqtSignal('QString', float)
+    take_a_break = QtCore.pyqtSignal(['QString'])
+    go_on = QtCore.pyqtSignal(['QString'])
+
+    class Settings(object):
+        pomodoro_duration = 25
+        short_break = 5
+        long_break = 15
+
+    def __init__(self):
+        super(Host, self).__init__()
+        self.settings = self.Settings()
+        self.stats = Instrumentation()
+        self.states = []
+
+    def on_state(self, state):
+        self.states.append(state)
+
+
+class SleepyThread(QtCore.QThread):
+    """
+    Thread that sleeps in a loop until terminated, like the old timer thread.
+    """
+    def run(self):
+        while True:
+            time.sleep(1)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def stress(app, toggles, rate):
+    host = Host()
+    thread = PyradaizThread(host, host.update_display, host.take_a_break,
+                            host.go_on)
+    thread.state_changed.connect(host.on_state)
+    events = {EVENT_START: 0, EVENT_PAUSE: 0}
+
+    def count(session, event, value):
+        if event in events:
+            events[event] += 1
+    thread.session.subscribe(count)
+
+    latencies = []
+    perf_counter = time.perf_counter
+
+    def toggle(queued, start):
+        latencies.append(perf_counter() - queued)
+        if start:
+            thread.session.start()
+        else:
+            thread.session.pause()
+
+    thread.start()
+    threads = threading.active_count()
+    interval = 1.0 / rate if rate else 0.0
+    started = perf_counter()
+    for i in range(toggles):
+        if interval:
+            # Sleeping, like the GUI thread idling in its event loop, lets
+            # the timer thread take the GIL.
+            delay = started + i * interval - perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        thread.submit(toggle, perf_counter(), i % 2 == 0)
+        if i % 1000 == 0:
+            app.processEvents()
+    # The public commands, once each.
+    thread.start_session()
+    thread.pause_session()
+    thread.stop()
+    elapsed = perf_counter() - started
+    app.processEvents()
+
+    errors = []
+    if len(latencies) != toggles:
+        errors.append("%d of %d commands ran" % (len(latencies), toggles))
+    expected = toggles // 2 + 1
+    for event, value in sorted(events.items()):
+        if value != expected:
+            errors.append("%d %s events, expected %d" %
+                          (value, event, expected))
+    if threading.active_count() > threads:
+        errors.append("threads were created")
+    if not host.states or host.states[-1] != thread.state:
+        errors.append("last state handed over doesn't match the session")
+    if thread.state.running:
+        errors.append("session still running after the last pause")
+
+    print("toggles: %d in %.1f ms (%.0f/s)" %
+          (toggles, elapsed * 1000, toggles / elapsed))
+    print("command latency median: %.1f us  p99: %.1f us  max: %.1f us" %
+          (statistics.median(latencies) * 1e6,
+           percentile(latencies, 0.99) * 1e6, max(latencies) * 1e6))
+    print("state updates handed over: %d" % len(host.states))
+    return errors
+
+
+def restart(toggles):
+    """
+    Times start and terminate of a thread per toggle.
+    """
+    samples = []
+    for _ in range(toggles):
+        started = time.perf_counter()
+        thread = SleepyThread()
+        thread.start()
+        thread.terminate()
+        thread.wait()
+        samples.append(time.perf_counter() - started)
+    print("restart per toggle median: %.1f us  max: %.1f us" %
+          (statistics.median(samples) * 1e6, max(samples) * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--toggles", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=5000,
+                        help="toggles per second, 0 for as fast as "
+                             "possible")
+    parser.add_argument("--restart", type=int, default=0, metavar="TOGGLES",
+                        help="also time a thread restart per toggle")
+    args = parser.parse_args()
+
+    app = QtCore.QCoreApplication(sys.argv[:1])
+    errors = stress(app, args.toggles, args.rate)
+    if args.restart:
+        restart(args.restart)
+    for error in errors:
+        print("FAILED: %s" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
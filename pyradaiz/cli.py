@@ -0,0 +1,344 @@
+"""
+pyradaiz-cli, the pomodoro timer in a terminal: for SSH sessions and
+machines without a display. It runs the same cycle as the window, with the
+durations and profiles of config.xml, and records the same history.
+
+Nothing here imports Qt. Only the timer, the settings and the clock are
+loaded before the first frame; the history database is opened after it.
+
+    python cli.py [--start] [--profile NAME] [--no-history] [--once]
+    python cli.py profiles
+    python cli.py import FILE
+    python cli.py export FILE
+
+  --start         start the first pomodoro right away
+  --profile NAME  use the durations of a profile, for this run only
+  --no-history    don't record the session
+  --once          show the timer and exit
+
+  profiles        list the profiles, the one in use marked with *
+  import FILE     add the events of a CSV or JSON Lines file to the history
+  export FILE     write the history to a CSV or JSON Lines file
+
+Keys: s or space starts and pauses, r resets, 1-9 switch to a profile and
+q quits. When the output isn't a terminal, a line is printed per change
+rather than a countdown, and the timer only wakes up on phase changes.
+"""
+import os
+import sys
+import threading
+
+from model.consts import GO_ON, TAKE_A_BREAK
+from model.core import PomodoroSession, SessionRunner, EVENT_TICK, \
+    EVENT_TAKE_A_BREAK, EVENT_GO_ON, PHASE_WORK, PHASE_SHORT_BREAK, \
+    PHASE_LONG_BREAK, POMODOROS_PER_CYCLE
+from model.settings import PyradaizSettings
+from model.settings_store import PROFILE_FIELDS
+
+__author__ = 'Alen Suljkanovic'
+
+PROG = "pyradaiz-cli"
+
+PHASE_NAMES = {PHASE_WORK: "Pomodoro", PHASE_SHORT_BREAK: "Short break",
+               PHASE_LONG_BREAK: "Long break"}
+
+# Lines of an import report printed, the summary and the first errors.
+REPORT_LINES = 11
+
+# Moves to the start of the line and clears it.
+CLEAR_LINE = "\r\x1b[K"
+
+
+class TerminalView(object):
+    """
+    Shows the timer on one line, redrawn every second, or as a line per
+    change when the output isn't a terminal. Only the timer thread draws.
+    """
+    def __init__(self, settings, out=None, live=None):
+        """
+        :param out: text stream, stdout by default.
+        :param live: redraw a countdown, by default if out is a terminal.
+        """
+        super(TerminalView, self).__init__()
+        self.settings = settings
+        self.out = out or sys.stdout
+        self.live = self.out.isatty() if live is None else live
+        self.state = None
+        self.last = None
+
+    def frame(self, state, time=None):
+        """
+        Returns the timer line of a SessionState.
+        :param time: mm:ss to show instead of the state's.
+        """
+        text = PHASE_NAMES[state.phase]
+        if state.phase == PHASE_WORK:
+            text += " %d/%d" % (state.pomodoro_cnt % POMODOROS_PER_CYCLE + 1,
+                                POMODOROS_PER_CYCLE)
+        text = "%-14s %s  %s" % (text, time or state.time,
+                                 "running" if state.running else "paused")
+        profile = self.settings.current_profile()
+        if profile is not None:
+            text += "  [%s]" % profile.name
+        return text
+
+    def show(self, state, time=None):
+        self.state = state
+        text = self.frame(state, time)
+        if self.live or text != self.last:
+            self.write(text)
+        self.last = text
+
+    def write(self, text, final=False):
+        if self.live and not final:
+            self.out.write(CLEAR_LINE + text)
+        elif self.live:
+            self.out.write(CLEAR_LINE + text + "\n")
+        else:
+            self.out.write(text + "\n")
+        self.out.flush()
+
+    def message(self, text):
+        """
+        Prints a message on a line of its own, with a bell on a terminal.
+        """
+        self.write(text + ("\a" if self.live else ""), final=True)
+
+    def on_session_event(self, session, event, value):
+        if event == EVENT_TICK:
+            if self.live and self.state is not None:
+                self.show(self.state, value)
+        elif event == EVENT_TAKE_A_BREAK:
+            self.message(TAKE_A_BREAK % value)
+        elif event == EVENT_GO_ON:
+            self.message(GO_ON)
+
+
+class TerminalTimer(object):
+    """
+    Runs a session on the calling thread, with the keys read by another.
+    """
+    def __init__(self, settings, view, history=True):
+        """
+        :param history: record the session in the history database.
+        """
+        super(TerminalTimer, self).__init__()
+        self.settings = settings
+        self.view = view
+        self.history = None
+        self.record = history
+        self.session = PomodoroSession(settings.pomodoro_duration,
+                                       settings.short_break,
+                                       settings.long_break)
+        # Without a countdown to draw, the thread sleeps until the next
+        # phase change.
+        self.session.ticks = view.live
+        self.session.subscribe(view.on_session_event)
+        self.runner = SessionRunner(self.session, on_state=self.on_state)
+        settings.subscribe(self.on_settings_changed)
+
+    def on_state(self, state):
+        # A file pushed meanwhile applies from here on; the check is a stat.
+        self.settings.reload()
+        self.view.show(self.session.snapshot())
+
+    def on_settings_changed(self, settings, changes):
+        # Called on the timer thread, or before it runs.
+        if not any(name in changes for name in PROFILE_FIELDS):
+            return
+        self.session.configure(settings.pomodoro_duration,
+                               settings.short_break, settings.long_break)
+
+    def toggle(self):
+        if self.session.running:
+            self.session.pause()
+        else:
+            self.session.start()
+
+    def switch_profile(self, number):
+        profiles = self.settings.profiles
+        if number < len(profiles):
+            self.settings.apply_profile(profiles[number].name)
+
+    def on_key(self, key):
+        """
+        Runs the command of a key on the timer thread.
+        :return:
+            False for the quit key.
+        """
+        if key in ("s", " "):
+            self.runner.submit(self.toggle)
+        elif key == "r":
+            self.runner.submit(self.session.reset)
+        elif key in "123456789":
+            self.runner.submit(self.switch_profile, int(key) - 1)
+        elif key == "q":
+            self.runner.submit(None)
+            return False
+        return True
+
+    def read_keys(self, fd, raw):
+        """
+        Reads keys until quit or the end of the input. In raw mode every
+        key counts, otherwise the first letter of each line.
+        """
+        while True:
+            try:
+                data = os.read(fd, 64)
+            except OSError:
+                return
+            if not data:
+                return
+            text = data.decode("utf-8", "replace")
+            keys = text if raw else [line.strip()[:1] for line in
+                                     text.splitlines() if line.strip()]
+            for key in keys:
+                if not self.on_key(key.lower()):
+                    return
+
+    def run(self, start=False):
+        """
+        Runs until q is pressed or the process is interrupted.
+        """
+        self.view.show(self.session.snapshot())
+        if self.record:
+            # Opened after the first frame, it's not needed to show it.
+            from model.history import HistoryStore
+            self.history = HistoryStore()
+            self.session.subscribe(self.history.on_session_event)
+        if start:
+            self.runner.submit(self.session.start)
+
+        fd = sys.stdin.fileno() if sys.stdin is not None else None
+        saved = None
+        if fd is not None and os.isatty(fd):
+            import termios
+            import tty
+            saved = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+        if fd is not None:
+            threading.Thread(target=self.read_keys, args=(fd, bool(saved)),
+                             name="keys", daemon=True).start()
+        try:
+            self.runner.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if saved is not None:
+                termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+            if self.view.live:
+                self.view.write(self.view.frame(self.session.snapshot()),
+                                final=True)
+            self.close()
+
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+        self.settings.store.flush()
+
+
+def fail(message):
+    sys.stderr.write("%s: %s\n" % (PROG, message))
+    return 1
+
+
+def list_profiles(settings):
+    current = settings.current_profile()
+    for number, profile in enumerate(settings.profiles, 1):
+        print("%s %d %-16s %3d %3d %3d" % (
+            "*" if profile is current else " ", number, profile.name,
+            *profile.durations))
+    return 0
+
+
+def import_file(path):
+    from model import bulk
+    from model.history import HistoryStore
+
+    kind = bulk.detect_kind(path)
+    if kind == bulk.KIND_TASKS:
+        return fail("%s holds tasks, import them in the window's task list"
+                    % path)
+    if kind != bulk.KIND_HISTORY:
+        return fail("%s holds neither tasks nor history" % path)
+    history = HistoryStore()
+    try:
+        report = bulk.import_history(path, history)
+    finally:
+        history.close()
+    for number, line in enumerate(report.lines()):
+        if number == REPORT_LINES:
+            break
+        print(line)
+    return 0
+
+
+def export_file(path):
+    from model import bulk
+    from model.history import HistoryStore
+
+    history = HistoryStore()
+    try:
+        count = bulk.export_history(path, history)
+    finally:
+        history.close()
+    print("Exported %d events to %s" % (count, path))
+    return 0
+
+
+def main(argv):
+    if "-h" in argv or "--help" in argv:
+        print(__doc__.strip())
+        return 0
+    options = {"--start": False, "--no-history": False, "--once": False}
+    profile = None
+    args = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in options:
+            options[arg] = True
+        elif arg == "--profile" and i + 1 < len(argv):
+            i += 1
+            profile = argv[i]
+        elif arg.startswith("-"):
+            return fail("unknown option %s, see --help" % arg)
+        else:
+            args.append(arg)
+        i += 1
+
+    if args[:1] in (["import"], ["export"]):
+        if len(args) != 2:
+            return fail("%s takes a file" % args[0])
+        try:
+            if args[0] == "import":
+                return import_file(args[1])
+            return export_file(args[1])
+        except (OSError, ValueError) as e:
+            return fail(e)
+
+    settings = PyradaizSettings()
+    settings.load()
+    if profile is not None:
+        try:
+            settings.apply_profile(profile, save=False)
+        except ValueError as e:
+            return fail(e)
+    if args == ["profiles"]:
+        return list_profiles(settings)
+    if args:
+        return fail("unknown command %s, see --help" % args[0])
+
+    view = TerminalView(settings)
+    if options["--once"]:
+        session = PomodoroSession(settings.pomodoro_duration,
+                                  settings.short_break, settings.long_break)
+        view.write(view.frame(session.snapshot()), final=True)
+        return 0
+    timer = TerminalTimer(settings, view, history=not options["--no-history"])
+    timer.run(start=options["--start"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -124,42 +124,37 @@ class SettingsDialog(QtWidgets.QDialog):
             if value:
                 try:
                     int_value = int(value)
-                    return True, int_value
                 except ValueError as ex:
                     err_msg = "%s must be an integer number!" % \
                               field_label
                     QtWidgets.QMessageBox().critical(self, "Error", err_msg,
                                                  QtWidgets.QMessageBox.Ok)
                     return False, value
+                if int_value <= 0:
+                    err_msg = "%s must be greater than zero!" % field_label
+                    QtWidgets.QMessageBox().critical(self, "Error", err_msg,
+                                                     QtWidgets.QMessageBox.Ok)
+                    return False, value
+                return True, int_value
             else:
                 err_msg = "%s must be set"
                 QtWidgets.QMessageBox().critical(self, "Error", err_msg,
                                                  QtWidgets.QMessageBox.Ok)
                 return False, value
 
-        settings = self.parent.settings
-        valid, value = validate(self.pomodoro_edit, "Pomodoro duration")
-        if valid:
-            settings.pomodoro_duration = value
-
-        valid, value = validate(self.short_break_edit, "Short break")
-        if valid:
-            settings.short_break = value
-
-        valid, value = validate(self.long_break_edit, "Long break")
-        if valid:
-            settings.parent.long_break = value
-
-        if self.always_on_top_cb.isChecked():
-            settings.always_on_top = ALWAYS_ON_TOP_YES
-        else:
-            settings.always_on_top = ALWAYS_ON_TOP_NO
-
-        # Save changes...
-        settings.save()
-
-        # Update timer
-        from model.pyradaiz import time_str
-        time = time_str(self.parent.minutes, 0)
-        self.parent.update(time)
+        fields = (("pomodoro_duration", self.pomodoro_edit,
+                   "Pomodoro duration"),
+                  ("short_break", self.short_break_edit, "Short break"),
+                  ("long_break", self.long_break_edit, "Long break"))
+        # Applied at once: the window and the timer are updated and the
+        # settings saved for the fields that changed.
+        with self.parent.settings.transaction() as values:
+            for name, field, label in fields:
+                valid, value = validate(field, label)
+                if valid:
+                    values[name] = value
+            if self.always_on_top_cb.isChecked():
+                values["always_on_top"] = ALWAYS_ON_TOP_YES
+            else:
+                values["always_on_top"] = ALWAYS_ON_TOP_NO
         self.close()
\ No newline at end of file
@@ -1,14 +1,53 @@
 import sys
-from PyQt5 import QtWidgets
-from model.pyradaiz import PyradaizGui
+from model.profiling import StartupProfiler
 
 __author__ = 'Alen Suljkanovic'
 
 if __name__ == "__main__":
+    profile = "--profile-startup" in sys.argv
+    if profile:
+        sys.argv.remove("--profile-startup")
+    # Starts with only the tray icon, the window is built when asked for.
+    tray_only = "--tray-only" in sys.argv
+    if tray_only:
+        sys.argv.remove("--tray-only")
+    profiler = StartupProfiler(profile)
+
+    # Imported here, so the profile includes the import time.
+    from PyQt5 import QtWidgets
+    profiler.mark("import PyQt5")
+    from model.pyradaiz import PyradaizGui
+    profiler.mark("import pyradaiz")
+
+    # Icons are rasterised for HiDPI screens too, see model/icons.py.
+    from PyQt5 import QtCore
+    QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps)
     app = QtWidgets.QApplication(sys.argv)
+    profiler.mark("QApplication")
+
+    # The first instance owns the timer, the others show it.
+    from model.shared import Instance
+    instance = Instance.claim()
+    profiler.mark("shared state")
 
-    view = PyradaizGui()
-    view.show()
+    view = PyradaizGui(profiler=profiler, instance=instance)
+    if tray_only:
+        view.enter_tray_only()
+    else:
+        view.show()
+    profiler.mark("show")
+    app.aboutToQuit.connect(view.stop_timer)
+    app.aboutToQuit.connect(view.save_session)
+    app.aboutToQuit.connect(view.notifier.close)
+    app.aboutToQuit.connect(view.stop_control)
+    app.aboutToQuit.connect(view.stats.save)
+    if view.watchdog is not None:
+        app.aboutToQuit.connect(view.watchdog.close)
+    app.aboutToQuit.connect(view.config_watcher.close)
+    app.aboutToQuit.connect(view.settings.store.flush)
+    app.aboutToQuit.connect(view.history.close)
+    # The view may have taken over the timer meanwhile.
+    app.aboutToQuit.connect(view.close_shared)
 
     app.setStyle('cleanlooks')
 
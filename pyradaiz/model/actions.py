@@ -1,14 +1,13 @@
 """
 This module contains all actions used by pyradaiz.
 """
-from dialogs import SettingsDialog
-
 from model.consts import START_ICON, PAUSE_ICON, RESET_ICON, SETTINGS_ICON, \
     ABOUT_ICON, TASKS_ICON, QUIT_ICON, MINIMIZE_ICON, MAXIMIZE_ICON
+from model.icons import get_icon
 
 __author__ = 'Alen Suljkanovic'
 
-from PyQt5 import QtWidgets, QtGui
+from PyQt5 import QtWidgets
 
 
 class PyradaizAction(QtWidgets.QAction):
@@ -30,7 +29,7 @@ class StartAction(PyradaizAction):
     def __init__(self, parent):
         super(StartAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(START_ICON))
+        self.setIcon(get_icon(START_ICON))
         self.setText("&Start")
         self.setShortcut('Ctrl+S')
         self.setStatusTip('Start/Continue pomodoro')
@@ -41,20 +40,14 @@ class StartAction(PyradaizAction):
         """
         Executes the action.
         """
-        if self.parent.running:
-            return
-
-        self.parent.running = True
-        self.parent.timer_thread.minutes = self.parent.minutes
-        self.parent.timer_thread.seconds = self.parent.seconds
-        self.parent.timer_thread.start()
+        self.parent.timer_thread.start_session()
 
 
 class StopAction(PyradaizAction):
     def __init__(self,parent):
         super(StopAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(PAUSE_ICON))
+        self.setIcon(get_icon(PAUSE_ICON))
         self.setText("&Stop")
         self.setShortcut('Ctrl+X')
         self.setStatusTip('Stop pomodoro')
@@ -65,10 +58,7 @@ class StopAction(PyradaizAction):
         """
         Executes the action.
         """
-        self.parent.running = False
-        self.parent.timer_thread.terminate()
-        self.parent.minutes = self.parent.timer_thread.minutes
-        self.parent.seconds = self.parent.timer_thread.seconds
+        self.parent.timer_thread.pause_session()
 
 
 class ResetAction(PyradaizAction):
@@ -77,7 +67,7 @@ class ResetAction(PyradaizAction):
         super(ResetAction, self).__init__(parent)
         self.parent = parent
         self.setText("&Reset")
-        self.setIcon(QtGui.QIcon(RESET_ICON))
+        self.setIcon(get_icon(RESET_ICON))
         self.setShortcut('Ctrl+R')
         self.setStatusTip('Reset pomodoro timer')
         self.triggered.connect(self.do)
@@ -86,15 +76,7 @@ class ResetAction(PyradaizAction):
         """
         Executes the action.
         """
-        self.parent.minutes = self.parent.settings.pomodoro_duration
-        self.parent.seconds = 0
-        self.parent.pomodoro_cnt = 0
-        self.parent.timer_thread.terminate()
-        self.parent.running = False
-
-        from pyradaiz.model.pyradaiz import time_str
-        self.parent.lcd.display(time_str(self.parent.minutes,
-                                         self.parent.seconds))
+        self.parent.timer_thread.reset_session()
 
 
 class QuitAction(PyradaizAction):
@@ -102,11 +84,10 @@ class QuitAction(PyradaizAction):
     def __init__(self, parent):
         super(QuitAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(QUIT_ICON))
+        self.setIcon(get_icon(QUIT_ICON))
         self.setText("&Quit")
         self.setShortcut('Ctrl+Q')
         self.setStatusTip('Exit application')
-        self.parent.timer_thread.terminate()
         self.triggered.connect(QtWidgets.qApp.quit)
 
 
@@ -115,7 +96,7 @@ class SettingsAction(PyradaizAction):
     def __init__(self, parent):
         super(SettingsAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(SETTINGS_ICON))
+        self.setIcon(get_icon(SETTINGS_ICON))
         self.setText("&Settings")
         self.triggered.connect(self.do)
 
@@ -123,6 +104,8 @@ class SettingsAction(PyradaizAction):
         """
         Executes the action.
         """
+        # The dialog is rarely opened, so it's imported on first use.
+        from dialogs import SettingsDialog
         dialog = SettingsDialog(self.parent)
         dialog.exec_()
 
@@ -132,15 +115,37 @@ class AboutAction(PyradaizAction):
     def __init__(self, parent):
         super(AboutAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(ABOUT_ICON))
+        self.setIcon(get_icon(ABOUT_ICON))
         self.setText("&About")
         self.triggered.connect(self.do)
 
     def do(self):
         """
-        Executes the action.
+        Executes the action. The dialog shows once the statistics are
+        loaded, which happens on another thread.
+        """
+        self.parent.load_statistics(self.show_about)
+
+    def show_about(self, rollups):
+        """
+        Shows the dialog.
+        :param rollups: Rollups, or None without NumPy.
         """
-        pass
+        text = "Pyradaiz is pomodoro timer written in Python!"
+        if rollups is not None:
+            summary = rollups.summary()
+            text += "\n\nToday: %d pomodoros, %d min\n" \
+                    "This week: %d pomodoros, %d min\n" \
+                    "Streak: %d days (longest %d)\n" \
+                    "Breaks taken: %d%%" % (
+                        summary["today_pomodoros"],
+                        summary["today_focus"] // 60,
+                        summary["week_pomodoros"],
+                        summary["week_focus"] // 60,
+                        summary["current_streak"],
+                        summary["longest_streak"],
+                        summary["break_adherence"] * 100)
+        QtWidgets.QMessageBox.about(self.parent, "About Pyradaiz", text)
 
 
 class TasksAction(PyradaizAction):
@@ -148,7 +153,7 @@ class TasksAction(PyradaizAction):
     def __init__(self, parent):
         super(TasksAction, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(TASKS_ICON))
+        self.setIcon(get_icon(TASKS_ICON))
         self.setText("&Tasks")
         self.triggered.connect(self.do)
 
@@ -156,7 +161,7 @@ class TasksAction(PyradaizAction):
         """
         Executes the action.
         """
-        pass
+        self.parent.toggle_tasks()
 
 
 class ChangeUI(PyradaizAction):
@@ -164,13 +169,45 @@ class ChangeUI(PyradaizAction):
     def __init__(self, parent):
         super(ChangeUI, self).__init__(parent)
         self.parent = parent
-        self.setIcon(QtGui.QIcon(MINIMIZE_ICON))
+        self.setIcon(get_icon(MINIMIZE_ICON))
         self.setText("&Tasks")
         self.triggered.connect(self.do)
 
     def do(self):
         self.parent.toggle_ui()
         if self.parent.slim_view:
-            self.setIcon(QtGui.QIcon(MAXIMIZE_ICON))
+            self.setIcon(get_icon(MAXIMIZE_ICON))
         else:
-            self.setIcon(QtGui.QIcon(MINIMIZE_ICON))
+            self.setIcon(get_icon(MINIMIZE_ICON))
+
+
+class TrayOnlyAction(PyradaizAction):
+
+    def __init__(self, parent):
+        super(TrayOnlyAction, self).__init__(parent)
+        self.parent = parent
+        self.setText("Tray &only")
+        self.setCheckable(True)
+        self.triggered.connect(self.do)
+
+    def do(self):
+        self.parent.toggle_tray_only()
+
+
+class ProfileAction(PyradaizAction):
+
+    def __init__(self, parent, name):
+        super(ProfileAction, self).__init__(parent)
+        self.parent = parent
+        self.name = name
+        # A single & would make the next letter a mnemonic.
+        self.setText(name.replace("&", "&&"))
+        self.setStatusTip("Switch to the %s durations" % name)
+        self.setCheckable(True)
+        self.triggered.connect(self.do)
+
+    def do(self):
+        """
+        Executes the action.
+        """
+        self.parent.settings.apply_profile(self.name)
@@ -0,0 +1,120 @@
+"""
+This module contains the clocks the timer runs on. A clock tells the
+monotonic time the countdown is measured with, the wall clock time sessions
+are anchored to, and does the timer thread's waiting.
+
+The system clock reads the real clocks and really waits. The virtual clock
+only moves when it's told to or when something waits on it: waiting jumps
+straight to the timeout, running the calls scheduled with call_at on the
+way, so weeks of timer behaviour run in seconds on the same loop.
+"""
+import heapq
+import itertools
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+# UNIX time a virtual clock starts at, 2023-11-14 22:13:20 UTC.
+VIRTUAL_EPOCH = 1.7e9
+
+
+class SystemClock(object):
+    """
+    The real clocks.
+    """
+    # Plain functions rather than methods, the countdown reads the clock
+    # a few times per tick.
+    monotonic = staticmethod(time.monotonic)
+    time = staticmethod(time.time)
+
+    def wait(self, condition, timeout=None, predicate=None):
+        """
+        Waits until the condition is notified, and predicate() is true if
+        given, or the timeout passes. The caller holds the condition.
+        :param timeout: seconds, or None to wait for a notification.
+        :return:
+            False if the timeout passed.
+        """
+        if predicate is None:
+            return condition.wait(timeout)
+        return condition.wait_for(predicate, timeout)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class VirtualClock(object):
+    """
+    Clock that only moves when told to. Calls scheduled with call_at run
+    when a wait reaches their time, on the waiting thread.
+    """
+    def __init__(self, now=0.0, epoch=VIRTUAL_EPOCH, latency=0.0, seed=None):
+        """
+        :param now: monotonic time to start at.
+        :param epoch: UNIX time at monotonic time 0.
+        :param latency: seconds a timed wait may overshoot, as a thread the
+            system wakes up late does.
+        :param seed: seed of the overshoots.
+        """
+        # Imported here, the system clock is all a normal run needs.
+        import random
+
+        super(VirtualClock, self).__init__()
+        self.now = now
+        self.epoch = epoch
+        self.latency = latency
+        self.waits = 0
+        self._random = random.Random(seed)
+        self._calls = []
+        self._seq = itertools.count()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def suspend(self, seconds):
+        """
+        Moves only the wall clock, as a suspend of the machine does: the
+        monotonic clock stands still meanwhile.
+        """
+        self.epoch += seconds
+
+    def call_at(self, when, function, *args):
+        """
+        Schedules function(*args) to run at monotonic time when.
+        """
+        heapq.heappush(self._calls, (when, next(self._seq), function, args))
+
+    def wait(self, condition, timeout=None, predicate=None):
+        """
+        Moves on to the timeout, running the scheduled calls on the way.
+        The wait ends early after a call once predicate() is true, or after
+        any call without a predicate.
+        :param condition: ignored, only the scheduled calls can notify it.
+        :return:
+            False if the timeout passed.
+        """
+        self.waits += 1
+        end = None
+        if timeout is not None:
+            end = self.now + timeout
+            if self.latency:
+                end += self._random.uniform(0, self.latency)
+        while self._calls and (end is None or self._calls[0][0] <= end):
+            when, _, function, args = heapq.heappop(self._calls)
+            self.now = max(self.now, when)
+            function(*args)
+            if predicate is None or predicate():
+                return True
+        if end is None:
+            raise RuntimeError("Waiting forever on a virtual clock")
+        self.now = end
+        return False
@@ -0,0 +1,122 @@
+"""
+This module contains the settings file watcher. It applies config.xml again
+when someone else changes it, e.g. configuration management pushing a new
+one, so running clients pick it up without a restart.
+
+The configuration directory is watched with QFileSystemWatcher (inotify on
+Linux), which costs nothing while nothing happens: a file replaced by a
+rename shows up as a directory change, one edited in place as a file change.
+Events are debounced, then a stat call tells a real change from the store's
+own writes, and only a real change is parsed. Where the system can't watch
+the directory, the file is polled instead, less often the longer it stays
+the same.
+"""
+import os
+import time
+
+from PyQt5 import QtCore
+
+from model.instrumentation import Histogram
+
+__author__ = 'Alen Suljkanovic'
+
+# Milliseconds to wait for more changes before checking, a file is often
+# written in more than one step.
+DEBOUNCE_MS = 200
+
+# Milliseconds between polls, doubled while the file stays the same.
+POLL_MS = 2000
+MAX_POLL_MS = 60000
+
+
+class ConfigWatcher(QtCore.QObject):
+    """
+    Reloads settings when their file changes.
+    """
+    def __init__(self, settings, parent=None, debounce_ms=DEBOUNCE_MS,
+                 poll_ms=POLL_MS, max_poll_ms=MAX_POLL_MS):
+        """
+        :param settings: PyradaizSettings, whose listeners get the changes.
+        """
+        super(ConfigWatcher, self).__init__(parent)
+        self.settings = settings
+        self.path = settings.store.path
+        self.poll_ms = poll_ms
+        self.max_poll_ms = max_poll_ms
+        self.checks = 0
+        self.reloads = 0
+        # Seconds it took to parse and apply a changed file.
+        self.reload_time = Histogram()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.check)
+
+        directory = settings.store.directory
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            pass
+        self.watching = bool(self.watcher.addPath(directory))
+        if self.watching:
+            self.timer.setInterval(debounce_ms)
+            self.watcher.directoryChanged.connect(self.schedule)
+            self.watcher.fileChanged.connect(self.schedule)
+            self._watch_file()
+        else:
+            self.timer.setInterval(poll_ms)
+            self.timer.start()
+
+    def _watch_file(self):
+        # A replaced file is dropped from the watcher, the new one is added
+        # again here.
+        if self.path not in self.watcher.files() and \
+                os.path.exists(self.path):
+            self.watcher.addPath(self.path)
+
+    def schedule(self, path=None):
+        """
+        Checks the file once no more events came for the debounce time.
+        """
+        self.timer.start()
+
+    def check(self):
+        """
+        Applies the file if it changed.
+        :return:
+            dictionary of the changed fields to (old, new) tuples, or None
+            if the file didn't change.
+        """
+        self.checks += 1
+        started = time.perf_counter()
+        changes = self.settings.reload()
+        if changes is not None:
+            self.reloads += 1
+            self.reload_time.add(time.perf_counter() - started)
+        if self.watching:
+            self._watch_file()
+        else:
+            if changes is None:
+                interval = min(self.timer.interval() * 2, self.max_poll_ms)
+            else:
+                interval = self.poll_ms
+            self.timer.setInterval(interval)
+            self.timer.start()
+        return changes
+
+    def close(self):
+        """
+        Stops watching and polling.
+        """
+        self.timer.stop()
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.watching = False
+
+    def as_dict(self):
+        return {"mode": "watch" if self.watching else "poll",
+                "checks": self.checks,
+                "reloads": self.reloads,
+                "reload_time": self.reload_time.as_dict()}
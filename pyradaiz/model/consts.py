@@ -3,7 +3,6 @@ This module contains all constants used in the code.
 """
 import os
 from model.utils import get_root_path
-from PyQt5 import QtCore
 
 __author__ = 'Alen Suljkanovic'
 
@@ -32,5 +31,8 @@ LINE_EDIT_WIDTH = 40
 ALWAYS_ON_TOP_YES = "Yes"
 ALWAYS_ON_TOP_NO = "No"
 
-TOOLBAR_ICON_MAX_SIZE = QtCore.QSize(12, 12)
-TOOLBAR_ICON_MIN_SIZE = QtCore.QSize(8, 8)
+# Width and height, kept as plain tuples so the constants load without Qt.
+TOOLBAR_ICON_MAX_SIZE = (12, 12)
+TOOLBAR_ICON_MIN_SIZE = (8, 8)
+# Icons of the window and tray menus.
+MENU_ICON_SIZE = (16, 16)
@@ -0,0 +1,439 @@
+"""
+This module contains the local control endpoint of a running pyradaiz, and
+a client for it. Scripts, status bars and editor plugins connect to a Unix
+socket and talk newline delimited JSON, like the session server: every
+request carries an "id" and a "cmd" (start, stop, reset, status, subscribe
+or unsubscribe) and gets one reply with the same "id".
+
+Subscribers are pushed the timer state, {"event": ..., "phase": ...,
+"running": ..., "pomodoro_cnt": ..., "remaining": ..., "time": ...}, in
+one of three modes:
+
+    "second"  every second while the timer runs, and on every change
+    "change"  when the timer is started, stopped, reset or changes phase
+    "phase"   only when the phase changes
+
+The endpoint runs on its own thread. The GUI hands it each new state, which
+costs the same however many subscribers there are; between changes the
+endpoint counts down from the deadline on its own.
+"""
+import json
+import math
+import os
+import selectors
+import socket
+import threading
+import time
+
+from model.shared import instance_name
+from model.timer import EPSILON
+from model.utils import get_runtime_path, time_str
+
+__author__ = 'Alen Suljkanovic'
+
+MODE_SECOND = "second"
+MODE_CHANGE = "change"
+MODE_PHASE = "phase"
+MODES = (MODE_SECOND, MODE_CHANGE, MODE_PHASE)
+
+EVENT_TICK = "tick"
+EVENT_CHANGE = "change"
+EVENT_PHASE = "phase"
+
+COMMANDS = ("start", "stop", "reset")
+
+# Clients that let this much unread data pile up are disconnected instead of
+# slowing down everyone else.
+MAX_WRITE_BUFFER = 64 * 1024
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode(line):
+    return json.loads(line.decode())
+
+
+def control_path():
+    """
+    Returns path of the control socket of this user.
+    """
+    return os.path.join(get_runtime_path(), instance_name() + ".control")
+
+
+def state_message(event, state, remaining=None):
+    """
+    Returns a SessionState as a message.
+    :param remaining: seconds left, defaults to those of the state.
+    """
+    if remaining is None:
+        remaining = state.remaining
+    return {"event": event,
+            "phase": state.phase,
+            "running": state.running,
+            "pomodoro_cnt": state.pomodoro_cnt,
+            "remaining": remaining,
+            "time": time_str(*divmod(remaining, 60))}
+
+
+class _Connection(object):
+    __slots__ = ("sock", "inbuf", "outbuf", "mode")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = b""
+        self.outbuf = b""
+        self.mode = None
+
+
+class ControlServer(object):
+    """
+    Control endpoint. Commands are handed to on_command on the endpoint's
+    thread; the caller is expected to pass them on to its own thread.
+    """
+    def __init__(self, path, on_command, clock=time.monotonic):
+        """
+        :param on_command: function called with start, stop or reset.
+        """
+        super(ControlServer, self).__init__()
+        self.path = path
+        self.on_command = on_command
+        self.clock = clock
+        if os.path.exists(path):
+            os.remove(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.sock, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._connections = {}
+        self._lock = threading.Lock()
+        # The latest state, handed over by publish.
+        self._published = None
+        self._closed = False
+        # State as last sent, and the remaining seconds of the last tick.
+        self.state = None
+        self._tick = None
+        self.subscribers = dict((mode, set()) for mode in MODES)
+        # Messages sent and seconds spent sending them.
+        self.sent = 0
+        self.fanout_time = 0.0
+        self._thread = threading.Thread(target=self._run,
+                                        name="pyradaiz-control")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def publish(self, state):
+        """
+        Hands a new SessionState to the endpoint, from any thread.
+        """
+        with self._lock:
+            pending = self._published is not None
+            self._published = state
+        if not pending:
+            self._ring()
+
+    def _ring(self):
+        try:
+            self._wake_w.send(b"!")
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        """
+        Disconnects everyone and waits for the thread.
+        """
+        self._closed = True
+        if self._thread.is_alive():
+            self._ring()
+            self._thread.join(1.0)
+        else:
+            self._cleanup()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                for key, events in self._selector.select(self._timeout()):
+                    if key.fileobj is self.sock:
+                        self._accept()
+                    elif key.fileobj is self._wake_r:
+                        self._take_published()
+                    else:
+                        self._serve(key.data, events)
+                self._send_tick()
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        for connection in list(self._connections.values()):
+            self._drop(connection)
+        self._selector.close()
+        self.sock.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _remaining(self, now):
+        return max(0, int(math.ceil(self.state.deadline - now - EPSILON)))
+
+    def _timeout(self):
+        """
+        Returns seconds until the next tick is due, or None.
+        """
+        state = self.state
+        if not self.subscribers[MODE_SECOND] or state is None or \
+                not state.running or state.deadline is None:
+            return None
+        left = state.deadline - self.clock()
+        # Wakes up just after the remaining time drops a second.
+        return max(0.0, left - math.floor(left - EPSILON) + EPSILON)
+
+    def _send_tick(self):
+        state = self.state
+        if not self.subscribers[MODE_SECOND] or state is None or \
+                not state.running or state.deadline is None:
+            return
+        remaining = self._remaining(self.clock())
+        if remaining != self._tick:
+            self._tick = remaining
+            self._fanout(encode(state_message(EVENT_TICK, state, remaining)),
+                         (MODE_SECOND,))
+
+    def _take_published(self):
+        while True:
+            try:
+                if not self._wake_r.recv(4096):
+                    break
+            except BlockingIOError:
+                break
+        with self._lock:
+            state, self._published = self._published, None
+        if state is None:
+            return
+        previous, self.state = self.state, state
+        if previous is not None and \
+                (previous.phase, previous.pomodoro_cnt) != \
+                (state.phase, state.pomodoro_cnt):
+            modes, event = MODES, EVENT_PHASE
+        elif previous is None or previous[:4] != state[:4]:
+            modes, event = (MODE_SECOND, MODE_CHANGE), EVENT_CHANGE
+        else:
+            return
+        self._tick = state.remaining
+        self._fanout(encode(state_message(event, state)), modes)
+
+    def _fanout(self, data, modes):
+        """
+        Sends the same bytes to the subscribers of the given modes.
+        """
+        started = time.perf_counter()
+        for mode in modes:
+            for connection in list(self.subscribers[mode]):
+                self._send(connection, data)
+                self.sent += 1
+        self.fanout_time += time.perf_counter() - started
+
+    def _send(self, connection, data):
+        if connection.outbuf:
+            if len(connection.outbuf) + len(data) > MAX_WRITE_BUFFER:
+                self._drop(connection)
+                return
+            connection.outbuf += data
+            return
+        try:
+            sent = connection.sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(connection)
+            return
+        if sent < len(data):
+            connection.outbuf = data[sent:]
+            self._selector.modify(connection.sock,
+                                  selectors.EVENT_READ | selectors.EVENT_WRITE,
+                                  connection)
+
+    def _flush(self, connection):
+        try:
+            sent = connection.sock.send(connection.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(connection)
+            return
+        connection.outbuf = connection.outbuf[sent:]
+        if not connection.outbuf:
+            self._selector.modify(connection.sock, selectors.EVENT_READ,
+                                  connection)
+
+    def _accept(self):
+        try:
+            sock, _ = self.sock.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        connection = _Connection(sock)
+        self._connections[sock.fileno()] = connection
+        self._selector.register(sock, selectors.EVENT_READ, connection)
+
+    def _drop(self, connection):
+        if self._connections.pop(connection.sock.fileno(), None) is None:
+            return
+        if connection.mode is not None:
+            self.subscribers[connection.mode].discard(connection)
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
+
+    def _serve(self, connection, events):
+        if events & selectors.EVENT_WRITE:
+            self._flush(connection)
+            if connection.sock.fileno() not in self._connections:
+                return
+        if not events & selectors.EVENT_READ:
+            return
+        try:
+            data = connection.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(connection)
+            return
+        lines = (connection.inbuf + data).split(b"\n")
+        connection.inbuf = lines.pop()
+        if len(connection.inbuf) > MAX_WRITE_BUFFER:
+            self._drop(connection)
+            return
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = decode(line)
+            except ValueError:
+                reply = {"id": None, "ok": False, "error": "invalid JSON"}
+            else:
+                reply = self.dispatch(request, connection)
+            self._send(connection, encode(reply))
+
+    def dispatch(self, request, connection):
+        """
+        Executes one request and returns the reply.
+        """
+        if not isinstance(request, dict):
+            return {"id": None, "ok": False, "error": "invalid request"}
+        reply = {"id": request.get("id")}
+        cmd = request.get("cmd")
+        if cmd in COMMANDS:
+            # The change is pushed to subscribers once the timer made it.
+            self.on_command(cmd)
+        elif cmd == "subscribe":
+            mode = request.get("mode", MODE_CHANGE)
+            if mode not in MODES:
+                reply.update(ok=False, error="unknown mode %r" % mode)
+                return reply
+            if connection.mode is not None:
+                self.subscribers[connection.mode].discard(connection)
+            connection.mode = mode
+            self.subscribers[mode].add(connection)
+        elif cmd == "unsubscribe":
+            if connection.mode is not None:
+                self.subscribers[connection.mode].discard(connection)
+            connection.mode = None
+        elif cmd != "status":
+            reply.update(ok=False, error="unknown command %r" % cmd)
+            return reply
+        reply["ok"] = True
+        if self.state is not None:
+            remaining = self.state.remaining
+            if self.state.running and self.state.deadline is not None:
+                remaining = self._remaining(self.clock())
+            reply["state"] = state_message(EVENT_CHANGE, self.state,
+                                           remaining)
+        return reply
+
+
+class ControlClient(object):
+    """
+    Blocking client of the control endpoint.
+
+        client = ControlClient()
+        client.start()
+        for message in client.subscribe("phase"):
+            print(message["phase"])
+    """
+    def __init__(self, path=None, timeout=5.0):
+        super(ControlClient, self).__init__()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path or control_path())
+        self._file = self.sock.makefile("rb")
+        self._ids = 0
+        # Pushed messages read while waiting for a reply.
+        self._messages = []
+
+    def request(self, cmd, **kwargs):
+        """
+        Sends a request and waits for its reply.
+        :raise RuntimeError: if the request failed.
+        """
+        self._ids += 1
+        kwargs.update(id=self._ids, cmd=cmd)
+        self.sock.sendall(encode(kwargs))
+        while True:
+            message = self._read()
+            if message.get("id") == self._ids and "ok" in message:
+                break
+            self._messages.append(message)
+        if not message["ok"]:
+            raise RuntimeError(message.get("error"))
+        return message
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("pyradaiz went away")
+        return decode(line)
+
+    def start(self):
+        self.request("start")
+
+    def stop(self):
+        self.request("stop")
+
+    def reset(self):
+        self.request("reset")
+
+    def status(self):
+        """
+        Returns the timer state, or None if it isn't known yet.
+        """
+        return self.request("status").get("state")
+
+    def subscribe(self, mode=MODE_CHANGE):
+        """
+        Subscribes and yields the pushed messages until the connection is
+        closed.
+        """
+        self.request("subscribe", mode=mode)
+        self.sock.settimeout(None)
+        while True:
+            while self._messages:
+                yield self._messages.pop(0)
+            try:
+                yield self._read()
+            except ConnectionError:
+                return
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
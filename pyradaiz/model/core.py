@@ -0,0 +1,656 @@
+"""
+This module contains the pomodoro state machine and the scheduler that drives
+many sessions from a single thread. Nothing in here depends on Qt.
+"""
+import bisect
+import collections
+import threading
+import time
+
+from model.clock import SYSTEM_CLOCK
+from model.timer import DeadlineTimer
+from model.utils import time_str
+
+__author__ = 'Alen Suljkanovic'
+
+PHASE_WORK = "work"
+PHASE_SHORT_BREAK = "short_break"
+PHASE_LONG_BREAK = "long_break"
+
+# Events sent to the session listeners. The value is the mm:ss time for
+# ticks, the new phase's minutes for phase changes and the remaining seconds
+# for start, pause and reset.
+EVENT_TICK = "tick"
+EVENT_TAKE_A_BREAK = "take_a_break"
+EVENT_GO_ON = "go_on"
+EVENT_START = "start"
+EVENT_PAUSE = "pause"
+EVENT_RESET = "reset"
+
+# Pomodoros in one cycle, the last one is followed by the long break.
+POMODOROS_PER_CYCLE = 3
+
+# Seconds the session may fall behind the wall clock, e.g. while the machine
+# was suspended, before it jumps to where it should be.
+RESYNC_THRESHOLD = 2.0
+
+Position = collections.namedtuple("Position",
+                                  ("phase", "remaining", "pomodoro_cnt"))
+
+# Consistent copy of a session's state, for other threads to read.
+SessionState = collections.namedtuple(
+    "SessionState", ("running", "phase", "pomodoro_cnt", "remaining",
+                     "time", "anchor", "elapsed", "deadline"))
+
+
+def check_durations(pomodoro_duration, short_break, long_break):
+    """
+    Raises ValueError unless every duration is a positive number of
+    minutes.
+    """
+    for name, minutes in (("pomodoro duration", pomodoro_duration),
+                          ("short break", short_break),
+                          ("long break", long_break)):
+        if isinstance(minutes, bool) or \
+                not isinstance(minutes, (int, float)) or \
+                not 0 < minutes < float("inf"):
+            raise ValueError("%s must be a positive number of minutes, "
+                             "got %r" % (name, minutes))
+
+
+class CyclePlan(object):
+    """
+    One cycle of phases: a pomodoro and a short break, repeated, with a long
+    break after the last pomodoro. A cycle always has 2 * POMODOROS_PER_CYCLE
+    phases, so a lookup costs the same however long the session ran.
+    """
+    def __init__(self, pomodoro_duration, short_break, long_break,
+                 pomodoros=POMODOROS_PER_CYCLE):
+        """
+        Compiles the plan.
+        :param pomodoro_duration: pomodoro duration in minutes.
+        :param short_break: short break duration in minutes.
+        :param long_break: long break duration in minutes.
+        :param pomodoros: pomodoros per cycle.
+        """
+        super(CyclePlan, self).__init__()
+        check_durations(pomodoro_duration, short_break, long_break)
+        self.pomodoros = pomodoros
+        phases = []
+        durations = []
+        # Pomodoros finished before each phase starts.
+        self.finished = []
+        for i in range(pomodoros):
+            phases += [PHASE_WORK, PHASE_SHORT_BREAK]
+            durations += [pomodoro_duration * 60, short_break * 60]
+            self.finished += [i, i + 1]
+        phases[-1] = PHASE_LONG_BREAK
+        durations[-1] = long_break * 60
+        self.phases = tuple(phases)
+        self.durations = tuple(durations)
+
+        # starts[i] is the offset of phase i from the start of the cycle,
+        # starts[-1] the length of the cycle.
+        self.starts = [0]
+        for duration in durations:
+            self.starts.append(self.starts[-1] + duration)
+        self.length = self.starts[-1]
+        if self.length <= 0:
+            raise ValueError("Pomodoro cycle has no duration")
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Compiles the plan of a PyradaizSettings-like object.
+        """
+        return cls(settings.pomodoro_duration, settings.short_break,
+                   settings.long_break)
+
+    def locate(self, elapsed):
+        """
+        Returns where a session is after running for the given time.
+        :param elapsed: seconds since the first pomodoro started.
+        :return:
+            Position(phase, remaining seconds, finished pomodoros)
+        """
+        cycles, offset = divmod(max(elapsed, 0), self.length)
+        index = bisect.bisect_right(self.starts, offset) - 1
+        return Position(self.phases[index], self.starts[index + 1] - offset,
+                        int(cycles) * self.pomodoros + self.finished[index])
+
+    def elapsed(self, pomodoro_cnt, phase, remaining):
+        """
+        Returns how long a session has run, the inverse of locate.
+        :param pomodoro_cnt: finished pomodoros.
+        :param phase: current phase.
+        :param remaining: seconds left in the current phase.
+        :return:
+            seconds since the first pomodoro started.
+        """
+        cycles, done = divmod(pomodoro_cnt, self.pomodoros)
+        if phase == PHASE_WORK:
+            index = 2 * done
+        elif done == 0:
+            # The long break ends the previous cycle.
+            cycles -= 1
+            index = len(self.phases) - 1
+        else:
+            index = 2 * done - 1
+        return cycles * self.length + self.starts[index + 1] - remaining
+
+
+class PomodoroSession(object):
+    """
+    One pomodoro timer: work, short break, and a long break after every third
+    pomodoro. Listeners are called as listener(session, event, value).
+    """
+    def __init__(self, pomodoro_duration, short_break, long_break, name=None,
+                 clock=time.monotonic, wall_clock=time.time):
+        """
+        Initialize session.
+        :param pomodoro_duration: pomodoro duration in minutes.
+        :param short_break: short break duration in minutes.
+        :param long_break: long break duration in minutes.
+        :param name: session name, used by the hosts of many sessions.
+        :param clock: function that returns monotonic time in seconds.
+        :param wall_clock: function that returns UNIX time, which unlike
+            the monotonic clock also runs while the machine is suspended.
+        """
+        super(PomodoroSession, self).__init__()
+        self.name = name
+        self.pomodoro_duration = pomodoro_duration
+        self.short_break = short_break
+        self.long_break = long_break
+        self.plan = CyclePlan(pomodoro_duration, short_break, long_break)
+        self.timer = DeadlineTimer(clock)
+        self.wall_clock = wall_clock
+        # UNIX time the first pomodoro would have started, had the session
+        # run without pauses. None while the session is stopped.
+        self.anchor = None
+        self._clock_offset = 0.0
+        self.listeners = []
+        # Wake up every second. When False, the session only wakes up at the
+        # phase boundaries.
+        self.ticks = True
+        self.reset()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, event, value):
+        for listener in self.listeners:
+            listener(self, event, value)
+
+    def configure(self, pomodoro_duration, short_break, long_break):
+        """
+        Changes phase durations. The new durations are used from the next
+        phase on, except for a stopped work phase which takes the new
+        pomodoro duration but keeps the work done so far: one that hasn't
+        started gets the whole new duration, a paused one what's left of it.
+        Invalid durations raise ValueError and change nothing.
+        """
+        plan = CyclePlan(pomodoro_duration, short_break, long_break)
+        elapsed = self.pomodoro_duration * 60 - self.timer.remaining()
+        self.pomodoro_duration = pomodoro_duration
+        self.short_break = short_break
+        self.long_break = long_break
+        self.plan = plan
+        if self.phase == PHASE_WORK and not self.running:
+            self.timer.reset(max(0.0, pomodoro_duration * 60 -
+                                 max(0.0, elapsed)))
+        self._set_anchor()
+
+    def start(self):
+        """
+        Starts or continues the current phase.
+        :return:
+            False if the session was already running.
+        """
+        if self.running:
+            return False
+        self.timer.resume()
+        self._set_anchor()
+        self.notify(EVENT_START, self.timer.remaining())
+        return True
+
+    def pause(self):
+        if not self.running:
+            return
+        self.timer.pause()
+        self.anchor = None
+        self.notify(EVENT_PAUSE, self.timer.remaining())
+
+    def reset(self):
+        """
+        Stops the session and goes back to the first pomodoro.
+        """
+        self.phase = PHASE_WORK
+        self.pomodoro_cnt = 0
+        self.timer.reset(self.pomodoro_duration * 60)
+        self.anchor = None
+        self.notify(EVENT_RESET, self.timer.remaining())
+
+    def snapshot(self):
+        """
+        Returns the current state as an immutable SessionState.
+        """
+        remaining = self.timer.remaining_seconds()
+        return SessionState(self.running, self.phase, self.pomodoro_cnt,
+                            remaining, time_str(*divmod(remaining, 60)),
+                            self.anchor, self.elapsed(), self.timer.deadline)
+
+    def elapsed(self):
+        """
+        Returns seconds the session has run since the first pomodoro,
+        pauses not counted.
+        """
+        return self.plan.elapsed(self.pomodoro_cnt, self.phase,
+                                 self.timer.remaining())
+
+    def _set_anchor(self):
+        if self.running:
+            now = self.wall_clock()
+            self.anchor = now - self.elapsed()
+            # While running, the session moves with the monotonic clock, so
+            # it's in step with the anchor as long as the two clocks keep
+            # this distance.
+            self._clock_offset = now - self.timer.clock()
+
+    def restore(self, elapsed, running=False):
+        """
+        Jumps to where the session is after running for the given time,
+        without going through the phases in between.
+        :param elapsed: seconds since the first pomodoro, pauses not
+            counted.
+        :param running: keep counting down from there.
+        """
+        position = self.plan.locate(elapsed)
+        self.phase = position.phase
+        self.pomodoro_cnt = position.pomodoro_cnt
+        self.timer.reset(position.remaining)
+        self.anchor = None
+        if running:
+            self.start()
+
+    def restore_anchor(self, anchor):
+        """
+        Resumes a running session that started at a given UNIX time, e.g.
+        after a restart.
+        :param anchor: the session's anchor when it was saved.
+        """
+        self.restore(self.wall_clock() - anchor, running=True)
+
+    def resync(self):
+        """
+        Catches up with the wall clock after the monotonic clock stood
+        still, e.g. during a suspend. A phase change is announced once, for
+        the phase the session lands in.
+        :return:
+            True if the session jumped.
+        """
+        if self.anchor is None:
+            return False
+        behind = self.wall_clock() - self.timer.clock() - self._clock_offset
+        if abs(behind) < RESYNC_THRESHOLD:
+            return False
+        phase, cnt = self.phase, self.pomodoro_cnt
+        self.restore(self.wall_clock() - self.anchor, running=True)
+        if (phase, cnt) != (self.phase, self.pomodoro_cnt):
+            if self.phase == PHASE_WORK:
+                self.notify(EVENT_GO_ON, self.pomodoro_duration)
+            elif self.phase == PHASE_SHORT_BREAK:
+                self.notify(EVENT_TAKE_A_BREAK, self.short_break)
+            else:
+                self.notify(EVENT_TAKE_A_BREAK, self.long_break)
+        return True
+
+    def poll(self):
+        """
+        Brings the session up to date with the clock: switches phases whose
+        deadline has passed and notifies listeners about the current time.
+        """
+        self.resync()
+        while self.running and self.timer.remaining_seconds() == 0:
+            self.next_phase()
+        if self.ticks:
+            self.notify(EVENT_TICK, self.time)
+
+    def next_phase(self):
+        """
+        Switches to the next phase.
+        """
+        if self.phase == PHASE_WORK:
+            self.pomodoro_cnt += 1
+            # Take a long break after third pomodoro session...
+            if self.pomodoro_cnt % POMODOROS_PER_CYCLE != 0:
+                self.phase = PHASE_SHORT_BREAK
+                minutes = self.short_break
+            else:
+                self.phase = PHASE_LONG_BREAK
+                minutes = self.long_break
+            event = EVENT_TAKE_A_BREAK
+        else:
+            self.phase = PHASE_WORK
+            minutes = self.pomodoro_duration
+            event = EVENT_GO_ON
+
+        self.timer.chain(minutes * 60)
+        self.notify(event, minutes)
+
+    def next_wakeup(self):
+        """
+        Returns the delay until the session has to be polled again.
+        :return:
+            float
+        """
+        if self.ticks:
+            return self.timer.next_tick()
+        return self.timer.remaining()
+
+    @property
+    def running(self):
+        return self.timer.running
+
+    @property
+    def minutes(self):
+        return self.timer.remaining_seconds() // 60
+
+    @property
+    def seconds(self):
+        return self.timer.remaining_seconds() % 60
+
+    @property
+    def time(self):
+        """
+        Returns remaining time of the current phase as mm:ss string.
+        """
+        return time_str(*divmod(self.timer.remaining_seconds(), 60))
+
+
+class SessionRunner(object):
+    """
+    Runs a session on one thread. Other threads queue commands, e.g.
+    session.start, which the thread runs as soon as it wakes up; otherwise
+    it sleeps until the session has to be polled. The clock does the
+    sleeping, so on a VirtualClock the same loop runs without blocking.
+    """
+    def __init__(self, session, clock=SYSTEM_CLOCK, on_state=None,
+                 on_wakeup=None):
+        """
+        :param session: PomodoroSession on the same clock.
+        :param clock: SystemClock or VirtualClock.
+        :param on_state: called with a SessionState after every batch of
+            commands and every phase change.
+        :param on_wakeup: called with the scheduled time after every wake
+            up that wasn't caused by a command.
+        """
+        super(SessionRunner, self).__init__()
+        self.session = session
+        self.clock = clock
+        self.on_state = on_state
+        self.on_wakeup = on_wakeup
+        self.state = session.snapshot()
+        # Pending (function, args) commands, guarded by the condition which
+        # also wakes the thread up.
+        self._commands = []
+        self._cond = threading.Condition()
+
+    def submit(self, function, *args):
+        """
+        Queues a call to be run by the thread. Returns immediately. A None
+        function stops the thread.
+        """
+        with self._cond:
+            self._commands.append((function, args))
+            self._cond.notify()
+
+    def _pending(self):
+        return bool(self._commands)
+
+    def step(self):
+        """
+        Waits for commands or the next wake up and handles them.
+        :return:
+            False once the thread was asked to stop.
+        """
+        session = self.session
+        with self._cond:
+            scheduled = None
+            if not self._commands:
+                # Sleep until the display changes, i.e. the next whole
+                # second counted from the deadline, or a command comes.
+                delay = session.next_wakeup() if session.running else None
+                if delay is not None:
+                    scheduled = self.clock.monotonic() + delay
+                self.clock.wait(self._cond, delay, self._pending)
+            commands, self._commands = self._commands, []
+
+        if commands and session.running:
+            # A command right after a suspend acts on where the session
+            # really is, e.g. a pause keeps the time that passed.
+            session.resync()
+        stopping = False
+        for function, args in commands:
+            if function is None:
+                stopping = True
+                break
+            try:
+                function(*args)
+            except Exception:
+                # A bad command, e.g. invalid durations, mustn't stop the
+                # timer.
+                import logging
+                logging.getLogger("pyradaiz.timer").exception(
+                    "Command %r failed", function)
+        if session.running and not stopping:
+            session.poll()
+        if scheduled is not None and not commands and self.on_wakeup:
+            self.on_wakeup(scheduled)
+        if commands or session.pomodoro_cnt != self.state.pomodoro_cnt \
+                or session.phase != self.state.phase:
+            self.state = session.snapshot()
+            if self.on_state:
+                self.on_state(self.state)
+        return not stopping
+
+    def run(self):
+        """
+        Runs commands and the session until stopped.
+        """
+        while self.step():
+            pass
+
+
+class WheelTimer(object):
+    """
+    Timer stored in the timing wheel.
+    """
+    __slots__ = ("expires", "callback", "args", "slot")
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+
+class TimingWheel(object):
+    """
+    Hierarchical timing wheel. Each level has `slots` slots, and each slot of
+    a level spans a whole rotation of the level below. Timers are inserted and
+    cancelled in O(1); a timer is moved to a lower level when the wheel
+    reaches its slot.
+    """
+    def __init__(self, resolution=0.01, bits=8, levels=4, start=0.0):
+        """
+        Initialize wheel.
+        :param resolution: length of one tick in seconds.
+        :param bits: log2 of the number of slots per level.
+        :param levels: number of levels.
+        :param start: time of the first tick in seconds.
+        """
+        super(TimingWheel, self).__init__()
+        self.resolution = resolution
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = [[set() for _ in range(1 << bits)]
+                       for _ in range(levels)]
+        self.current = int(start / resolution)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, when, callback, *args):
+        """
+        Schedules callback(*args) to be called at time `when`.
+        :return:
+            WheelTimer which can be passed to cancel.
+        """
+        timer = WheelTimer(int(when / self.resolution), callback, args)
+        self._place(timer, self.current + 1)
+        self.count += 1
+        return timer
+
+    def cancel(self, timer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.count -= 1
+
+    def _place(self, timer, earliest):
+        expires = max(timer.expires, earliest)
+        delta = expires - self.current
+        level = 0
+        while delta >> (self.bits * (level + 1)) and \
+                level < len(self.levels) - 1:
+            level += 1
+        # Timers beyond the last level wait in its farthest slot.
+        expires = min(expires,
+                      self.current + (1 << (self.bits * (level + 1))) - 1)
+        index = (expires >> (self.bits * level)) & self.mask
+        timer.slot = self.levels[level][index]
+        timer.slot.add(timer)
+
+    def advance(self, now):
+        """
+        Moves the wheel to time `now`.
+        :return:
+            list of expired timers, in expiry order.
+        """
+        target = int(now / self.resolution)
+        expired = []
+        while self.current < target:
+            if not self.count:
+                self.current = target
+                break
+            self.current += 1
+            self._cascade(1)
+            slot = self.levels[0][self.current & self.mask]
+            if slot:
+                for timer in slot:
+                    timer.slot = None
+                expired.extend(slot)
+                self.count -= len(slot)
+                slot.clear()
+        return expired
+
+    def _cascade(self, level):
+        """
+        Moves timers of the current slot of `level` to the lower levels, once
+        all the levels below it finished a rotation.
+        """
+        shift = self.bits * level
+        if level >= len(self.levels) or \
+                self.current & ((1 << shift) - 1):
+            return
+        self._cascade(level + 1)
+        slot = self.levels[level][(self.current >> shift) & self.mask]
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._place(timer, self.current)
+
+
+class Scheduler(object):
+    """
+    Drives any number of sessions from one thread using a timing wheel.
+    """
+    def __init__(self, resolution=0.01, clock=time.monotonic):
+        super(Scheduler, self).__init__()
+        self.clock = clock
+        self.wheel = TimingWheel(resolution, start=clock())
+        self.timers = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self, session):
+        """
+        Starts the session and wakes it up when it needs to be polled.
+        """
+        with self._lock:
+            session.start()
+            self._reschedule(session)
+
+    def cancel(self, session):
+        """
+        Pauses the session and removes it from the wheel.
+        """
+        with self._lock:
+            timer = self.timers.pop(session, None)
+            if timer is not None:
+                self.wheel.cancel(timer)
+            session.pause()
+
+    def reset(self, session):
+        with self._lock:
+            self.cancel(session)
+            session.reset()
+
+    def _reschedule(self, session):
+        timer = self.timers.pop(session, None)
+        if timer is not None:
+            self.wheel.cancel(timer)
+        when = self.clock() + session.next_wakeup()
+        self.timers[session] = self.wheel.schedule(when, self._fire, session)
+
+    def _fire(self, session):
+        self.timers.pop(session, None)
+        session.poll()
+        if session.running:
+            self._reschedule(session)
+
+    def advance(self):
+        """
+        Polls the sessions that are due.
+        :return:
+            number of polled sessions.
+        """
+        with self._lock:
+            expired = self.wheel.advance(self.clock())
+            for timer in expired:
+                timer.callback(*timer.args)
+        return len(expired)
+
+    def run(self):
+        while not self._stop.wait(self.wheel.resolution):
+            self.advance()
+
+    def start(self):
+        """
+        Starts the scheduler thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="scheduler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
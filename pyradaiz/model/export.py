@@ -0,0 +1,311 @@
+"""
+This module contains the event exporter: it streams the session history,
+phase starts and ends, pauses and resets, to a spool directory or a local
+HTTP collector as gzipped JSON Lines.
+
+Recording an event only appends a tuple to an in-memory buffer. A
+background thread encodes and compresses the buffer in batches, when it
+holds batch_size events or the oldest event waited flush_interval seconds.
+Batches the collector doesn't take are spooled to disk, up to a size limit,
+and resent oldest first once it's back. When the sink itself fails, e.g.
+the spool directory is full or gone, the batch is kept in memory and sent
+again after a back off.
+
+Export is off unless configured:
+
+    PYRADAIZ_EXPORT_DIR=/var/spool/pyradaiz   write batches to a directory
+    PYRADAIZ_EXPORT_URL=http://127.0.0.1:8080/events
+                                              POST batches to a collector
+
+With both set, the directory spools what the collector didn't take.
+"""
+import collections
+import getpass
+import json
+import os
+import socket
+import threading
+import time
+
+from model.settings_store import atomic_write
+from model.utils import get_data_path
+
+__author__ = 'Alen Suljkanovic'
+
+# Events in one batch.
+BATCH_SIZE = 500
+
+# Seconds an event may wait for others to be sent with.
+FLUSH_INTERVAL = 5.0
+
+# Events buffered while the exporter can't keep up; older ones are dropped.
+MAX_BUFFER = 100000
+
+# Bytes kept on disk while the collector is down.
+MAX_SPOOL_BYTES = 16 * 1024 * 1024
+
+# Seconds between retries when the collector is down, doubled up to
+# MAX_BACKOFF.
+BACKOFF = 5.0
+MAX_BACKOFF = 300.0
+
+SPOOL_DIR = "export-spool"
+BATCH_SUFFIX = ".jsonl.gz"
+
+FIELDS = ("ts", "kind", "phase", "duration", "task", "session")
+
+
+def encode_batch(events, origin):
+    """
+    Returns events as gzipped JSON Lines.
+    :param origin: fields added to every event, e.g. the host.
+    """
+    lines = []
+    for event in events:
+        record = dict(zip(FIELDS, event))
+        record.update(origin)
+        lines.append(json.dumps(record, separators=(",", ":")))
+    lines.append("")
+    # Imported here, export is rarely configured.
+    import gzip
+    return gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=6)
+
+
+class Spool(object):
+    """
+    Directory of batch files, named so that they sort oldest first. When it
+    grows over max_bytes the oldest batches are deleted.
+    """
+    def __init__(self, directory, max_bytes=MAX_SPOOL_BYTES):
+        super(Spool, self).__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._seq = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def files(self):
+        """
+        Returns paths of the spooled batches, oldest first.
+        """
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(BATCH_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def write(self, data):
+        self._seq += 1
+        name = "%017.6f-%d-%06d%s" % (time.time(), os.getpid(), self._seq,
+                                      BATCH_SUFFIX)
+        atomic_write(os.path.join(self.directory, name), data)
+        self.trim()
+
+    def trim(self):
+        files = self.files()
+        sizes = [os.path.getsize(path) for path in files]
+        total = sum(sizes)
+        for path, size in zip(files, sizes):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.dropped += 1
+
+    @property
+    def size(self):
+        return sum(os.path.getsize(path) for path in self.files())
+
+
+class SpoolSink(object):
+    """
+    Writes batches to a directory a collector picks them up from.
+    """
+    def __init__(self, directory, max_bytes=MAX_SPOOL_BYTES):
+        super(SpoolSink, self).__init__()
+        self.spool = Spool(directory, max_bytes)
+
+    def send(self, data):
+        self.spool.write(data)
+
+    def retry(self):
+        pass
+
+
+class HttpSink(object):
+    """
+    POSTs batches to a collector, spooling those it doesn't take.
+    """
+    def __init__(self, url, spool_directory=None,
+                 max_spool_bytes=MAX_SPOOL_BYTES, timeout=5.0,
+                 clock=time.monotonic):
+        super(HttpSink, self).__init__()
+        self.url = url
+        self.timeout = timeout
+        self.clock = clock
+        self.spool = Spool(spool_directory or
+                           os.path.join(get_data_path(), SPOOL_DIR),
+                           max_spool_bytes)
+        self.backoff = BACKOFF
+        self._retry_at = 0.0
+        self.sent = 0
+        self.failures = 0
+
+    def _post(self, data):
+        # Imported here, export is rarely configured.
+        from urllib import request
+        req = request.Request(self.url, data=data, headers={
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip"})
+        with request.urlopen(req, timeout=self.timeout) as response:
+            response.read()
+
+    def _try(self, data):
+        try:
+            self._post(data)
+        except (OSError, ValueError):
+            self.failures += 1
+            self._retry_at = self.clock() + self.backoff
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+            return False
+        self.sent += 1
+        self.backoff = BACKOFF
+        return True
+
+    def send(self, data):
+        """
+        Sends a batch after the spooled ones, or spools it.
+        """
+        if not self.retry() or not self._try(data):
+            self.spool.write(data)
+
+    def retry(self):
+        """
+        Resends spooled batches, unless the collector failed recently.
+        :return:
+            True if nothing is left in the spool.
+        """
+        if self.clock() < self._retry_at:
+            return False
+        for path in self.spool.files():
+            with open(path, "rb") as f:
+                data = f.read()
+            if not self._try(data):
+                return False
+            os.remove(path)
+        return True
+
+
+class EventExporter(object):
+    """
+    Buffers history events and hands them to a sink in compressed batches.
+    """
+    def __init__(self, sink, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, retry_interval=BACKOFF):
+        """
+        :param sink: SpoolSink or HttpSink.
+        :param retry_interval: seconds between checks for spooled batches
+            while no events are recorded.
+        """
+        super(EventExporter, self).__init__()
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.origin = {"host": socket.gethostname(), "user": _user()}
+        # Appending to a deque is atomic, so recording needs no lock.
+        self._buffer = collections.deque(maxlen=MAX_BUFFER)
+        self._wake = threading.Event()
+        self._closed = False
+        # Batch the sink failed to take, as (data, events), and when to
+        # try again.
+        self._unsent = None
+        self._retry_at = 0.0
+        self.backoff = BACKOFF
+        self.batches = 0
+        self.events = 0
+        self.bytes = 0
+        # Sink failures, and events lost to them on close.
+        self.errors = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="export",
+                                        daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_environment(cls, **kwargs):
+        """
+        Returns an exporter configured in the environment, or None.
+        """
+        url = os.environ.get("PYRADAIZ_EXPORT_URL")
+        directory = os.environ.get("PYRADAIZ_EXPORT_DIR")
+        if url:
+            return cls(HttpSink(url, spool_directory=directory), **kwargs)
+        if directory:
+            return cls(SpoolSink(directory), **kwargs)
+        return None
+
+    def on_history_event(self, ts, kind, phase, duration, task, session):
+        """
+        History listener, records one event.
+        """
+        buffer = self._buffer
+        buffer.append((ts, kind, phase, duration, task, session))
+        if len(buffer) == self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            if self._buffer:
+                self._wake.wait(self.flush_interval)
+            else:
+                # Wakes up now and then to resend spooled batches.
+                self._wake.wait(self.retry_interval)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        if not self._closed and time.monotonic() < self._retry_at:
+            return
+        try:
+            self._send_buffer()
+            if not self._closed:
+                self.sink.retry()
+        except OSError:
+            self.errors += 1
+            self._retry_at = time.monotonic() + self.backoff
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+            if self._closed:
+                unsent = self._unsent[1] if self._unsent else 0
+                self.dropped += unsent + len(self._buffer)
+            return
+        self.backoff = BACKOFF
+
+    def _send_buffer(self):
+        buffer = self._buffer
+        while self._unsent or buffer:
+            if self._unsent is None:
+                batch = []
+                while buffer and len(batch) < self.batch_size:
+                    batch.append(buffer.popleft())
+                self._unsent = (encode_batch(batch, self.origin), len(batch))
+            data, events = self._unsent
+            self.sink.send(data)
+            self._unsent = None
+            self.batches += 1
+            self.events += events
+            self.bytes += len(data)
+
+    def close(self):
+        """
+        Sends what's buffered and stops the thread.
+        """
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+
+
+def _user():
+    try:
+        return getpass.getuser()
+    except Exception:
+        return None
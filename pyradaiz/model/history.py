@@ -0,0 +1,391 @@
+"""
+This module contains the session history: an append-only SQLite database of
+phase starts and ends, pauses and resets.
+
+The database runs in WAL mode, so queries never wait for writes. Writes are
+queued and inserted in batches by a background thread; recording an event
+from the GUI thread only puts a tuple on the queue. A batch that fails, e.g.
+while another connection holds a long write transaction, is tried again a
+few times, then logged and dropped; the writer thread keeps running.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+from model.core import PHASE_WORK, EVENT_TAKE_A_BREAK, EVENT_GO_ON, \
+    EVENT_START, EVENT_PAUSE, EVENT_RESET
+from model.utils import get_data_path
+
+__author__ = 'Alen Suljkanovic'
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = "history.sqlite3"
+
+# Event kinds.
+PHASE_START = "phase_start"
+PHASE_END = "phase_end"
+START = "start"
+PAUSE = "pause"
+RESET = "reset"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    phase TEXT,
+    duration REAL,
+    task TEXT,
+    session TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_task_ts ON events (task, ts);
+CREATE INDEX IF NOT EXISTS events_phase_ends
+    ON events (ts, duration, phase, task) WHERE kind = 'phase_end';
+"""
+
+INSERT = "INSERT INTO events (ts, kind, phase, duration, task, session) " \
+         "VALUES (?, ?, ?, ?, ?, ?)"
+
+POMODOROS_PER_TASK = """
+SELECT task, COUNT(*) FROM events
+WHERE ts >= ? AND ts < ? AND kind = 'phase_end' AND phase = 'work'
+GROUP BY task
+"""
+
+POMODOROS_PER_DAY = """
+SELECT date(ts, 'unixepoch', 'localtime') AS day, COUNT(*) FROM events
+WHERE ts >= ? AND ts < ? AND kind = 'phase_end' AND phase = 'work'
+GROUP BY day ORDER BY day
+"""
+
+EVENTS = "SELECT ts, kind, phase, duration, task, session FROM events " \
+         "WHERE ts >= ? AND ts < ? ORDER BY ts"
+
+EVENTS_FOR_TASK = "SELECT ts, kind, phase, duration, task, session " \
+                  "FROM events WHERE task = ? AND ts >= ? AND ts < ? " \
+                  "ORDER BY ts"
+
+# Rows fetched at once when events are streamed.
+FETCH_SIZE = 10000
+
+# Seconds a statement waits for another connection's write transaction.
+BUSY_TIMEOUT = 5.0
+
+# Tries to write a batch, RETRY_DELAY seconds apart, before it's dropped.
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 1.0
+
+# Seconds flush waits for the writer at most.
+FLUSH_TIMEOUT = 30.0
+
+
+def connect(path):
+    """
+    Opens the history database, creating it when needed.
+    """
+    # sqlite3 is imported here, so it's loaded by the writer thread rather
+    # than on the startup path.
+    import sqlite3
+
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class HistoryStore(object):
+    """
+    Records session events and answers queries about them.
+    """
+    def __init__(self, path=None, batch_size=500, flush_interval=1.0):
+        """
+        Initialize store and start the writer thread.
+        :param path: database file, in the per-user data directory by
+            default.
+        :param batch_size: maximum number of events inserted at once.
+        :param flush_interval: seconds an event may wait for others to be
+            inserted with.
+        """
+        super(HistoryStore, self).__init__()
+        if path is None:
+            directory = get_data_path()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, HISTORY_FILE)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Task picked in the tasks table, recorded with every event.
+        self.task = None
+        self.listeners = []
+        self._phase = PHASE_WORK
+        self._phase_started = None
+        # Seconds the current phase ran before its last pause, and when it
+        # was last started; a phase's duration leaves out its pauses.
+        self._phase_active = 0.0
+        self._running_since = None
+        # Events the writer failed to insert.
+        self.dropped = 0
+        self._queue = queue.Queue()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="history",
+                                        daemon=True)
+        self._thread.start()
+
+    def subscribe(self, listener):
+        """
+        Adds a listener called as listener(ts, kind, phase, duration, task,
+        session) for every recorded event, on the recording thread.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def record(self, kind, phase=None, duration=None, task=None,
+               session=None, ts=None):
+        """
+        Queues one event. Returns immediately.
+        :param kind: event kind, e.g. PHASE_END.
+        :param phase: phase the event belongs to.
+        :param duration: phase duration or remaining time in seconds.
+        :param task: task name, the current task by default.
+        :param session: session name.
+        :param ts: UNIX timestamp, now by default.
+        """
+        event = (ts or time.time(), kind, phase, duration, task or self.task,
+                 session)
+        self._queue.put(event)
+        for listener in self.listeners:
+            listener(*event)
+
+    def on_session_event(self, session, event, value):
+        """
+        Session listener that records phase changes, starts, pauses and
+        resets.
+        """
+        if event == EVENT_START:
+            self.start(session)
+            return
+        if event == EVENT_PAUSE:
+            self.pause(session)
+            return
+        if event == EVENT_RESET:
+            self.reset(session)
+            return
+        if event not in (EVENT_TAKE_A_BREAK, EVENT_GO_ON):
+            return
+        now = time.time()
+        duration = None
+        if self._phase_started:
+            duration = self._phase_active
+            if self._running_since is not None:
+                duration += now - self._running_since
+        self.record(PHASE_END, self._phase, duration, session=session.name,
+                    ts=now)
+        self._phase = session.phase
+        self._phase_started = now
+        self._phase_active = 0.0
+        self._running_since = now if session.running else None
+        self.record(PHASE_START, session.phase, value * 60,
+                    session=session.name, ts=now)
+
+    def start(self, session):
+        now = time.time()
+        self._running_since = now
+        if self._phase_started is None:
+            self._phase = session.phase
+            self._phase_started = now
+            self._phase_active = 0.0
+            self.record(PHASE_START, session.phase,
+                        session.timer.remaining(), session=session.name,
+                        ts=now)
+        else:
+            self.record(START, session.phase, session.timer.remaining(),
+                        session=session.name, ts=now)
+
+    def pause(self, session):
+        now = time.time()
+        if self._running_since is not None:
+            self._phase_active += now - self._running_since
+            self._running_since = None
+        self.record(PAUSE, session.phase, session.timer.remaining(),
+                    session=session.name, ts=now)
+
+    def reset(self, session):
+        self.record(RESET, self._phase, session=session.name)
+        self._phase = session.phase
+        self._phase_started = None
+        self._phase_active = 0.0
+        self._running_since = None
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Blocks until every queued event is written, or dropped.
+        :param timeout: seconds to wait at most.
+        :return:
+            False if the writer didn't get there in time, or has stopped.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = time.monotonic() + timeout
+        while not done.wait(0.1):
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                return False
+        return True
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _run(self):
+        import sqlite3
+
+        # Opened here, so the schema, and the indexes of an older history,
+        # are made on this thread.
+        try:
+            db = connect(self.path)
+        except sqlite3.Error as e:
+            logger.error("Opening the history failed: %s", e)
+            db = None
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and \
+                    isinstance(batch[-1], tuple):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            rows = [item for item in batch if isinstance(item, tuple)]
+            if rows:
+                db = self._write(db, rows)
+            for item in batch:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    item.set()
+        if db is not None:
+            db.close()
+
+    def _write(self, db, rows):
+        """
+        Inserts a batch on the writer thread, trying again while the
+        database is locked or can't be opened.
+        :return:
+            the writer's connection, None if it couldn't be opened.
+        """
+        import sqlite3
+
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                if db is None:
+                    db = connect(self.path)
+                with db:
+                    db.executemany(INSERT, rows)
+                return db
+            except sqlite3.OperationalError as e:
+                # Locked, busy, or a passing I/O error.
+                error = e
+                if attempt + 1 < WRITE_ATTEMPTS:
+                    time.sleep(RETRY_DELAY)
+            except sqlite3.Error as e:
+                error = e
+                break
+        self.dropped += len(rows)
+        logger.error("Dropped %d history events: %s", len(rows), error)
+        return db
+
+    def _connection(self):
+        # Connection of the calling threads, guarded by the lock.
+        if self._db is None:
+            self._db = connect(self.path)
+        return self._db
+
+    def query(self, sql, params=()):
+        """
+        Runs a read-only query.
+        :return:
+            list of rows.
+        """
+        with self._db_lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def insert(self, chunks):
+        """
+        Inserts events on the calling thread, e.g. an import, a chunk per
+        transaction. The write lock isn't held while the next chunk is
+        made, so the writer thread's batches get in between. The listeners
+        aren't told about the events. If it fails, the events of the
+        failed chunk aren't inserted.
+        :param chunks: iterable of lists of (ts, kind, phase, duration,
+            task, session) tuples.
+        """
+        for chunk in chunks:
+            with self._db_lock:
+                db = self._connection()
+                # Committed here, rolled back if it fails.
+                with db:
+                    db.executemany(INSERT, chunk)
+
+    def iter_events(self, start=0.0, end=float("inf")):
+        """
+        Yields events between two UNIX timestamps, in time order, reading
+        FETCH_SIZE rows at a time on a connection of its own.
+        """
+        return self.iter_query(EVENTS, (start, end))
+
+    def iter_query(self, sql, params=()):
+        """
+        Yields the rows of a read-only query, reading FETCH_SIZE rows at a
+        time on a connection of its own, so the query holds no lock.
+        """
+        db = connect(self.path)
+        try:
+            cursor = db.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            db.close()
+
+    def pomodoros_per_task(self, start, end):
+        """
+        Returns finished pomodoros per task between two UNIX timestamps.
+        :return:
+            dictionary of task name to count.
+        """
+        return dict(self.query(POMODOROS_PER_TASK, (start, end)))
+
+    def pomodoros_per_day(self, start, end):
+        """
+        Returns finished pomodoros per local day between two timestamps.
+        :return:
+            list of (YYYY-MM-DD, count) tuples.
+        """
+        return self.query(POMODOROS_PER_DAY, (start, end))
+
+    def events(self, start, end, task=None):
+        """
+        Returns events between two UNIX timestamps, in time order.
+        """
+        if task is None:
+            return self.query(EVENTS, (start, end))
+        return self.query(EVENTS_FOR_TASK, (task, start, end))
@@ -0,0 +1,111 @@
+"""
+This module contains the icon cache. SVG icons are rasterised once at the
+toolbar and menu sizes, times the device pixel ratio on HiDPI screens, and
+the PNGs are kept in the per-user cache directory, keyed by the SVG's
+modification time, so later starts don't parse any SVG. Rasters of an older
+SVG or of sizes no longer used are deleted when new ones are made.
+"""
+import math
+import os
+import re
+
+from PyQt5 import QtCore, QtGui
+
+from model.consts import TOOLBAR_ICON_MAX_SIZE, TOOLBAR_ICON_MIN_SIZE, \
+    MENU_ICON_SIZE
+from model.utils import get_cache_path
+
+__author__ = 'Alen Suljkanovic'
+
+ICON_SIZES = (TOOLBAR_ICON_MAX_SIZE, TOOLBAR_ICON_MIN_SIZE, MENU_ICON_SIZE)
+
+RASTER_NAME = re.compile(r"^(.+)-\d+x\d+-\d+\.png$")
+
+_icons = {}
+
+
+def raster_path(path, size):
+    """
+    Returns path of the cached PNG for the given icon and size.
+    :param path: SVG file path.
+    :param size: (width, height) tuple, in pixels.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    mtime = os.stat(path).st_mtime_ns
+    return os.path.join(get_cache_path(), "icons", "%s-%sx%s-%s.png" %
+                        (name, size[0], size[1], mtime))
+
+
+def raster_sizes():
+    """
+    Returns the sizes in pixels to rasterise at: ICON_SIZES, and ICON_SIZES
+    scaled by the highest device pixel ratio of the screens.
+    """
+    app = QtGui.QGuiApplication.instance()
+    ratio = app.devicePixelRatio() if app is not None else 1.0
+    sizes = []
+    for scale in sorted({1.0, ratio}):
+        for width, height in ICON_SIZES:
+            size = (int(math.ceil(width * scale)),
+                    int(math.ceil(height * scale)))
+            if size not in sizes:
+                sizes.append(size)
+    return sizes
+
+
+def prune(path, keep):
+    """
+    Deletes the cached PNGs of the given icon other than keep.
+    :param path: SVG file path.
+    :param keep: paths of the current PNGs.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.join(get_cache_path(), "icons")
+    keep = set(os.path.basename(png) for png in keep)
+    try:
+        files = os.listdir(directory)
+    except OSError:
+        return
+    for file_name in files:
+        match = RASTER_NAME.match(file_name)
+        if match and match.group(1) == name and file_name not in keep:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+
+def get_icon(path):
+    """
+    Returns icon for the given SVG file, made of the cached rasters.
+    Icons are shared, every file is loaded once per process.
+    :param path: SVG file path.
+    :return:
+        QIcon
+    """
+    icon = _icons.get(path)
+    if icon is not None:
+        return icon
+
+    icon = QtGui.QIcon()
+    svg_icon = None
+    pngs = []
+    for size in raster_sizes():
+        try:
+            png = raster_path(path, size)
+        except OSError:
+            return QtGui.QIcon(path)
+        if not os.path.exists(png):
+            if svg_icon is None:
+                svg_icon = QtGui.QIcon(path)
+            os.makedirs(os.path.dirname(png), exist_ok=True)
+            pixmap = svg_icon.pixmap(QtCore.QSize(*size))
+            if not pixmap.save(png, "PNG"):
+                return svg_icon
+        icon.addFile(png, QtCore.QSize(*size))
+        pngs.append(png)
+    if svg_icon is not None:
+        prune(path, pngs)
+
+    _icons[path] = icon
+    return icon
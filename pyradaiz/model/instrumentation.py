@@ -0,0 +1,226 @@
+"""
+This module contains the opt-in instrumentation of the timer: histograms of
+tick jitter and signal delivery latency, a log of phase transitions and a
+rate limited logger. Everything is disabled unless asked for.
+
+    PYRADAIZ_STATS=/tmp/stats.json  collect stats and export them on exit
+    PYRADAIZ_TICK_LOG=1             log every tick, at most a few per second
+
+The histograms are used by the settings and the terminal timer too, so
+json and logging are only imported once something is exported or logged.
+"""
+import bisect
+import collections
+import os
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+# Bucket upper bounds in seconds, from 10 us to 10 s.
+DEFAULT_BOUNDS = tuple(m * 10 ** e for e in range(-5, 1) for m in (1, 2, 5))
+
+# Phase transitions kept in memory.
+PHASE_LOG_SIZE = 1000
+
+
+class Histogram(object):
+    """
+    Histogram with fixed, roughly logarithmic buckets.
+    """
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        # Last bucket holds everything above the highest bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """
+        Returns upper bound of the bucket that holds the given fraction of
+        values, or None if there are no values.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.min,
+                "max": self.max,
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "buckets": dict(zip([str(b) for b in self.bounds] + ["inf"],
+                                    self.counts))}
+
+
+class WakeupCounter(object):
+    """
+    Counts timer wake ups, in total and over the last minute.
+    """
+    def __init__(self, clock=time.monotonic, window=60):
+        super(WakeupCounter, self).__init__()
+        self.clock = clock
+        self.window = window
+        self.total = 0
+        self._times = collections.deque()
+
+    def count(self):
+        now = self.clock()
+        self.total += 1
+        self._times.append(now)
+        self._expire(now)
+
+    def _expire(self, now):
+        while self._times and self._times[0] <= now - self.window:
+            self._times.popleft()
+
+    def per_minute(self):
+        self._expire(self.clock())
+        return len(self._times) * 60.0 / self.window
+
+
+class TickLogger(object):
+    """
+    Logger for the timer thread. When disabled, a call costs one attribute
+    check; when enabled, at most `rate` messages per second are written and
+    the rest are counted.
+    """
+    def __init__(self, enabled=False, rate=5, clock=time.monotonic):
+        super(TickLogger, self).__init__()
+        self.enabled = enabled
+        self.rate = rate
+        self.clock = clock
+        self.suppressed = 0
+        # Made when the first message is written.
+        self._logger = None
+        self._window = 0
+        self._written = 0
+
+    def log(self, msg, *args):
+        if not self.enabled:
+            return
+        if self._logger is None:
+            import logging
+            self._logger = logging.getLogger("pyradaiz.timer")
+        now = int(self.clock())
+        if now != self._window:
+            if self.suppressed:
+                self._logger.debug("%s messages suppressed", self.suppressed)
+                self.suppressed = 0
+            self._window = now
+            self._written = 0
+        if self._written >= self.rate:
+            self.suppressed += 1
+            return
+        self._written += 1
+        self._logger.debug(msg, *args)
+
+
+class Instrumentation(object):
+    """
+    Collects timer stats in memory.
+    """
+    def __init__(self, enabled=False, path=None, log=False,
+                 clock=time.monotonic):
+        """
+        Initialize instrumentation.
+        :param enabled: collect stats.
+        :param path: file the stats are exported to by save.
+        :param log: enable the tick logger.
+        :param clock: function that returns monotonic time in seconds.
+        """
+        super(Instrumentation, self).__init__()
+        self.enabled = enabled
+        self.path = path
+        self.clock = clock
+        self.logger = TickLogger(log, clock=clock)
+        # Wake ups are always counted, it costs next to nothing.
+        self.wakeups = WakeupCounter(clock)
+        self.tick_jitter = Histogram()
+        self.delivery = Histogram()
+        self.phase_counts = collections.Counter()
+        self.phases = collections.deque(maxlen=PHASE_LOG_SIZE)
+        # Functions returning stats of other parts, exported by name.
+        self.sources = {}
+
+    @classmethod
+    def from_environment(cls):
+        path = os.environ.get("PYRADAIZ_STATS")
+        log = bool(os.environ.get("PYRADAIZ_TICK_LOG"))
+        if log:
+            import logging
+            logging.basicConfig(level=logging.DEBUG)
+        return cls(enabled=bool(path), path=path, log=log)
+
+    def record_tick(self, scheduled):
+        """
+        Records how late the timer woke up.
+        :param scheduled: time the timer was supposed to wake up.
+        """
+        if self.enabled:
+            self.tick_jitter.add(max(0.0, self.clock() - scheduled))
+
+    def record_delivery(self, emitted):
+        """
+        Records the time a signal needed to reach the GUI.
+        :param emitted: time the signal was emitted.
+        """
+        if self.enabled:
+            self.delivery.add(max(0.0, self.clock() - emitted))
+
+    def record_phase(self, event, minutes):
+        if self.enabled:
+            self.phase_counts[event] += 1
+            self.phases.append((time.time(), event, minutes))
+
+    def add_source(self, name, function):
+        """
+        Exports what function returns along with the timer stats.
+        """
+        self.sources[name] = function
+
+    def as_dict(self):
+        stats = {"tick_jitter": self.tick_jitter.as_dict(),
+                 "delivery_latency": self.delivery.as_dict(),
+                 "phase_counts": dict(self.phase_counts),
+                 "phases": [{"time": t, "event": e, "minutes": m}
+                            for t, e, m in self.phases],
+                 "wakeups": {"total": self.wakeups.total,
+                             "per_minute": self.wakeups.per_minute()},
+                 "log_suppressed": self.logger.suppressed}
+        for name, function in self.sources.items():
+            stats[name] = function()
+        return stats
+
+    def to_json(self):
+        import json
+        return json.dumps(self.as_dict(), indent=2)
+
+    def save(self, path=None):
+        """
+        Exports collected stats as JSON.
+        """
+        path = path or self.path
+        if self.enabled and path:
+            with open(path, "w") as f:
+                f.write(self.to_json())
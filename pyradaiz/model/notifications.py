@@ -0,0 +1,374 @@
+"""
+This module contains the notification pipeline: phase notices are handed to
+sinks (the tray icon, a sound, a log file, a webhook) by a small pool of
+worker threads, so a slow sink never holds up the GUI thread or the other
+sinks.
+
+Every sink has a short bounded queue. A notice replaces a waiting one with
+the same key, and the oldest notice is dropped when the queue is full.
+Notices that expired, or whose phase is over by the time a worker gets to
+them, are dropped instead of delivered. A sink that times out or fails is
+skipped for a while.
+
+Extra sinks are configured in the environment:
+
+    PYRADAIZ_NOTIFY_LOG=/tmp/notices.log     append notices to a file
+    PYRADAIZ_NOTIFY_SOUND="paplay bell.oga"  run a command per notice
+    PYRADAIZ_NOTIFY_WEBHOOK=http://...       POST notices as JSON
+"""
+import collections
+import json
+import os
+import shlex
+import socket
+import subprocess
+import threading
+import time
+
+from model.instrumentation import Histogram
+
+__author__ = 'Alen Suljkanovic'
+
+# Worker threads shared by all sinks, never more than there are sinks.
+WORKERS = 4
+
+# Notices waiting per sink.
+QUEUE_SIZE = 8
+
+# Seconds a sink may take to deliver a notice.
+SINK_TIMEOUT = 2.0
+
+# Seconds a sink is skipped after it timed out or failed.
+BACKOFF = 30.0
+
+TIMEOUTS = (subprocess.TimeoutExpired, socket.timeout)
+
+
+class Notification(object):
+    """
+    Notice of a phase change.
+    """
+    __slots__ = ("kind", "title", "text", "phase", "key", "created",
+                 "expires")
+
+    def __init__(self, kind, title, text="", phase=None, key=None,
+                 lifetime=None, clock=time.monotonic):
+        """
+        :param kind: session event the notice is about.
+        :param phase: phase the notice announces, it's stale once the
+            session is in another one.
+        :param key: a waiting notice with the same key is replaced,
+            defaults to the kind.
+        :param lifetime: seconds after which the notice is stale.
+        """
+        self.kind = kind
+        self.title = title
+        self.text = text
+        self.phase = phase
+        self.key = kind if key is None else key
+        self.created = clock()
+        self.expires = None if lifetime is None else self.created + lifetime
+
+    def as_dict(self):
+        return {"kind": self.kind, "title": self.title, "text": self.text,
+                "phase": self.phase}
+
+
+class Sink(object):
+    """
+    Base class of notification outputs. Sinks are called from worker
+    threads, one notice at a time.
+    """
+    def __init__(self, name, timeout=SINK_TIMEOUT, queue_size=QUEUE_SIZE):
+        super(Sink, self).__init__()
+        self.name = name
+        self.timeout = timeout
+        self.queue_size = queue_size
+
+    def deliver(self, notification):
+        """
+        Delivers the notice, within self.timeout seconds.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class CallbackSink(Sink):
+    """
+    Calls a function with the notice, e.g. emits a Qt signal that shows it
+    on the GUI thread.
+    """
+    def __init__(self, name, function, **kwargs):
+        super(CallbackSink, self).__init__(name, **kwargs)
+        self.function = function
+
+    def deliver(self, notification):
+        self.function(notification)
+
+
+class LogSink(Sink):
+    """
+    Appends notices to a file, one line each.
+    """
+    def __init__(self, path, **kwargs):
+        super(LogSink, self).__init__("log", **kwargs)
+        self.path = path
+
+    def deliver(self, notification):
+        line = "%s\t%s\t%s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"),
+                                 notification.kind, notification.title)
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+class CommandSink(Sink):
+    """
+    Runs a command per notice, e.g. to play a sound. The command is killed
+    when it runs longer than the timeout.
+    """
+    def __init__(self, command, name="sound", **kwargs):
+        super(CommandSink, self).__init__(name, **kwargs)
+        self.command = shlex.split(command)
+
+    def deliver(self, notification):
+        subprocess.run(self.command, timeout=self.timeout, check=True,
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+
+
+class WebhookSink(Sink):
+    """
+    POSTs notices as JSON.
+    """
+    def __init__(self, url, **kwargs):
+        super(WebhookSink, self).__init__("webhook", **kwargs)
+        self.url = url
+
+    def deliver(self, notification):
+        # Imported here, only a configured webhook needs it.
+        from urllib import request
+        data = json.dumps(notification.as_dict()).encode("utf-8")
+        req = request.Request(self.url, data=data,
+                              headers={"Content-Type": "application/json"})
+        with request.urlopen(req, timeout=self.timeout) as response:
+            response.read()
+
+
+class SinkStats(object):
+    """
+    Counters and latency histograms of one sink. Latency is the time from
+    posting a notice to the sink having delivered it, duration the time the
+    sink took.
+    """
+    def __init__(self):
+        super(SinkStats, self).__init__()
+        self.latency = Histogram()
+        self.duration = Histogram()
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.stale = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def as_dict(self):
+        return {"latency": self.latency.as_dict(),
+                "duration": self.duration.as_dict(),
+                "delivered": self.delivered,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "stale": self.stale,
+                "skipped": self.skipped,
+                "timeouts": self.timeouts,
+                "failures": self.failures}
+
+
+class _SinkState(object):
+    __slots__ = ("sink", "pending", "scheduled", "resume", "stats")
+
+    def __init__(self, sink):
+        self.sink = sink
+        # Waiting notices by key, oldest first.
+        self.pending = collections.OrderedDict()
+        # True while the sink is queued for or held by a worker.
+        self.scheduled = False
+        # Monotonic time until which the sink is skipped.
+        self.resume = 0.0
+        self.stats = SinkStats()
+
+
+class NotificationDispatcher(object):
+    """
+    Hands notices to sinks on worker threads. post never blocks; each sink
+    gets at most one worker at a time, so notices reach a sink in order.
+    """
+    def __init__(self, sinks=(), workers=WORKERS, current_phase=None,
+                 clock=time.monotonic, backoff=BACKOFF):
+        """
+        :param current_phase: function returning the phase the session is
+            in, notices of other phases aren't delivered.
+        """
+        super(NotificationDispatcher, self).__init__()
+        self.clock = clock
+        self.current_phase = current_phase
+        self.backoff = backoff
+        self.sinks = [_SinkState(sink) for sink in sinks]
+        # Sinks with notices waiting for a worker, at most one entry each.
+        self._ready = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.workers = max(1, min(workers, len(self.sinks)))
+        # Started with the first notice.
+        self._workers = []
+
+    @classmethod
+    def from_environment(cls, sinks=(), **kwargs):
+        """
+        Creates a dispatcher for the given sinks and those configured in
+        the environment.
+        """
+        sinks = list(sinks)
+        path = os.environ.get("PYRADAIZ_NOTIFY_LOG")
+        if path:
+            sinks.append(LogSink(path))
+        command = os.environ.get("PYRADAIZ_NOTIFY_SOUND")
+        if command:
+            sinks.append(CommandSink(command))
+        url = os.environ.get("PYRADAIZ_NOTIFY_WEBHOOK")
+        if url:
+            sinks.append(WebhookSink(url))
+        return cls(sinks, **kwargs)
+
+    def post(self, notification):
+        """
+        Queues a notice for every sink.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            if not self._workers:
+                self._start_workers()
+            for state in self.sinks:
+                stats = state.stats
+                if state.resume > notification.created:
+                    stats.skipped += 1
+                    continue
+                pending = state.pending
+                if notification.key in pending:
+                    del pending[notification.key]
+                    stats.coalesced += 1
+                elif len(pending) >= state.sink.queue_size:
+                    pending.popitem(last=False)
+                    stats.dropped += 1
+                pending[notification.key] = notification
+                if not state.scheduled:
+                    state.scheduled = True
+                    self._ready.append(state)
+                    self._cond.notify()
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._run,
+                                      name="pyradaiz-notify-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _is_stale(self, notification, now):
+        if notification.expires is not None and now >= notification.expires:
+            return True
+        if notification.phase is None or self.current_phase is None:
+            return False
+        return self.current_phase() != notification.phase
+
+    def _next(self, state):
+        """
+        Takes the next notice of a sink, dropping stale ones.
+        :return:
+            Notification, or None.
+        """
+        while state.pending:
+            _, notification = state.pending.popitem(last=False)
+            if self._is_stale(notification, self.clock()):
+                state.stats.stale += 1
+            else:
+                return notification
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                state = self._ready.popleft()
+                notification = self._next(state)
+                if notification is None:
+                    state.scheduled = False
+                    continue
+            self._deliver(state, notification)
+            with self._cond:
+                if state.pending and not self._closed:
+                    self._ready.append(state)
+                    self._cond.notify()
+                else:
+                    state.scheduled = False
+
+    def _deliver(self, state, notification):
+        sink = state.sink
+        stats = state.stats
+        started = self.clock()
+        failed = False
+        try:
+            sink.deliver(notification)
+        except Exception as ex:
+            failed = True
+            # urllib wraps the socket's timeout.
+            if isinstance(ex, TIMEOUTS) or \
+                    isinstance(getattr(ex, "reason", None), TIMEOUTS):
+                stats.timeouts += 1
+            else:
+                stats.failures += 1
+        finished = self.clock()
+        with self._cond:
+            stats.duration.add(finished - started)
+            if finished - started > sink.timeout and not failed:
+                # The sink didn't enforce its timeout.
+                stats.timeouts += 1
+                failed = True
+            if failed:
+                state.resume = finished + self.backoff
+                stats.skipped += len(state.pending)
+                state.pending.clear()
+            else:
+                stats.delivered += 1
+                stats.latency.add(finished - notification.created)
+
+    def stats(self):
+        """
+        Returns stats of every sink by name.
+        """
+        with self._cond:
+            return {state.sink.name: state.stats.as_dict()
+                    for state in self.sinks}
+
+    def close(self, timeout=1.0):
+        """
+        Stops the workers; waiting notices are dropped. Waits up to timeout
+        seconds for the notices being delivered.
+        """
+        with self._cond:
+            self._closed = True
+            for state in self.sinks:
+                state.pending.clear()
+            self._ready.clear()
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        for state in self.sinks:
+            state.sink.close()
@@ -0,0 +1,42 @@
+"""
+This module contains the startup profiler. It only depends on the standard
+library, so it can be imported before Qt to time the imports as well.
+"""
+import sys
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+
+class StartupProfiler(object):
+    """
+    Records how long each startup phase took.
+    """
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        super(StartupProfiler, self).__init__()
+        self.enabled = enabled
+        self.clock = clock
+        self.started = clock()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        """
+        Ends the phase that started with the previous mark.
+        :param phase: phase name.
+        """
+        if self.enabled:
+            now = self.clock()
+            self.phases.append((phase, now - self.last))
+            self.last = now
+
+    def report(self, stream=sys.stderr):
+        """
+        Prints per-phase timing breakdown.
+        """
+        if not self.enabled:
+            return
+        for phase, duration in self.phases:
+            stream.write("%-20s %8.1f ms\n" % (phase, duration * 1000))
+        stream.write("%-20s %8.1f ms\n" % ("total",
+                                            (self.last - self.started) * 1000))
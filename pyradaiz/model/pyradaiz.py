@@ -1,191 +1,266 @@
-import os
-from xml.etree.ElementTree import ElementTree, Element, SubElement
+import itertools
+import logging
+import threading
+import time
 from PyQt5 import QtWidgets, QtCore, QtGui
 from model.actions import StartAction, StopAction, QuitAction, \
-    ResetAction, SettingsAction, TasksAction, AboutAction, ChangeUI
-from model.consts import SHORT_BREAK, POMODORO_DURATION,\
-    GO_ON, TAKE_A_BREAK, LONG_BREAK, LOGO_IMAGE, ALWAYS_ON_TOP_NO, \
+    ResetAction, SettingsAction, TasksAction, AboutAction, ChangeUI, \
+    TrayOnlyAction, ProfileAction
+from model.consts import GO_ON, TAKE_A_BREAK, LOGO_IMAGE, \
     ALWAYS_ON_TOP_YES, TOOLBAR_ICON_MAX_SIZE, TOOLBAR_ICON_MIN_SIZE
-from model.utils import get_root_path
+from model.clock import SYSTEM_CLOCK
+from model.config_watcher import ConfigWatcher
+from model.core import PomodoroSession, SessionRunner, EVENT_TICK, \
+    EVENT_TAKE_A_BREAK, EVENT_GO_ON, PHASE_WORK, PHASE_SHORT_BREAK
+from model.export import EventExporter
+from model.history import HistoryStore
+from model.instrumentation import Instrumentation
+from model.notifications import NotificationDispatcher, Notification, \
+    CallbackSink
+from model.profiling import StartupProfiler
+from model.settings import PyradaizSettings
+from model.tasks import TaskStore
+from model.timer import DeadlineTimer
+from model.utils import time_str, rss_mb, release_memory
+from model.watchdog import StallWatchdog
 
+logger = logging.getLogger(__name__)
 
-def time_str(minutes, seconds):
-    """
-    Creates string from minutes and seconds in following format: mm:ss.
-    :param minutes: current minute
-    :param seconds: current second
-    :return:
-        string
-    """
-    disp_mins = "0%s" % minutes if minutes < 10  else minutes
-    disp_secs = "0%s" % seconds if seconds < 10 else seconds
+# Files tasks and history are imported from and exported to.
+TRANSFER_FILES = "CSV or JSON Lines (*.csv *.jsonl *.csv.gz *.jsonl.gz);;" \
+                 "All files (*)"
 
-    time = "{0}:{1}".format(disp_mins, disp_secs)
-    return time
+# Lines of an import report shown, the summary and the first errors.
+TRANSFER_REPORT_LINES = 11
 
+# Milliseconds to wait for more session changes before saving the state.
+SESSION_SAVE_DELAY = 500
 
-class Task(object):
-    """
-    Class that describes one PyModoro task.
-    """
+# Milliseconds after start up the control endpoint is opened.
+CONTROL_DELAY = 500
 
-    def __init__(self, name, description):
-        """Initialize task object"""
-        self.name = name
-        self.description = description
-        self.counter = 0
-        self.finished = False
+# Tasks indexed for the filter box per turn of the event loop, about 20 ms
+# of work.
+TASK_INDEX_BATCH = 1000
 
 
-class PyradaizSettings(object):
+class PyradaizThread(QtCore.QThread):
     """
-    Settings object. Contains information about pomodoro duration, short break
-    duration and long break duration.
+    Long-lived thread that runs the pomodoro session and forwards its events
+    to the GUI as Qt signals.
+
+    The session is only touched by this thread, which runs it with a
+    SessionRunner. Other threads send it commands, e.g. start_session or
+    pause_session, which are queued and run by the thread as soon as it
+    wakes up; after every batch of commands the thread publishes a
+    SessionState copy in state and state_changed.
     """
-    def __init__(self, parent):
-        super(PyradaizSettings, self).__init__()
+    # New SessionState, emitted after commands.
+    state_changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent, update_signal, take_a_break_signal,
+                 go_on_signal, clock=SYSTEM_CLOCK):
+        """
+        :param clock: SystemClock, or a VirtualClock to run the thread loop
+            in simulated time.
+        """
+        super(PyradaizThread, self).__init__()
         self.parent = parent
-        self.file_path = None
-        # Default settings...
-        self._pomodoro_duration = POMODORO_DURATION
-        self.short_break = SHORT_BREAK
-        self.long_break = LONG_BREAK
-        self._always_on_top = ALWAYS_ON_TOP_NO
+        self.update_signal = update_signal
+        self.take_a_break_signal = take_a_break_signal
+        self.go_on_signal = go_on_signal
+        self.stats = self.parent.stats
+        self.clock = clock
 
-    def save(self):
+        settings = self.parent.settings
+        self.session = PomodoroSession(settings.pomodoro_duration,
+                                       settings.short_break,
+                                       settings.long_break,
+                                       clock=clock.monotonic,
+                                       wall_clock=clock.time)
+        self.session.subscribe(self.on_session_event)
+        self.runner = SessionRunner(self.session, clock,
+                                    on_state=self.state_changed.emit,
+                                    on_wakeup=self.on_wakeup)
+
+    def submit(self, function, *args):
         """
-        Saves settings into the file.
+        Queues a call to be run by the thread. Returns immediately.
         """
-        file_path = os.path.join(get_root_path(), "config.xml")
-        root = Element("config")
-        tree = ElementTree(root)
+        self.runner.submit(function, *args)
 
-        pomodoro_duration = SubElement(root, "pomodoro_duration")
-        pomodoro_duration.text = "%s" % self.pomodoro_duration
+    def start_session(self):
+        self.submit(self.session.start)
 
-        short_break = SubElement(root, "short_break")
-        short_break.text = "%s" % self.short_break
+    def pause_session(self):
+        self.submit(self.session.pause)
 
-        long_break = SubElement(root, "long_break")
-        long_break.text = "%s" % self.long_break
+    def reset_session(self):
+        self.submit(self.session.reset)
 
-        always_on_top = SubElement(root, "always_on_top")
-        always_on_top.text = self.always_on_top
+    def configure(self, pomodoro_duration, short_break, long_break):
+        self.submit(self.session.configure, pomodoro_duration, short_break,
+                    long_break)
 
-        tree.write(file_path)
+    def restore(self, elapsed):
+        self.submit(self.session.restore, elapsed)
 
-    def load(self):
+    def restore_anchor(self, anchor):
+        self.submit(self.session.restore_anchor, anchor)
+
+    def set_low_power(self, enabled):
         """
-        Loads settings from .xml file.
+        In low power mode the thread stops updating the display and sleeps
+        until the next phase boundary.
         """
-        file_path = os.path.join(get_root_path(), "config.xml")
-        try:
-            with open(file_path) as f:
-                tree = ElementTree()
-                tree.parse(f)
-                root = tree.getroot()
-
-                self.pomodoro_duration = int(root.find("pomodoro_duration").text)
-                self.short_break = int(root.find("short_break").text)
-                self.long_break = int(root.find("long_break").text)
-                self.always_on_top = root.find("always_on_top").text
-        except FileNotFoundError:
-            pass
+        self.submit(setattr, self.session, "ticks", not enabled)
 
-    @property
-    def pomodoro_duration(self):
-        return self._pomodoro_duration
+    def stop(self):
+        """
+        Asks the thread to finish and waits for it.
+        """
+        self.submit(None)
+        self.wait()
 
-    @pomodoro_duration.setter
-    def pomodoro_duration(self, duration):
-        self._pomodoro_duration = duration
-        self.parent.minutes = duration
+    def on_session_event(self, session, event, value):
+        """
+        Emits the signal that matches the session event.
+        """
+        if event == EVENT_TICK:
+            self.stats.logger.log("Update display: %s", value)
+            self.update_signal.emit(value, self.stats.clock())
+            return
+
+        if event == EVENT_TAKE_A_BREAK:
+            self.stats.record_phase(event, value)
+            self.take_a_break_signal.emit("%s" % value)
+        elif event == EVENT_GO_ON:
+            self.stats.record_phase(event, value)
+            self.go_on_signal.emit("go_on")
+
+    def on_wakeup(self, scheduled):
+        self.stats.wakeups.count()
+        self.stats.record_tick(scheduled)
+
+    def run(self):
+        """
+        Runs commands and the counter until stopped.
+        """
+        self.runner.run()
 
     @property
-    def always_on_top(self):
-        return self._always_on_top
+    def state(self):
+        """
+        Returns the SessionState published last.
+        """
+        return self.runner.state
 
-    @always_on_top.setter
-    def always_on_top(self, value):
-        self._always_on_top = value
+    @property
+    def pomodoro_cnt(self):
+        return self.state.pomodoro_cnt
 
-        if value == ALWAYS_ON_TOP_YES:
-            self.parent.setWindowFlags(self.parent.windowFlags()
-                                       | QtCore.Qt.WindowStaysOnTopHint)
-        else:
-            self.parent.setWindowFlags(self.parent.windowFlags()
-                                       & ~QtCore.Qt.WindowStaysOnTopHint)
-        # Show must be called after the window flags are changed.
-        self.parent.show()
+    @property
+    def time(self):
+        """
+        Returns current time as mm:ss string.
+        """
+        return self.state.time
 
 
-class PyradaizThread(QtCore.QThread):
+class RemoteTimer(QtCore.QObject):
     """
-    Thread that modifies the counter and gives notifications about breaks.
+    Stands in for PyradaizThread in an instance that views the timer of
+    another one. Commands are sent to the owner; the state is read from the
+    shared block when the owner rings, and the display counts down from the
+    shared deadline in between. When the owner goes away, owner_gone is
+    emitted and the timer stops.
     """
-    # update_display = QtCore.pyqtSignal(['QString'])
-    def __init__(self, parent, update_signal, take_a_break_signal,
-                 go_on_signal):
-        super(PyradaizThread, self).__init__()
-        self.parent = parent
+    state_changed = QtCore.pyqtSignal(object)
+    owner_gone = QtCore.pyqtSignal()
+
+    def __init__(self, parent, update_signal, instance):
+        super(RemoteTimer, self).__init__(parent)
         self.update_signal = update_signal
-        self.take_a_break_signal = take_a_break_signal
-        self.go_on_signal = go_on_signal
-        self.minutes = self.parent.minutes
-        self.seconds = self.parent.seconds
+        self.instance = instance
+        self.stats = parent.stats
+        self.ticks = True
+        self.timer = DeadlineTimer()
+        self.tick_timer = QtCore.QTimer(self)
+        self.tick_timer.setSingleShot(True)
+        self.tick_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.tick_timer.timeout.connect(self.tick)
+        self.notifier = QtCore.QSocketNotifier(
+            instance.client.fileno(), QtCore.QSocketNotifier.Read, self)
+        self.notifier.activated.connect(self.on_ring)
+        self.state = instance.state.read()
 
-        settings = self.parent.settings
-        self.short_break = settings.short_break
-        self.long_break = settings.long_break
-        self.pomodoro_cnt = 0
-        # Shows if it's time to notify about the break or not.
-        self._break = False
+    def start(self):
+        self.on_ring()
 
-    def run(self):
+    def stop(self):
+        self.tick_timer.stop()
+        self.notifier.setEnabled(False)
+
+    def on_ring(self):
         """
-        Runs counter.
-        """
-        # Loop until one pomodoro session + following break are over.
-        while self.minutes >= 0 and self.seconds >= 0:
-            print("Running thread...")
-            self.seconds -= 1
-            if self.seconds < 0:
-                self.seconds = 59
-                self.minutes -= 1
-
-            if self.minutes == 0 and self.seconds == 0:
-                if not self._break:
-                    self.pomodoro_cnt += 1
-                    # Take a long break after third pomodoro session...
-                    if self.pomodoro_cnt % 3 != 0:
-                        self.minutes = self.short_break
-                    else:
-                        self.minutes = self.long_break
-
-                    # self.emit(QtCore.SIGNAL("take_a_break(QString)"),
-                    #           "%s" % self.minutes)
-                    self.take_a_break_signal.emit(self.minutes)
-                else:
-                    self.minutes = POMODORO_DURATION
-                    # self.emit(QtCore.SIGNAL("go_on(QString)"), "go_on")
-                    self.go_on_signal.emit(self.minutes)
-
-                self._break = not self._break
-
-            print("Update display...")
-            print(self.time)
-            self.update_signal.emit(self.time)
-            # self.emit(QtCore.SIGNAL("update_display(QString)"), self.time)
-            # This ensures that the display is updated every second.
-            self.sleep(1)
+        Takes over the state the owner published.
+        """
+        if not self.instance.client.drain():
+            self.lose_owner()
+            return
+        self.state = self.instance.state.read()
+        if self.state.running:
+            self.timer.deadline = self.state.deadline
+        else:
+            self.timer.reset(self.state.remaining)
+        self.state_changed.emit(self.state)
+        self.tick()
 
-    @property
-    def time(self):
+    def tick(self):
         """
-        Returns current time in minutes and seconds, as a tuple.
-        :return tuple
+        Updates the display and waits for the next whole second.
         """
-        return time_str(self.minutes, self.seconds)
+        remaining = self.timer.remaining_seconds()
+        self.update_signal.emit(time_str(*divmod(remaining, 60)),
+                                self.stats.clock())
+        if self.ticks and self.timer.running and remaining:
+            self.tick_timer.start(int(self.timer.next_tick() * 1000) + 1)
+
+    def lose_owner(self):
+        if self.notifier.isEnabled():
+            self.stop()
+            self.owner_gone.emit()
+
+    def send(self, command, *args):
+        if not self.instance.client.send(command, *args):
+            self.lose_owner()
+
+    def start_session(self):
+        self.send("start")
+
+    def pause_session(self):
+        self.send("pause")
+
+    def reset_session(self):
+        self.send("reset")
+
+    def configure(self, pomodoro_duration, short_break, long_break):
+        self.send("configure", pomodoro_duration, short_break, long_break)
+
+    def set_low_power(self, enabled):
+        self.ticks = not enabled
+        if enabled:
+            self.tick_timer.stop()
+        else:
+            self.tick()
+
+    @property
+    def pomodoro_cnt(self):
+        return self.state.pomodoro_cnt
+
+    @property
+    def time(self):
+        return self.state.time
 
 
 class PyradaizGui(QtWidgets.QMainWindow):
@@ -194,51 +269,79 @@ class PyradaizGui(QtWidgets.QMainWindow):
     """
 
     # Signal definitions...
-    update_display = QtCore.pyqtSignal(['QString'])
+    # Time to display and the moment it was emitted.
+    update_display = QtCore.pyqtSignal('QString', float)
     take_a_break = QtCore.pyqtSignal(['QString'])
     go_on = QtCore.pyqtSignal(['QString'])
+    # Notification to show in the tray, emitted by a notification worker.
+    tray_notice = QtCore.pyqtSignal(object)
+    # Command sent to the control endpoint, emitted by its thread.
+    control_command = QtCore.pyqtSignal('QString')
+    # Chunk of imported tasks and the semaphore it holds a slot of, and the
+    # kind and report of a finished import or export; emitted by the
+    # transfer thread.
+    tasks_chunk = QtCore.pyqtSignal(object, object)
+    transfer_done = QtCore.pyqtSignal('QString', 'QString')
+    # Rollups loaded by the statistics thread, None without NumPy.
+    statistics_ready = QtCore.pyqtSignal(object)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, profiler=None, instance=None, **kwargs):
+        """
+        :param profiler: StartupProfiler to report to.
+        :param instance: shared Instance, if other pyradaiz instances view
+            this one's timer or this one views another's.
+        """
         super(PyradaizGui, self).__init__(*args, **kwargs)
-        main_layout = QtWidgets.QVBoxLayout()
+        self.profiler = profiler or StartupProfiler()
+        self.instance = instance
+        # False in a view of another instance's timer.
+        self.owns_timer = instance is None or instance.owner
         self.slim_view = False
+        # True while only the tray icon is left, see enter_tray_only.
+        self.tray_only = False
+        self.tray_report = {}
 
         self.setWindowTitle("Pyradaiz")
- 
-        self.lcd = QtWidgets.QLCDNumber(self)
 
         self.tasks = []
         self.running = False
-        self.settings = PyradaizSettings(self)
+        # Loading the settings may show the window before the timer thread
+        # exists.
+        self.timer_thread = None
+        self.stats = Instrumentation.from_environment()
+        self.watchdog = StallWatchdog.from_environment()
+        if self.watchdog is not None:
+            self.stats.add_source("watchdog", self.watchdog.as_dict)
+            self.heartbeat = QtCore.QTimer(self)
+            self.heartbeat.setInterval(int(self.watchdog.interval * 1000))
+            self.heartbeat.timeout.connect(self.watchdog.beat)
+            self.heartbeat.start()
+            # Watching starts with the event loop.
+            QtCore.QTimer.singleShot(0, self.watchdog.start)
+        self.settings = PyradaizSettings()
+        self.settings.subscribe(self.on_settings_changed)
+        self.stats.add_source("settings_apply",
+                              self.settings.apply_time.as_dict)
+        self.stats.add_source("tray_only", lambda: dict(self.tray_report))
         self.settings.load()
+        # Changes pushed to the settings file apply while running.
+        self.config_watcher = ConfigWatcher(self.settings, self)
+        self.stats.add_source("config_reload", self.config_watcher.as_dict)
         self.minutes = self.settings.pomodoro_duration
         self.seconds = 0
-
-        init_time = time_str(self.minutes, self.seconds)
-        self.lcd.setDigitCount(len(init_time))
-        self.lcd.display(init_time)
-
-        main_layout.addWidget(self.lcd)
+        self.profiler.mark("settings")
 
         self.shown = False
+        # The tasks table is hidden at start, it's created when needed.
+        self.tasks = None
+        self.task_model = None
+        self.task_index = None
+        self.index_timer = None
+        self.task_store = TaskStore()
 
-        self.tasks = QtWidgets.QTableWidget()
-        self.tasks.setAlternatingRowColors(True)
-        self.tasks.setColumnCount(1)
-        self.tasks.setVisible(self.shown)
-
-        header = self.tasks.horizontalHeader()
-        # header.setResizeMode(0, QtWidgets.QHeaderView.Stretch)
-        header.setVisible(False)
-
-        main_layout.addWidget(self.tasks)
-
-        central_widget = QtWidgets.QWidget()
- 
-        self.setCentralWidget(central_widget)
- 
-        central_widget.setLayout(main_layout)
+        self.create_central_widget(time_str(self.minutes, self.seconds))
         self.setGeometry(300, 300, 280, 130)
+        self.profiler.mark("window")
 
         self.tray_icon = QtWidgets.QSystemTrayIcon(self)
         self.logo = QtGui.QIcon()
@@ -246,19 +349,581 @@ class PyradaizGui(QtWidgets.QMainWindow):
                        QtGui.QIcon.Normal,
                        QtGui.QIcon.Off)
         self.tray_icon.setIcon(self.logo)
+        self.tray_icon.activated.connect(self.on_tray_activated)
         self.tray_icon.show()
 
         self.setWindowIcon(self.logo)
+        self.profiler.mark("tray icon")
 
-        self.timer_thread = PyradaizThread(self, self.update_display,
-                                           self.take_a_break, self.go_on)
+        self.history = HistoryStore()
+        # Statistics are loaded from the history when first shown, see
+        # load_statistics.
+        self.rollups = None
+        self.statistics_callbacks = None
+        self.exporter = None
+        self.create_timer()
         self.update_display.connect(self.update)
         self.take_a_break.connect(self.show_message)
         self.go_on.connect(self.show_message)
+        # Sinks run on worker threads; the tray sink only queues the notice
+        # for the GUI thread.
+        self.tray_notice.connect(self.show_notice)
+        self.tasks_chunk.connect(self.on_tasks_chunk)
+        self.transfer_done.connect(self.on_transfer_done)
+        self.statistics_ready.connect(self.on_statistics_ready)
+        self.notifier = NotificationDispatcher.from_environment(
+            [CallbackSink("tray", self.tray_notice.emit)],
+            current_phase=self.current_phase if self.owns_timer else None)
+        self.stats.add_source("notifications", self.notifier.stats)
+        # Saves of the session state are coalesced, so quick start/stop
+        # clicks are written once.
+        self.session_timer = QtCore.QTimer(self)
+        self.session_timer.setSingleShot(True)
+        self.session_timer.setInterval(SESSION_SAVE_DELAY)
+        self.session_timer.timeout.connect(self.save_session)
+        self.timer_thread.start()
+        self.profiler.mark("timer thread")
 
         self.create_actions()
+        self.profiler.mark("actions")
         self.create_toolbar()
+        self.profiler.mark("toolbar")
         self.create_context_menu()
+        self.profiler.mark("context menu")
+        self.control = None
+        # The control endpoint is opened once the window is up, it isn't
+        # needed before.
+        self.control_timer = QtCore.QTimer(self)
+        self.control_timer.setSingleShot(True)
+        self.control_timer.setInterval(CONTROL_DELAY)
+        self.control_timer.timeout.connect(self.start_control)
+        if self.owns_timer:
+            self.control_timer.start()
+        self.restore_session()
+
+        if self.profiler.enabled:
+            self.lcd.installEventFilter(self)
+
+    def create_timer(self):
+        """
+        Creates the timer thread, or the view of another instance's timer.
+        """
+        instance = self.instance
+        if self.owns_timer:
+            self.timer_thread = PyradaizThread(self, self.update_display,
+                                               self.take_a_break,
+                                               self.go_on)
+            self.timer_thread.session.subscribe(
+                self.history.on_session_event)
+            # The exporter sees what the history records: phase changes,
+            # starts, pauses and resets.
+            self.exporter = EventExporter.from_environment()
+            if self.exporter is not None:
+                self.history.subscribe(self.exporter.on_history_event)
+        else:
+            # The owner records the history and shows the messages.
+            self.timer_thread = RemoteTimer(self, self.update_display,
+                                            instance)
+            self.timer_thread.owner_gone.connect(self.on_owner_gone)
+        if instance is not None and instance.owner:
+            self.view_notifiers = {}
+            self.doorbell_notifier = QtCore.QSocketNotifier(
+                instance.doorbell.fileno(), QtCore.QSocketNotifier.Read,
+                self)
+            self.doorbell_notifier.activated.connect(self.accept_view)
+            instance.state.write(self.timer_thread.state)
+        self.timer_thread.state_changed.connect(self.on_state)
+
+    def on_owner_gone(self):
+        """
+        Claims the timer again after the instance this one viewed quit:
+        the first view to claim it owns it from then on and goes on from
+        the state last shared, the others view that one. Without shared
+        state this instance runs a timer of its own.
+        """
+        view = self.timer_thread
+        state = view.state
+        view.owner_gone.disconnect(self.on_owner_gone)
+        view.state_changed.disconnect(self.on_state)
+        view.deleteLater()
+        self.instance.close()
+        from model.shared import Instance
+        self.instance = Instance.claim()
+        self.owns_timer = self.instance is None or self.instance.owner
+        self.create_timer()
+        self.timer_thread.start()
+        if not self.owns_timer:
+            logger.info("Viewing the timer of another instance")
+            return
+        logger.info("The owner of the timer quit, taking it over")
+        self.notifier.current_phase = self.current_phase
+        session = self.timer_thread.session
+        if state.running and state.anchor is not None:
+            self.timer_thread.restore_anchor(state.anchor)
+        else:
+            self.timer_thread.restore(session.plan.elapsed(
+                state.pomodoro_cnt, state.phase, state.remaining))
+        self.control_timer.start()
+
+    def stop_timer(self):
+        """
+        Stops the timer thread, or the view of another instance's timer.
+        """
+        self.timer_thread.stop()
+
+    def close_shared(self):
+        """
+        Closes the exporter and lets go of the shared state, on quit.
+        """
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.instance is not None:
+            self.instance.close()
+
+    def create_central_widget(self, time):
+        """
+        Creates the counter.
+        :param time: time to display.
+        """
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.lcd = QtWidgets.QLCDNumber(self)
+        self.lcd.setDigitCount(len(time))
+        self.lcd.display(time)
+        self.main_layout.addWidget(self.lcd)
+
+        central_widget = QtWidgets.QWidget()
+        self.setCentralWidget(central_widget)
+        central_widget.setLayout(self.main_layout)
+
+    def enter_tray_only(self):
+        """
+        Leaves only the tray icon: the widgets of the window are deleted,
+        its native window destroyed and freed memory handed back to the
+        system. The timer keeps running.
+        """
+        if self.tray_only:
+            return
+        before = rss_mb()
+        started = time.perf_counter()
+        self.tray_only = True
+        self.tray_only_action.setChecked(True)
+        self.saved_geometry = self.saveGeometry()
+        # Closing a dialog opened from the tray would otherwise quit.
+        QtWidgets.QApplication.setQuitOnLastWindowClosed(False)
+        self.hide()
+        self.set_low_power(True)
+        if self.lcd is not None:
+            self.lcd.removeEventFilter(self)
+        self.removeToolBar(self.toolbar)
+        self.toolbar.deleteLater()
+        self.toolbar = None
+        if self.task_model is not None:
+            # A rebuilt panel subscribes new ones.
+            self.task_store.unsubscribe(self.task_model.on_store_changed)
+            self.task_store.unsubscribe(self.task_index.on_store_changed)
+            self.index_timer.stop()
+        # The tasks panel is part of the central widget.
+        self.takeCentralWidget().deleteLater()
+        self.lcd = None
+        self.main_layout = None
+        self.tasks = None
+        self.task_model = None
+        self.tasks_view = None
+        self.task_filter = None
+        self.task_index = None
+        self.index_timer = None
+        self.destroy()
+        QtWidgets.QApplication.sendPostedEvents(
+            None, QtCore.QEvent.DeferredDelete)
+        QtGui.QPixmapCache.clear()
+        release_memory()
+        self.tray_report = {"rss_before_mb": before, "rss_after_mb": rss_mb(),
+                            "teardown_ms":
+                                (time.perf_counter() - started) * 1000}
+        logger.info("Tray only: %.1f MB -> %.1f MB",
+                    before, self.tray_report["rss_after_mb"])
+
+    def leave_tray_only(self):
+        """
+        Rebuilds and shows the window.
+        """
+        if not self.tray_only:
+            self.show()
+            self.activateWindow()
+            return
+        started = time.perf_counter()
+        self.tray_only = False
+        self.tray_only_action.setChecked(False)
+        QtWidgets.QApplication.setQuitOnLastWindowClosed(True)
+        self.create_central_widget(self.timer_thread.state.time)
+        self.create_toolbar()
+        if self.slim_view:
+            self.slim_view = False
+            self.toggle_ui()
+        self.shown = False
+        self.restoreGeometry(self.saved_geometry)
+        self.show()
+        self.activateWindow()
+        self.tray_report["rebuild_ms"] = (time.perf_counter() - started) * 1000
+        self.tray_report["rss_rebuilt_mb"] = rss_mb()
+        logger.info("Window rebuilt in %.1f ms",
+                    self.tray_report["rebuild_ms"])
+
+    def toggle_tray_only(self):
+        if self.tray_only:
+            self.leave_tray_only()
+        else:
+            self.enter_tray_only()
+
+    def on_tray_activated(self, reason):
+        """
+        Shows the window when the tray icon is clicked.
+        """
+        if reason == QtWidgets.QSystemTrayIcon.Trigger:
+            self.leave_tray_only()
+
+    def on_state(self, state):
+        """
+        Takes over the session state published by the timer thread.
+        :param state: SessionState
+        """
+        self.running = state.running
+        self.minutes, self.seconds = divmod(state.remaining, 60)
+        if self.lcd is not None:
+            self.lcd.display(state.time)
+        if not self.owns_timer:
+            return
+        if self.instance is not None:
+            self.instance.state.write(state)
+            self.instance.doorbell.ring()
+        if self.control is not None:
+            self.control.publish(state)
+        self.session_timer.start()
+
+    def start_control(self):
+        """
+        Opens the control endpoint for scripts and other programs.
+        """
+        try:
+            from model.control import ControlServer, control_path
+            self.control = ControlServer(control_path(),
+                                         self.control_command.emit)
+        except (ImportError, AttributeError, OSError):
+            # No Unix sockets, or the path can't be bound.
+            return
+        self.control_command.connect(self.on_control_command)
+        self.control.publish(self.timer_thread.state)
+        self.control.start()
+
+    def stop_control(self):
+        self.control_timer.stop()
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+
+    def on_control_command(self, command):
+        """
+        Runs a command sent to the control endpoint, as if it was clicked.
+        """
+        action = {"start": self.start_action,
+                  "stop": self.stop_action,
+                  "reset": self.reset_action}.get(command)
+        if action is not None:
+            action.trigger()
+
+    def accept_view(self):
+        """
+        Lets another instance view the timer.
+        """
+        view = self.instance.doorbell.accept()
+        if view is None:
+            return
+        notifier = QtCore.QSocketNotifier(view.fileno(),
+                                          QtCore.QSocketNotifier.Read, self)
+        notifier.activated.connect(self.on_view_commands)
+        self.view_notifiers[view.fileno()] = notifier
+
+    def on_view_commands(self, fd):
+        """
+        Runs the commands a view sent, as if they were clicked here.
+        """
+        commands = self.instance.doorbell.read_commands(fd)
+        if commands is None:
+            self.view_notifiers.pop(fd).setEnabled(False)
+            return
+        for command in commands:
+            name, _, args = command.partition(" ")
+            if name == "start":
+                self.timer_thread.start_session()
+            elif name == "pause":
+                self.timer_thread.pause_session()
+            elif name == "reset":
+                self.timer_thread.reset_session()
+            elif name == "configure":
+                try:
+                    self.timer_thread.configure(*map(int, args.split()))
+                except (TypeError, ValueError):
+                    pass
+
+    def save_session(self):
+        """
+        Saves where the timer is, so a restart picks up from there.
+        """
+        self.session_timer.stop()
+        if not self.owns_timer:
+            return
+        state = self.timer_thread.state
+        if state.running:
+            values = {"anchor": state.anchor}
+        else:
+            values = {"elapsed": state.elapsed}
+        self.settings.store.save_session(values)
+
+    def restore_session(self):
+        """
+        Puts the timer where it was saved. A session that was running jumps
+        to where it would be now and keeps running.
+        """
+        if not self.owns_timer:
+            return
+        state = self.settings.store.load_session()
+        if state.get("anchor") is not None:
+            self.timer_thread.restore_anchor(state["anchor"])
+        elif state.get("elapsed"):
+            self.timer_thread.restore(state["elapsed"])
+
+    def statistics(self):
+        """
+        Returns productivity rollups, or None until they're loaded, see
+        load_statistics. Once loaded they're updated as phases finish.
+        """
+        return self.rollups
+
+    def load_statistics(self, callback=None):
+        """
+        Loads the rollups from the history on a thread of its own, unless
+        they're loaded, and calls callback(rollups) on the GUI thread once
+        they are. Rollups are None without NumPy.
+        """
+        if self.rollups is not None:
+            if callback is not None:
+                callback(self.rollups)
+            return
+        if self.statistics_callbacks is None:
+            self.statistics_callbacks = []
+            threading.Thread(target=self._load_statistics, name="statistics",
+                             daemon=True).start()
+        if callback is not None and callback not in self.statistics_callbacks:
+            self.statistics_callbacks.append(callback)
+
+    def _load_statistics(self):
+        try:
+            from model.stats import Rollups
+        except ImportError:
+            # Statistics need NumPy.
+            rollups = None
+        else:
+            try:
+                rollups = Rollups.from_history(self.history)
+            except Exception:
+                logger.exception("Loading the statistics failed")
+                rollups = None
+        self.statistics_ready.emit(rollups)
+
+    def on_statistics_ready(self, rollups):
+        self.rollups = rollups
+        callbacks, self.statistics_callbacks = self.statistics_callbacks, None
+        for callback in callbacks:
+            callback(rollups)
+
+    def toggle_tasks(self):
+        """
+        Shows or hides the tasks table.
+        """
+        self.shown = not self.shown
+        self.create_tasks_table().setVisible(self.shown)
+
+    def eventFilter(self, obj, event):
+        """
+        Reports the startup profile once the counter is painted.
+        """
+        if obj is self.lcd and event.type() == QtCore.QEvent.Paint:
+            self.lcd.removeEventFilter(self)
+            self.profiler.mark("first paint")
+            self.profiler.report()
+        return super(PyradaizGui, self).eventFilter(obj, event)
+
+    def create_tasks_table(self):
+        """
+        Creates the tasks panel, a filter box above the tasks table, unless
+        it already exists.
+        :return:
+            tasks panel
+        """
+        if self.tasks is not None:
+            return self.tasks
+
+        # Imported here, along with the rest of the tasks panel.
+        from model.search import TaskIndex
+        from model.task_model import TaskTableModel
+
+        self.task_filter = QtWidgets.QLineEdit()
+        self.task_filter.setPlaceholderText("Filter tasks")
+        self.task_filter.setClearButtonEnabled(True)
+        self.task_filter.textChanged.connect(self.filter_tasks)
+
+        # Built a batch at a time between events, a large task list takes
+        # about a second to index.
+        self.task_index = TaskIndex(self.task_store, build=False)
+        self.index_timer = QtCore.QTimer(self.task_filter)
+        self.index_timer.timeout.connect(self.build_task_index)
+        self.index_timer.start(0)
+
+        self.tasks_view = QtWidgets.QTableView()
+        self.task_model = TaskTableModel(self.task_store, self.tasks_view)
+        self.tasks_view.setModel(self.task_model)
+        self.tasks_view.setAlternatingRowColors(True)
+        self.tasks_view.setWordWrap(False)
+        self.tasks_view.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectRows)
+        self.tasks_view.setSelectionMode(
+            QtWidgets.QAbstractItemView.SingleSelection)
+        self.tasks_view.selectionModel().currentRowChanged.connect(
+            self.on_current_task)
+
+        # Fixed row heights, so the view never measures rows it doesn't
+        # show.
+        rows = self.tasks_view.verticalHeader()
+        rows.setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        rows.setVisible(False)
+        header = self.tasks_view.horizontalHeader()
+        header.setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+        header.setStretchLastSection(True)
+        header.setVisible(False)
+
+        import_button = QtWidgets.QToolButton()
+        import_button.setText("Import...")
+        import_button.setToolTip("Import tasks or history from CSV or JSON "
+                                 "Lines")
+        import_button.clicked.connect(self.import_file)
+        export_button = QtWidgets.QToolButton()
+        export_button.setText("Export...")
+        export_button.setToolTip("Export tasks to CSV or JSON Lines")
+        export_button.clicked.connect(self.export_tasks)
+
+        bar = QtWidgets.QHBoxLayout()
+        bar.addWidget(self.task_filter)
+        bar.addWidget(import_button)
+        bar.addWidget(export_button)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(bar)
+        layout.addWidget(self.tasks_view)
+        self.tasks = QtWidgets.QWidget()
+        self.tasks.setLayout(layout)
+        self.tasks.setVisible(self.shown)
+
+        self.main_layout.addWidget(self.tasks)
+        return self.tasks
+
+    def import_file(self):
+        """
+        Imports tasks or session history from a file the user picks. The
+        file is read on a thread of its own.
+        """
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Import tasks or history", "", TRANSFER_FILES)
+        if path:
+            threading.Thread(target=self._import, args=(path,),
+                             name="import", daemon=True).start()
+
+    def _import(self, path):
+        from model import bulk
+        try:
+            kind = bulk.detect_kind(path)
+            if kind == bulk.KIND_HISTORY:
+                report = bulk.import_history(path, self.history)
+            elif kind == bulk.KIND_TASKS:
+                report = bulk.ImportReport(path)
+                # The GUI thread adds the tasks; at most two chunks wait
+                # for it.
+                slots = threading.Semaphore(2)
+                for chunk in bulk.read_chunks(path, kind, report):
+                    slots.acquire()
+                    self.tasks_chunk.emit(chunk, slots)
+            else:
+                raise ValueError("%s holds neither tasks nor history" % path)
+        except (OSError, ValueError) as e:
+            self.transfer_done.emit("", "Import failed: %s" % e)
+            return
+        lines = itertools.islice(report.lines(), TRANSFER_REPORT_LINES)
+        self.transfer_done.emit(kind, "\n".join(lines))
+
+    def on_tasks_chunk(self, chunk, slots):
+        try:
+            self.task_store.extend(chunk)
+        finally:
+            # The import thread waits for the slot.
+            slots.release()
+
+    def export_tasks(self):
+        """
+        Exports the tasks to a file the user picks, on a thread of its own.
+        """
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export tasks", "tasks.csv", TRANSFER_FILES)
+        if path:
+            threading.Thread(target=self._export, args=(path,),
+                             name="export", daemon=True).start()
+
+    def _export(self, path):
+        from model import bulk
+        try:
+            count = bulk.export_tasks(path, self.task_store)
+        except (OSError, ValueError) as e:
+            self.transfer_done.emit("", "Export failed: %s" % e)
+            return
+        self.transfer_done.emit("", "Exported %d tasks to %s" % (count, path))
+
+    def on_transfer_done(self, kind, text):
+        """
+        Shows how an import or export went.
+        """
+        if kind == "history" and self.rollups is not None:
+            # Reloaded with the imported events when next asked for.
+            self.history.unsubscribe(self.rollups.on_history_event)
+            self.rollups = None
+        QtWidgets.QMessageBox.information(self, "Pyradaiz", text)
+
+    def on_current_task(self, current, previous):
+        """
+        Makes the task picked in the tasks table the one the history
+        records phases for. It stays current while a filter hides it.
+        """
+        if current.isValid():
+            row = self.task_model.store_row(current.row())
+            self.history.task = self.task_store.names[row]
+
+    def build_task_index(self):
+        """
+        Indexes the next batch of tasks. Once all are, applies what was
+        typed in the filter box meanwhile.
+        """
+        if self.task_index.build(TASK_INDEX_BATCH):
+            self.index_timer.stop()
+            if self.task_filter.text():
+                self.filter_tasks(self.task_filter.text())
+
+    def filter_tasks(self, text):
+        """
+        Shows only the tasks matching the words in the filter box. Until
+        the index is built, the filter waits for it.
+        """
+        if not self.task_index.ready:
+            return
+        self.task_model.set_filter(self.task_index.query(text),
+                                   self.task_index.matcher(text))
 
     def create_actions(self):
         """
@@ -272,13 +937,14 @@ class PyradaizGui(QtWidgets.QMainWindow):
         self.settings_action = SettingsAction(self)
         self.about_action = AboutAction(self)
         self.change_ui_action = ChangeUI(self)
+        self.tray_only_action = TrayOnlyAction(self)
 
     def create_toolbar(self):
         """
         Creates menu.
         """
         self.toolbar = self.addToolBar("Toolbar")
-        self.toolbar.setIconSize(TOOLBAR_ICON_MAX_SIZE)
+        self.toolbar.setIconSize(QtCore.QSize(*TOOLBAR_ICON_MAX_SIZE))
         self.toolbar.addAction(self.start_action)
         self.toolbar.addAction(self.stop_action)
         self.toolbar.addAction(self.reset_action)
@@ -291,50 +957,168 @@ class PyradaizGui(QtWidgets.QMainWindow):
 
     def create_context_menu(self):
         """
-        Creates context menu used for system tray icon.
+        Creates context menu used for system tray icon. The menu is filled
+        right away: a tray behind DBus (StatusNotifierItem) exports the menu
+        and doesn't reliably tell when it's shown, and in tray only mode
+        it's the only way to reach the actions.
         """
         self.context_menu = QtWidgets.QMenu()
+        self.fill_context_menu()
         self.tray_icon.setContextMenu(self.context_menu)
 
+    def fill_context_menu(self):
+        """
+        Adds actions to the context menu.
+        """
+        if not self.context_menu.isEmpty():
+            return
+
         self.context_menu.addAction(self.start_action)
         self.context_menu.addAction(self.stop_action)
         self.context_menu.addSeparator()
         self.context_menu.addAction(self.reset_action)
         self.context_menu.addSeparator()
+        self.profiles_menu = self.context_menu.addMenu("&Profiles")
+        # Profiles the menu's actions were made for.
+        self.menu_profiles = None
+        self.fill_profiles_menu()
         self.context_menu.addAction(self.settings_action)
         self.context_menu.addAction(self.about_action)
+        self.context_menu.addAction(self.tray_only_action)
         self.context_menu.addAction(self.quit_action)
 
-    def update(self, time):
+    def fill_profiles_menu(self):
+        """
+        Lists the profiles, the one in use checked. The actions are made
+        again only when the profiles changed. Called again whenever the
+        profiles or the durations change.
+        """
+        profiles = self.settings.profiles
+        if profiles is not self.menu_profiles:
+            for action in self.profiles_menu.actions():
+                action.deleteLater()
+            self.profiles_menu.clear()
+            for profile in profiles:
+                self.profiles_menu.addAction(ProfileAction(self,
+                                                           profile.name))
+            self.menu_profiles = profiles
+        current = self.settings.current_profile()
+        for action in self.profiles_menu.actions():
+            action.setChecked(current is not None and
+                              action.name == current.name)
+
+    def on_settings_changed(self, settings, changes):
+        """
+        Applies changed settings to the window and the timer.
+        :param changes: dictionary of field name to (old, new).
+        """
+        if "pomodoro_duration" in changes:
+            self.minutes = settings.pomodoro_duration
+        if "always_on_top" in changes:
+            flags = self.windowFlags()
+            if settings.always_on_top == ALWAYS_ON_TOP_YES:
+                flags |= QtCore.Qt.WindowStaysOnTopHint
+            else:
+                flags &= ~QtCore.Qt.WindowStaysOnTopHint
+            visible = self.isVisible()
+            # Changing the flags recreates the native window, which hides
+            # it; show must be called after.
+            self.setWindowFlags(flags)
+            if visible:
+                self.show()
+        durations = ("pomodoro_duration", "short_break", "long_break")
+        if "profiles" in changes or \
+                any(name in changes for name in durations):
+            self.fill_profiles_menu()
+        if self.timer_thread is not None and \
+                any(name in changes for name in durations):
+            self.timer_thread.configure(settings.pomodoro_duration,
+                                        settings.short_break,
+                                        settings.long_break)
+
+    def update(self, time, emitted=None):
         """
         Updates GUI.
         :param time: time which will be set to the counter.
+        :param emitted: time the update was emitted by the timer thread.
         """
+        if self.lcd is None:
+            return
         self.lcd.display(time)
+        if emitted is not None:
+            self.stats.record_delivery(emitted)
+            if self.watchdog is not None:
+                self.watchdog.record_delivery(emitted)
+
+    def set_low_power(self, enabled):
+        """
+        Stops per-second display updates while the window can't be seen and
+        catches the display up as soon as it can.
+        :param enabled: True if the window is hidden or minimized.
+        """
+        if self.timer_thread is None:
+            return
+        # Leaving low power mode publishes the state, which catches the
+        # display up.
+        self.timer_thread.set_low_power(enabled)
+
+    def hideEvent(self, event):
+        self.set_low_power(True)
+        super(PyradaizGui, self).hideEvent(event)
+
+    def showEvent(self, event):
+        self.set_low_power(self.isMinimized())
+        super(PyradaizGui, self).showEvent(event)
+
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.WindowStateChange:
+            self.set_low_power(self.isMinimized())
+        super(PyradaizGui, self).changeEvent(event)
+
+    def current_phase(self):
+        """
+        Returns phase of the session, called from notification workers.
+        """
+        return self.timer_thread.session.phase
 
     def show_message(self, minutes):
         """
-        Shows notifications.
+        Posts notifications, the sinks show them.
         :param minutes: break length.
         """
         if minutes == "go_on":
-            title = GO_ON
+            notification = Notification(
+                EVENT_GO_ON, GO_ON, phase=PHASE_WORK, key="phase",
+                lifetime=self.settings.pomodoro_duration * 60)
         else:
-            title = TAKE_A_BREAK % minutes
+            # The session is in the break by now, unless it was reset.
+            phase = self.timer_thread.session.phase
+            if phase == PHASE_WORK:
+                phase = PHASE_SHORT_BREAK
+            notification = Notification(
+                EVENT_TAKE_A_BREAK, TAKE_A_BREAK % minutes, phase=phase,
+                key="phase", lifetime=int(minutes) * 60)
+        self.notifier.post(notification)
+
+    def show_notice(self, notification):
+        """
+        Shows a notification in the tray.
+        """
         icon = QtWidgets.QSystemTrayIcon.Information
-        self.tray_icon.showMessage(title, "", icon, 5000)
+        self.tray_icon.showMessage(notification.title, notification.text,
+                                   icon, 5000)
 
     def toggle_ui(self):
         """
         Toggle UI between slim and regular view.
         """
         if not self.slim_view:
-            self.toolbar.setIconSize(TOOLBAR_ICON_MIN_SIZE)
+            self.toolbar.setIconSize(QtCore.QSize(*TOOLBAR_ICON_MIN_SIZE))
             self.addToolBar(QtCore.Qt.RightToolBarArea, self.toolbar)
             self.resize(175, 75)
             self.slim_view = True
         else:
-            self.toolbar.setIconSize(TOOLBAR_ICON_MAX_SIZE)
+            self.toolbar.setIconSize(QtCore.QSize(*TOOLBAR_ICON_MAX_SIZE))
             self.addToolBar(QtCore.Qt.TopToolBarArea, self.toolbar)
             self.resize(280, 130)
             self.slim_view = False
@@ -0,0 +1,209 @@
+"""
+This module contains the incremental full-text index over a TaskStore, used
+to filter the tasks panel as the user types.
+"""
+import bisect
+import re
+import sys
+from array import array
+
+from model.tasks import TASKS_INSERTED, TASK_CHANGED
+
+__author__ = 'Alen Suljkanovic'
+
+TOKEN_RE = re.compile(r"\w+")
+
+# A word that matches more than this part of the tasks is looked up by
+# scanning the tasks in order, which finds the first screenful of matches
+# right away, instead of by merging the posting lists of all the words it
+# is a prefix of.
+DENSE_FRACTION = 0.05
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase words.
+    :return:
+        tuple of distinct tokens
+    """
+    return tuple(set(TOKEN_RE.findall(text.lower())))
+
+
+class TaskIndex(object):
+    """
+    Inverted index of task names and descriptions. Every query word matches
+    as a prefix, and a task matches when it matches all the words.
+
+    The index follows the store: new and edited tasks are (re)indexed as the
+    store reports them. It can also be built a batch of rows at a time, see
+    build; until it's ready, rows it hasn't reached yet are left to it.
+    """
+    def __init__(self, store, build=True):
+        """
+        :param store: TaskStore.
+        :param build: index all the tasks now, otherwise call build.
+        """
+        super(TaskIndex, self).__init__()
+        self.store = store
+        # Token -> sorted array of rows.
+        self.postings = {}
+        # Sorted distinct tokens, for prefix lookups.
+        self.vocabulary = []
+        # Row -> tokens, to check candidates and unindex edited rows.
+        self.row_tokens = []
+        store.subscribe(self.on_store_changed)
+        if build:
+            self.build()
+
+    @property
+    def ready(self):
+        """
+        Tells whether every task is indexed.
+        """
+        return len(self.row_tokens) == len(self.store)
+
+    def build(self, count=None):
+        """
+        Indexes the tasks not indexed yet.
+        :param count: at most this many, all of them by default.
+        :return:
+            True once every task is indexed.
+        """
+        first = len(self.row_tokens)
+        last = len(self.store) - 1
+        if count is not None:
+            last = min(last, first + count - 1)
+        if first <= last:
+            self.add_rows(first, last)
+        return self.ready
+
+    def on_store_changed(self, event, first, last):
+        # Rows past the indexed ones are left to build.
+        indexed = len(self.row_tokens)
+        if event == TASKS_INSERTED:
+            if first == indexed:
+                self.add_rows(first, last)
+        elif event == TASK_CHANGED:
+            for row in range(first, min(last, indexed - 1) + 1):
+                self.update_row(row)
+
+    def _tokens(self, row):
+        text = "%s %s" % (self.store.names[row], self.store.descriptions[row])
+        # Interned, so every task that uses a word shares one string.
+        return tuple(sys.intern(token) for token in tokenize(text))
+
+    def add_rows(self, first, last):
+        new_tokens = []
+        for row in range(first, last + 1):
+            tokens = self._tokens(row)
+            self.row_tokens.append(tokens)
+            for token in tokens:
+                rows = self.postings.get(token)
+                if rows is None:
+                    self.postings[token] = rows = array("I")
+                    new_tokens.append(token)
+                # Rows are appended in order, the array stays sorted.
+                rows.append(row)
+        if len(new_tokens) > len(self.vocabulary) // 8:
+            self.vocabulary = sorted(self.postings)
+        else:
+            for token in new_tokens:
+                bisect.insort(self.vocabulary, token)
+
+    def update_row(self, row):
+        tokens = self._tokens(row)
+        old = self.row_tokens[row]
+        for token in set(old) - set(tokens):
+            rows = self.postings[token]
+            del rows[bisect.bisect_left(rows, row)]
+            if not rows:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary,
+                                                       token)]
+        for token in set(tokens) - set(old):
+            rows = self.postings.get(token)
+            if rows is None:
+                self.postings[token] = rows = array("I")
+                bisect.insort(self.vocabulary, token)
+            rows.insert(bisect.bisect_left(rows, row), row)
+        self.row_tokens[row] = tokens
+
+    def prefix_tokens(self, prefix):
+        """
+        Returns tokens that start with prefix.
+        """
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff", start)
+        return self.vocabulary[start:end]
+
+    def estimate(self, prefix):
+        """
+        Returns upper bound of the number of tasks matching prefix.
+        """
+        return sum(len(self.postings[token])
+                   for token in self.prefix_tokens(prefix))
+
+    def query(self, text, finished=None):
+        """
+        Returns rows of the tasks that match text, in ascending order. Rows
+        are produced lazily, so taking the first few of a query that matches
+        most of the tasks is as cheap as a query that matches almost none.
+        :param text: words typed by the user.
+        :param finished: if True or False, only tasks with that state.
+        :return:
+            iterator of rows, or None if text has no words (everything
+            matches).
+        """
+        words = tokenize(text)
+        if not words:
+            return None
+
+        estimates = sorted((self.estimate(word), word) for word in words)
+        best, word = estimates[0]
+        others = [w for _, w in estimates[1:]]
+        if best > len(self.row_tokens) * DENSE_FRACTION:
+            rows = range(len(self.row_tokens))
+            others.append(word)
+        else:
+            candidates = set()
+            for token in self.prefix_tokens(word):
+                candidates.update(self.postings[token])
+            rows = sorted(candidates)
+        return self._matching(rows, others, finished)
+
+    def matcher(self, text, finished=None):
+        """
+        Returns a function that tells whether a row matches text the way
+        query does, e.g. for tasks added after the query. It reads the row
+        from the store, so it works for rows not indexed yet.
+        :param text: words typed by the user.
+        :param finished: if True or False, only tasks with that state.
+        :return:
+            function of a row that returns a bool.
+        """
+        words = tokenize(text)
+        flags = self.store.finished
+        state = None if finished is None else (1 if finished else 0)
+
+        def accept(row):
+            if state is not None and flags[row] != state:
+                return False
+            return _has_words(self._tokens(row), words)
+        return accept
+
+    def _matching(self, rows, words, finished):
+        row_tokens = self.row_tokens
+        flags = self.store.finished
+        state = None if finished is None else (1 if finished else 0)
+        for row in rows:
+            if state is not None and flags[row] != state:
+                continue
+            if _has_words(row_tokens[row], words):
+                yield row
+
+
+def _has_words(tokens, words):
+    """
+    Tells whether every word is a prefix of one of the tokens.
+    """
+    return all(any(t.startswith(word) for t in tokens) for word in words)
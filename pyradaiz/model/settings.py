@@ -0,0 +1,207 @@
+"""
+This module contains the settings model. Changes are applied as
+transactions: the new values are diffed against the current ones, and
+listeners are told about the fields that actually changed, once per
+transaction. The window, the timer and the settings file react to one
+change event however many fields a dialog sets.
+
+Named profiles set the three durations at once. They are built once per
+change of the profiles setting, so switching to one is a single
+transaction.
+"""
+import contextlib
+import time
+
+from model.consts import POMODORO_DURATION, SHORT_BREAK, LONG_BREAK, \
+    ALWAYS_ON_TOP_NO
+from model.instrumentation import Histogram
+from model.settings_store import SettingsStore, PROFILE_FIELDS, \
+    valid_duration
+
+__author__ = 'Alen Suljkanovic'
+
+# Profiles offered until config.xml names others.
+DEFAULT_PROFILES = (
+    ("Classic", POMODORO_DURATION, SHORT_BREAK, LONG_BREAK),
+    ("Deep work", 50, 10, 30),
+)
+
+DEFAULTS = (
+    ("pomodoro_duration", POMODORO_DURATION),
+    ("short_break", SHORT_BREAK),
+    ("long_break", LONG_BREAK),
+    ("always_on_top", ALWAYS_ON_TOP_NO),
+    ("profiles", DEFAULT_PROFILES),
+)
+
+
+def _field(name):
+    def get(self):
+        return self._values[name]
+
+    def set(self, value):
+        self.update({name: value}, save=False)
+    return property(get, set)
+
+
+class Profile(object):
+    """
+    Named set of durations, in minutes.
+    """
+    def __init__(self, name, pomodoro_duration, short_break, long_break):
+        super(Profile, self).__init__()
+        self.name = name
+        self.durations = (pomodoro_duration, short_break, long_break)
+        # What applying the profile updates.
+        self.values = dict(zip(PROFILE_FIELDS, self.durations))
+
+    def matches(self, settings):
+        """
+        Tells whether the settings have the durations of this profile.
+        """
+        return all(settings[field] == value
+                   for field, value in self.values.items())
+
+    def __repr__(self):
+        return "Profile(%r, %d, %d, %d)" % ((self.name,) + self.durations)
+
+
+class PyradaizSettings(object):
+    """
+    Settings object. Contains information about pomodoro duration, short break
+    duration and long break duration.
+    """
+    pomodoro_duration = _field("pomodoro_duration")
+    short_break = _field("short_break")
+    long_break = _field("long_break")
+    always_on_top = _field("always_on_top")
+
+    def __init__(self, store=None):
+        super(PyradaizSettings, self).__init__()
+        self.store = store or SettingsStore()
+        self._values = dict(DEFAULTS)
+        self.listeners = []
+        # Seconds the listeners took to apply a transaction.
+        self.apply_time = Histogram()
+        # Profile objects and the setting they were built from.
+        self._profiles = ()
+        self._profiles_source = None
+
+    def subscribe(self, listener):
+        """
+        Adds a listener called as listener(settings, changes) after every
+        transaction that changed something; changes maps field names to
+        (old, new) tuples.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def as_dict(self):
+        return dict(self._values)
+
+    @property
+    def profiles(self):
+        """
+        Returns the profiles, as a tuple of Profile.
+        """
+        source = self._values["profiles"]
+        if source is not self._profiles_source:
+            self._profiles = tuple(Profile(*profile) for profile in source)
+            self._profiles_source = source
+        return self._profiles
+
+    def current_profile(self):
+        """
+        Returns the profile with the current durations, or None.
+        """
+        for profile in self.profiles:
+            if profile.matches(self._values):
+                return profile
+        return None
+
+    def apply_profile(self, name, save=True):
+        """
+        Switches to the durations of a profile, in one transaction.
+        :param save: save the settings if anything changed.
+        :return:
+            dictionary of the changed fields to (old, new) tuples.
+        """
+        for profile in self.profiles:
+            if profile.name == name:
+                return self.update(profile.values, save)
+        raise ValueError("unknown profile %r" % name)
+
+    def update(self, values, save=True):
+        """
+        Applies values in one transaction.
+        :param values: dictionary of field name to value.
+        :param save: save the settings if anything changed.
+        :return:
+            dictionary of the changed fields to (old, new) tuples.
+        :raise ValueError: if a duration isn't a positive whole number of
+            minutes; nothing is applied then.
+        """
+        for name in values:
+            if name not in self._values:
+                raise AttributeError("unknown setting %r" % name)
+            if name in PROFILE_FIELDS and not valid_duration(values[name]):
+                raise ValueError("%s must be a positive number of minutes, "
+                                 "got %r" % (name, values[name]))
+        changes = {}
+        for name, value in values.items():
+            old = self._values[name]
+            if value != old:
+                changes[name] = (old, value)
+        if not changes:
+            return changes
+        for name, (_, value) in changes.items():
+            self._values[name] = value
+        started = time.perf_counter()
+        for listener in list(self.listeners):
+            listener(self, changes)
+        self.apply_time.add(time.perf_counter() - started)
+        if save:
+            self.save()
+        return changes
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Collects changes in a dictionary and applies them on exit, unless
+        an exception was raised.
+
+            with settings.transaction() as values:
+                values["short_break"] = 10
+        """
+        values = {}
+        yield values
+        self.update(values)
+
+    def save(self):
+        """
+        Saves settings into the file. Saves that follow each other quickly
+        are written once.
+        """
+        self.store.schedule_save(self.as_dict())
+
+    def load(self):
+        """
+        Loads settings from .xml file.
+        """
+        return self.update(self.store.load(), save=False)
+
+    def reload(self):
+        """
+        Applies the settings file again if it changed since it was loaded
+        or saved; only the fields that differ reach the listeners. Invalid
+        durations in the file are skipped, as when loading.
+        :return:
+            dictionary of the changed fields to (old, new) tuples, or None
+            if the file didn't change.
+        """
+        values = self.store.reload()
+        if values is None:
+            return None
+        return self.update(values, save=False)
@@ -0,0 +1,364 @@
+"""
+This module contains the settings store: it reads and writes config.xml in
+the per-user configuration directory.
+
+Writes go to a temporary file which is fsynced and renamed over config.xml,
+so a crash never leaves a half written file behind. Rapid saves are
+coalesced into one write. Next to the XML a compact marshal copy is kept,
+along with the identity of the XML it was made from; as long as config.xml
+is still that file, loading skips XML parsing entirely.
+Modules that are only needed for writing are imported when writing, which
+keeps the cold start cheap.
+
+The store remembers the identity of config.xml as it last read or wrote
+it, its inode, size and modification time, so a watcher can tell a file
+pushed by someone else from its own writes with a stat call and re-parse
+only the former.
+
+Named duration profiles are kept in config.xml too:
+
+    <profiles>
+      <profile name="Deep work" pomodoro_duration="50" short_break="10"
+               long_break="30" />
+    </profiles>
+"""
+import marshal
+import os
+import threading
+
+from model.utils import get_config_path, get_root_path
+
+__author__ = 'Alen Suljkanovic'
+
+# Setting name and the type it's stored as.
+SETTINGS_FIELDS = (
+    ("pomodoro_duration", int),
+    ("short_break", int),
+    ("long_break", int),
+    ("always_on_top", str),
+)
+
+# Durations a profile sets, in minutes.
+PROFILE_FIELDS = ("pomodoro_duration", "short_break", "long_break")
+
+CONFIG_FILE = "config.xml"
+CACHE_FILE = "config.cache"
+# Where the timer was when last started or stopped, to resume after a
+# restart.
+SESSION_FILE = "session.state"
+
+# Seconds to wait for more changes before writing.
+SAVE_DELAY = 0.5
+
+
+def atomic_write(path, data):
+    """
+    Writes data to path so that readers see either the old or the new
+    content, never a mix.
+    :param path: file path.
+    :param data: bytes to write.
+    """
+    import tempfile
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable.
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def file_signature(path):
+    """
+    Returns what tells one version of a file from another without reading
+    it: inode, size and modification time, or None if there's no file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def valid_duration(value):
+    """
+    Tells whether value can be a duration setting: a positive whole number
+    of minutes.
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and \
+        value > 0
+
+
+def valid_values(values):
+    """
+    Tells whether a settings dictionary, e.g. one read from the cache, has
+    only valid durations.
+    """
+    return all(valid_duration(values[name]) for name in PROFILE_FIELDS
+               if name in values)
+
+
+def parse_profiles(element):
+    """
+    Reads the profiles of a <profiles> element. Profiles without a name,
+    with durations that aren't positive whole numbers, or named like an
+    earlier one are skipped.
+    :return:
+        tuple of (name, pomodoro_duration, short_break, long_break)
+        tuples.
+    """
+    profiles = []
+    names = set()
+    for profile in element.iter("profile"):
+        name = (profile.get("name") or "").strip()
+        if not name or name in names:
+            continue
+        try:
+            durations = tuple(int(profile.get(field, ""))
+                              for field in PROFILE_FIELDS)
+        except ValueError:
+            continue
+        if min(durations) <= 0:
+            continue
+        names.add(name)
+        profiles.append((name,) + durations)
+    return tuple(profiles)
+
+
+def parse_xml(path):
+    """
+    Reads settings from the XML file. Missing or malformed values, and
+    durations that aren't positive whole numbers, are skipped, so one bad
+    field doesn't lose the others.
+    :return:
+        dictionary of settings.
+    """
+    from xml.etree.ElementTree import ElementTree, ParseError
+
+    tree = ElementTree()
+    try:
+        tree.parse(path)
+    except (ParseError, OSError):
+        # Malformed, or removed or replaced since it was found.
+        return {}
+
+    values = {}
+    root = tree.getroot()
+    for name, kind in SETTINGS_FIELDS:
+        element = root.find(name)
+        if element is None or element.text is None:
+            continue
+        try:
+            value = kind(element.text)
+        except ValueError:
+            continue
+        if name in PROFILE_FIELDS and not valid_duration(value):
+            continue
+        values[name] = value
+    element = root.find("profiles")
+    if element is not None:
+        values["profiles"] = parse_profiles(element)
+    return values
+
+
+def build_xml(values):
+    """
+    Builds the XML document for the given settings.
+    :return:
+        bytes
+    """
+    from xml.etree.ElementTree import Element, SubElement, tostring
+
+    root = Element("config")
+    for name, kind in SETTINGS_FIELDS:
+        if name in values:
+            SubElement(root, name).text = "%s" % values[name]
+    if "profiles" in values:
+        profiles = SubElement(root, "profiles")
+        for profile in values["profiles"]:
+            attributes = {"name": profile[0]}
+            for field, minutes in zip(PROFILE_FIELDS, profile[1:]):
+                attributes[field] = "%d" % minutes
+            SubElement(profiles, "profile", attributes)
+    return tostring(root)
+
+
+class SettingsStore(object):
+    """
+    Loads and saves settings dictionaries.
+    """
+    def __init__(self, directory=None, delay=SAVE_DELAY):
+        """
+        Initialize store.
+        :param directory: configuration directory, the per-user one by
+            default.
+        :param delay: seconds to coalesce saves for.
+        """
+        super(SettingsStore, self).__init__()
+        self.directory = directory or get_config_path()
+        self.path = os.path.join(self.directory, CONFIG_FILE)
+        self.cache_path = os.path.join(self.directory, CACHE_FILE)
+        self.session_path = os.path.join(self.directory, SESSION_FILE)
+        self.delay = delay
+        self._saved = None
+        self._pending = None
+        self._timer = None
+        self._lock = threading.Lock()
+        # config.xml as last read or written, see file_signature.
+        self._signature = None
+
+    def load(self):
+        """
+        Loads settings, from the cache if it was made from the current
+        config.xml, otherwise from
+        the XML file. Without a per-user file, the config.xml shipped with
+        pyradaiz is used.
+        :return:
+            dictionary of settings.
+        """
+        signature = file_signature(self.path)
+        if signature is None:
+            default = os.path.join(get_root_path(), CONFIG_FILE)
+            if not os.path.exists(default):
+                return {}
+            return parse_xml(default)
+
+        self._signature = signature
+        try:
+            with open(self.cache_path, "rb") as f:
+                cached = marshal.load(f)
+            # A file pushed with an old modification time, or within the
+            # same tick, still differs in inode or size.
+            if isinstance(cached, tuple) and len(cached) == 2 and \
+                    cached[0] == signature and \
+                    isinstance(cached[1], dict) and valid_values(cached[1]):
+                self._saved = cached[1]
+                return cached[1]
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+
+        values = parse_xml(self.path)
+        self._saved = values
+        self._write_cache(values, signature)
+        return values
+
+    def changed(self):
+        """
+        Tells whether config.xml was replaced or modified since it was last
+        loaded or written here. A file that went away doesn't count.
+        """
+        signature = file_signature(self.path)
+        return signature is not None and signature != self._signature
+
+    def reload(self):
+        """
+        Parses config.xml again if it changed, see changed. The cache is
+        bypassed, a pushed file may keep an old modification time. Values
+        are checked as when loading. Holds the lock, so a scheduled save
+        doesn't write in between.
+        :return:
+            dictionary of settings, or None if the file didn't change.
+        """
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature is None or signature == self._signature:
+                return None
+            values = parse_xml(self.path)
+            if not values:
+                # Malformed or gone meanwhile; checked again on the next
+                # change.
+                return None
+            self._signature = signature
+            self._saved = values
+            self._write_cache(values, signature)
+            return values
+
+    def save(self, values):
+        """
+        Writes settings right away, unless they didn't change since the last
+        load or save.
+        """
+        with self._lock:
+            self._cancel_timer()
+            self._pending = None
+            self._write(dict(values))
+
+    def schedule_save(self, values):
+        """
+        Saves settings after a short delay. Saves scheduled in the meantime
+        replace this one, so a burst of changes is written once.
+        """
+        with self._lock:
+            self._pending = dict(values)
+            self._cancel_timer()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Writes a scheduled save, if any.
+        """
+        with self._lock:
+            self._cancel_timer()
+            if self._pending is not None:
+                self._write(self._pending)
+                self._pending = None
+
+    def load_session(self):
+        """
+        Loads the saved timer state.
+        :return:
+            dictionary, empty if there is none.
+        """
+        try:
+            with open(self.session_path, "rb") as f:
+                state = marshal.load(f)
+        except (OSError, ValueError, EOFError, TypeError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def save_session(self, state):
+        """
+        Saves the timer state: "anchor", the UNIX time a running session
+        started at, or "elapsed", the seconds a stopped one has run.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.session_path, marshal.dumps(dict(state)))
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _write(self, values):
+        if values == self._saved:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.path, build_xml(values))
+        self._signature = file_signature(self.path)
+        self._write_cache(values, self._signature)
+        self._saved = values
+
+    def _write_cache(self, values, signature):
+        # Stored with the signature of the XML the values came from.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write(self.cache_path, marshal.dumps((signature, values)))
+        except OSError:
+            # The cache only speeds up loading.
+            pass
@@ -0,0 +1,387 @@
+"""
+This module contains the state shared between pyradaiz instances of one
+user. The first instance owns the timer and publishes its state in a small
+shared memory block; instances started later attach to it as views.
+
+Views never poll: the owner rings a doorbell, a byte on a Unix socket, when
+the state changes, and between changes a view counts down from the shared
+deadline on its own. The monotonic clock is system wide, so every view
+shows the same time. Views send their start, pause and reset clicks back to
+the owner over the same socket, one command per line. When the owner quits,
+its views claim the timer again and one of them becomes the new owner.
+"""
+import errno
+import getpass
+import os
+import socket
+import struct
+import time
+
+from model.core import PHASE_WORK, PHASE_SHORT_BREAK, PHASE_LONG_BREAK, \
+    SessionState
+from model.utils import get_runtime_path, time_str
+
+__author__ = 'Alen Suljkanovic'
+
+MAGIC = 0x50595244
+
+PHASES = (PHASE_WORK, PHASE_SHORT_BREAK, PHASE_LONG_BREAK)
+
+# magic, sequence number, then the state: running, phase, pomodoro count,
+# remaining seconds, monotonic deadline (0 when stopped), anchor (0 when
+# stopped), monotonic time of the write, owner pid.
+HEADER = struct.Struct("<II")
+BODY = struct.Struct("<BB2xIddddI")
+SIZE = HEADER.size + BODY.size
+
+# Sent to the views when the state changed.
+RING = b"!"
+
+# Tries to reach the owner's socket, 50 ms apart.
+CONNECT_ATTEMPTS = 20
+
+# Reads retried while a write is under way before the writer is checked,
+# and seconds a live writer gets to finish.
+READ_SPINS = 1000
+READ_TIMEOUT = 1.0
+
+
+def instance_name():
+    """
+    Returns name of the shared memory block and socket of this user.
+    """
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = str(os.getuid()) if hasattr(os, "getuid") else "user"
+    return "pyradaiz-%s" % "".join(c for c in user if c.isalnum())
+
+
+def supported():
+    """
+    Returns True if this platform has shared memory and Unix sockets.
+    """
+    import importlib.util
+    try:
+        if importlib.util.find_spec("multiprocessing.shared_memory") is None:
+            return False
+    except ImportError:
+        return False
+    return hasattr(socket, "AF_UNIX")
+
+
+def pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
+
+
+def _attach_block(name):
+    """
+    Attaches an existing block without handing it to the resource tracker,
+    which would unlink it when this process exits.
+    """
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(block._name, "shared_memory")
+        except Exception:
+            pass
+        return block
+
+
+class SharedState(object):
+    """
+    Session state in a shared memory block, guarded by a sequence lock: the
+    writer makes the sequence number odd while it writes, and readers retry
+    until they read the same even number before and after the state.
+    """
+    def __init__(self, block, owner):
+        super(SharedState, self).__init__()
+        self.block = block
+        self.buf = block.buf
+        self.owner = owner
+
+    @classmethod
+    def create(cls, name):
+        """
+        Creates the block.
+        :raise FileExistsError: if another instance has it.
+        """
+        from multiprocessing import shared_memory
+        block = shared_memory.SharedMemory(name, create=True, size=SIZE)
+        # The pid goes in first, so an instance that attaches before the
+        # first write doesn't take the block for abandoned.
+        BODY.pack_into(block.buf, HEADER.size, 0, 0, 0, 0.0, 0.0, 0.0,
+                       time.monotonic(), os.getpid())
+        HEADER.pack_into(block.buf, 0, MAGIC, 0)
+        return cls(block, True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attaches to the block of another instance.
+        :raise FileNotFoundError: if there is none.
+        """
+        block = _attach_block(name)
+        if block.size < SIZE or HEADER.unpack_from(block.buf, 0)[0] != MAGIC:
+            block.close()
+            raise FileNotFoundError(name)
+        return cls(block, False)
+
+    def write(self, state, pid=None):
+        """
+        Publishes a SessionState.
+        """
+        seq = HEADER.unpack_from(self.buf, 0)[1] + 1
+        HEADER.pack_into(self.buf, 0, MAGIC, seq)
+        BODY.pack_into(self.buf, HEADER.size, 1 if state.running else 0,
+                       PHASES.index(state.phase), state.pomodoro_cnt,
+                       state.remaining, state.deadline or 0.0,
+                       state.anchor or 0.0, time.monotonic(),
+                       os.getpid() if pid is None else pid)
+        HEADER.pack_into(self.buf, 0, MAGIC, seq + 1)
+
+    def read_raw(self):
+        """
+        Returns the fields of the last write, see BODY. A write that never
+        ends, its writer died or hangs, is returned as it is, so claim finds
+        the dead owner and takes the block over.
+        """
+        spins = 0
+        deadline = None
+        while True:
+            seq = HEADER.unpack_from(self.buf, 0)[1]
+            body = BODY.unpack_from(self.buf, HEADER.size)
+            if not seq & 1 and HEADER.unpack_from(self.buf, 0)[1] == seq:
+                return body
+            spins += 1
+            if spins < READ_SPINS:
+                continue
+            # The pid is written with the rest of the body, it's whole.
+            if not pid_alive(body[-1]):
+                return body
+            if deadline is None:
+                deadline = time.monotonic() + READ_TIMEOUT
+            elif time.monotonic() > deadline:
+                return body
+            time.sleep(0.001)
+
+    def read(self):
+        """
+        Returns the published SessionState. The elapsed time isn't shared
+        and is None.
+        """
+        running, phase, cnt, remaining, deadline, anchor, _, _ = \
+            self.read_raw()
+        remaining = int(remaining)
+        return SessionState(bool(running), PHASES[phase], cnt, remaining,
+                            time_str(*divmod(remaining, 60)),
+                            anchor or None, None, deadline or None)
+
+    @property
+    def owner_pid(self):
+        return self.read_raw()[-1]
+
+    def close(self):
+        self.buf = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+class Doorbell(object):
+    """
+    Owner side of the socket: accepts views, rings them and reads their
+    commands. All sockets are non-blocking, meant to be driven by an event
+    loop.
+    """
+    def __init__(self, path):
+        super(Doorbell, self).__init__()
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(64)
+        self.sock.setblocking(False)
+        self.views = {}
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def accept(self):
+        """
+        Accepts a waiting view.
+        :return:
+            view socket, or None.
+        """
+        try:
+            view, _ = self.sock.accept()
+        except BlockingIOError:
+            return None
+        view.setblocking(False)
+        self.views[view.fileno()] = [view, b""]
+        return view
+
+    def ring(self):
+        """
+        Tells every view the state changed. A view with a full socket
+        buffer has rings left to read, so it's skipped.
+        """
+        for fd, (view, _) in list(self.views.items()):
+            try:
+                view.send(RING)
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.drop(fd)
+
+    def read_commands(self, fd):
+        """
+        Reads the commands a view sent.
+        :return:
+            list of commands, or None if the view went away.
+        """
+        view, pending = self.views[fd]
+        try:
+            data = view.recv(4096)
+        except BlockingIOError:
+            return []
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(fd)
+            return None
+        lines = (pending + data).split(b"\n")
+        self.views[fd][1] = lines.pop()
+        return [line.decode("ascii", "replace").strip() for line in lines
+                if line.strip()]
+
+    def drop(self, fd):
+        view, _ = self.views.pop(fd)
+        view.close()
+
+    def close(self):
+        for fd in list(self.views):
+            self.drop(fd)
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DoorbellClient(object):
+    """
+    View side of the socket.
+    """
+    def __init__(self, path):
+        super(DoorbellClient, self).__init__()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def drain(self):
+        """
+        Reads pending rings.
+        :return:
+            False if the owner went away.
+        """
+        while True:
+            try:
+                if not self.sock.recv(4096):
+                    return False
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+
+    def send(self, command, *args):
+        """
+        Sends a command to the owner.
+        :return:
+            False if the owner went away.
+        """
+        line = " ".join([command] + ["%s" % arg for arg in args]) + "\n"
+        try:
+            self.sock.sendall(line.encode("ascii"))
+        except BlockingIOError:
+            # The owner is alive but doesn't read, the command is dropped.
+            pass
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+class Instance(object):
+    """
+    Role of this process: owner of the timer, or a view of another
+    instance's.
+    """
+    def __init__(self, state, doorbell=None, client=None):
+        super(Instance, self).__init__()
+        self.state = state
+        self.doorbell = doorbell
+        self.client = client
+
+    @property
+    def owner(self):
+        return self.doorbell is not None
+
+    @classmethod
+    def claim(cls, name=None, directory=None):
+        """
+        Becomes the owner, or attaches to a running one. The block of an
+        owner that died is taken over.
+        :return:
+            Instance, or None if the platform can't share state.
+        """
+        if not supported():
+            return None
+        name = name or instance_name()
+        path = os.path.join(directory or get_runtime_path(), name + ".sock")
+        for _ in range(2):
+            try:
+                state = SharedState.create(name)
+            except FileExistsError:
+                pass
+            else:
+                return cls(state, doorbell=Doorbell(path))
+
+            try:
+                state = SharedState.attach(name)
+            except FileNotFoundError:
+                continue
+            if pid_alive(state.owner_pid):
+                # The owner may still be binding its socket.
+                for _ in range(CONNECT_ATTEMPTS):
+                    try:
+                        return cls(state, client=DoorbellClient(path))
+                    except OSError:
+                        time.sleep(0.05)
+                state.close()
+                return None
+            # The owner died without cleaning up.
+            state.block.unlink()
+            state.close()
+        return None
+
+    def close(self):
+        if self.doorbell is not None:
+            self.doorbell.close()
+        if self.client is not None:
+            self.client.close()
+        self.state.close()
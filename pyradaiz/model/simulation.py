@@ -0,0 +1,360 @@
+"""
+This module contains the timer simulator. It runs the timer thread's loop on
+a virtual clock and replays user actions, scripted or random, over days or
+weeks of simulated time, while checking that the session behaves:
+
+  - breaks follow pomodoros, and every third break is the long one,
+  - finished pomodoros only go up, until a reset,
+  - phases change on their deadline, late only by as much as the thread
+    woke up late, and no time is lost or gained over late wake ups,
+    pauses, suspends and setting changes,
+  - the display counts down a second at a time,
+  - the remaining time never exceeds the phase duration.
+
+Scripts have one action per line, at a time of day:
+
+    # time   action     arguments
+    9h       start
+    12h30m   pause
+    13h15m   start
+    15h      configure  50 10 20
+    17h      hide
+    18h      suspend    14h
+
+Actions are start, pause, reset, configure <pomodoro> <short> <long>,
+hide, show and suspend <duration>. hide and show switch the low power mode
+the hidden window uses.
+"""
+import collections
+import random
+import re
+import time
+
+from model.clock import VirtualClock
+from model.core import PomodoroSession, SessionRunner, EVENT_TICK, \
+    EVENT_TAKE_A_BREAK, EVENT_GO_ON, EVENT_RESET, PHASE_WORK, \
+    PHASE_LONG_BREAK, POMODOROS_PER_CYCLE, RESYNC_THRESHOLD
+
+__author__ = 'Alen Suljkanovic'
+
+DAY = 24 * 3600
+
+ACTIONS = ("start", "pause", "reset", "configure", "hide", "show", "suspend")
+
+# Relative weights of the actions a random user takes.
+RANDOM_WEIGHTS = (("start", 30), ("pause", 20), ("reset", 4),
+                  ("configure", 4), ("hide", 15), ("show", 15),
+                  ("suspend", 12))
+
+# Seconds the checks allow for float rounding. The wall clock is around
+# 1.7e9, where a double resolves about 2.4e-7 s.
+TOLERANCE = 1e-5
+
+# Violations kept for the report; all of them are counted.
+MAX_VIOLATIONS = 20
+
+Action = collections.namedtuple("Action", ("at", "name", "args"))
+
+_DURATION = re.compile(r"(\d+(?:\.\d*)?)([dhms]?)")
+_UNITS = {"d": DAY, "h": 3600, "m": 60, "s": 1, "": 1}
+
+
+def parse_duration(text):
+    """
+    Returns seconds of a duration such as 90, 25m or 1h30m.
+    """
+    position = 0
+    seconds = 0.0
+    for match in _DURATION.finditer(text):
+        if match.start() != position:
+            break
+        seconds += float(match.group(1)) * _UNITS[match.group(2)]
+        position = match.end()
+    if not text or position != len(text):
+        raise ValueError("bad duration %r" % text)
+    return seconds
+
+
+def parse_script(lines):
+    """
+    Parses a script.
+    :param lines: iterable of lines.
+    :return:
+        list of Action, in time order.
+    """
+    actions = []
+    for number, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        try:
+            if len(fields) < 2 or fields[1] not in ACTIONS:
+                raise ValueError("expected a time and one of %s" %
+                                 ", ".join(ACTIONS))
+            name, args = fields[1], fields[2:]
+            if name == "configure":
+                if len(args) != 3:
+                    raise ValueError("configure takes three durations in "
+                                     "minutes")
+                args = tuple(int(arg) for arg in args)
+            elif name == "suspend":
+                if len(args) != 1:
+                    raise ValueError("suspend takes a duration")
+                args = (parse_duration(args[0]),)
+            elif args:
+                raise ValueError("%s takes no arguments" % name)
+            actions.append(Action(parse_duration(fields[0]), name,
+                                  tuple(args)))
+        except ValueError as e:
+            raise ValueError("line %d: %s" % (number, e))
+    actions.sort(key=lambda action: action.at)
+    return actions
+
+
+def daily(actions, days):
+    """
+    Repeats a day's actions every day.
+    """
+    return [action._replace(at=day * DAY + action.at)
+            for day in range(days) for action in actions]
+
+
+def random_actions(seconds, seed=None, mean_gap=1800.0):
+    """
+    Returns actions of a user who acts every mean_gap seconds on average.
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in RANDOM_WEIGHTS]
+    weights = [weight for _, weight in RANDOM_WEIGHTS]
+    actions = []
+    at = rng.expovariate(1.0 / mean_gap)
+    while at < seconds:
+        name = rng.choices(names, weights)[0]
+        args = ()
+        if name == "configure":
+            args = (rng.choice((15, 25, 50)), rng.choice((3, 5, 10)),
+                    rng.choice((10, 15, 30)))
+        elif name == "suspend":
+            # From a minute to a night.
+            args = (rng.uniform(60, 12 * 3600),)
+        # Some actions land exactly on a whole second, often a deadline.
+        if rng.random() < 0.2:
+            at = float(int(at))
+        actions.append(Action(at, name, args))
+        at += rng.expovariate(1.0 / mean_gap)
+    return actions
+
+
+class Simulation(object):
+    """
+    One session, run by a SessionRunner on a virtual clock.
+    """
+    def __init__(self, pomodoro_duration=25, short_break=5, long_break=15,
+                 clock=None):
+        """
+        :param clock: VirtualClock, give it a latency to check the timer
+            doesn't drift when it wakes up late.
+        """
+        super(Simulation, self).__init__()
+        self.clock = clock or VirtualClock()
+        self.session = PomodoroSession(pomodoro_duration, short_break,
+                                       long_break,
+                                       clock=self.clock.monotonic,
+                                       wall_clock=self.clock.time)
+        self.runner = SessionRunner(self.session, self.clock,
+                                    on_wakeup=self.on_wakeup)
+        self.violations = []
+        self.violation_count = 0
+        self.actions = collections.Counter()
+        self.events = collections.Counter()
+        self.wakeups = 0
+        self.pomodoros = 0
+        # Seconds the session ran, suspends included.
+        self.session_time = 0.0
+        self.cpu_time = 0.0
+        self._running = False
+        self._mark_time = self.clock.time()
+        self._limit = self.session.timer.remaining()
+        self._observe()
+        self.session.subscribe(self.on_event)
+
+    def schedule(self, actions):
+        """
+        Schedules the actions; each one runs on the timer thread as a
+        command, like the GUI's do.
+        """
+        for action in actions:
+            if action.name == "suspend":
+                # Not a command, the thread notices on its next poll.
+                self.clock.call_at(action.at, self.suspend, *action.args)
+            else:
+                self.clock.call_at(action.at, self.runner.submit, self.apply,
+                                   action)
+
+    def run(self, seconds):
+        """
+        Runs the timer thread loop until the given virtual time.
+        """
+        self.clock.call_at(seconds, self.runner.submit, None)
+        started = time.process_time()
+        self.runner.run()
+        self.cpu_time += time.process_time() - started
+        self._observe()
+
+    def on_wakeup(self, scheduled):
+        self.wakeups += 1
+
+    def suspend(self, seconds):
+        self.actions["suspend"] += 1
+        self.clock.suspend(seconds)
+        if self.session.running and seconds >= RESYNC_THRESHOLD:
+            # The next phase change may be a jump.
+            self._jump = True
+
+    def apply(self, action):
+        """
+        Runs an action on the session and checks where it left it.
+        """
+        session = self.session
+        self.actions[action.name] += 1
+        self.check()
+        if action.name == "start":
+            session.start()
+        elif action.name == "pause":
+            session.pause()
+        elif action.name == "reset":
+            session.reset()
+        elif action.name == "configure":
+            session.configure(*action.args)
+            if session.phase == PHASE_WORK and not session.running:
+                self._limit = session.pomodoro_duration * 60
+        elif action.name in ("hide", "show"):
+            session.ticks = action.name == "show"
+        self._observe()
+        self.check()
+
+    def _account(self):
+        now = self.clock.time()
+        if self._running:
+            self.session_time += now - self._mark_time
+        return now
+
+    def _observe(self):
+        """
+        Takes the session as it is as the reference for later checks.
+        """
+        session = self.session
+        self._mark_time = self._account()
+        self._mark_elapsed = session.elapsed()
+        self._running = session.running
+        self._phase = session.phase
+        self._cnt = session.pomodoro_cnt
+        self._last_tick = None
+        self._jump = False
+
+    def violation(self, message):
+        self.violation_count += 1
+        if len(self.violations) < MAX_VIOLATIONS:
+            now = self.clock.monotonic()
+            day, rest = divmod(now, DAY)
+            self.violations.append("day %d %02d:%02d:%06.3f %s: %s" % (
+                day, rest // 3600, rest % 3600 // 60, rest % 60,
+                self.session.phase, message))
+
+    def check(self):
+        """
+        Checks the session against the time that passed since it was last
+        observed.
+        """
+        session = self.session
+        expected = self._mark_elapsed
+        if self._running:
+            expected += self.clock.time() - self._mark_time
+        if abs(session.elapsed() - expected) > TOLERANCE:
+            self.violation("ran %.3f s, expected %.3f s" %
+                           (session.elapsed(), expected))
+        remaining = session.timer.remaining()
+        if remaining > self._limit + TOLERANCE:
+            self.violation("%.3f s left of a %d s phase" %
+                           (remaining, self._limit))
+        if session.running != self._running:
+            self.violation("running changed without a command")
+
+    def on_event(self, session, event, value):
+        """
+        Session listener, checks every tick and phase change.
+        """
+        self.events[event] += 1
+        if event == EVENT_TICK:
+            self.check_tick()
+        elif event in (EVENT_TAKE_A_BREAK, EVENT_GO_ON):
+            self.check_phase(event, value)
+        elif event == EVENT_RESET:
+            if session.pomodoro_cnt != 0 or session.phase != PHASE_WORK:
+                self.violation("reset didn't go back to the first pomodoro")
+            self._limit = value
+
+    def check_tick(self):
+        seconds = self.session.timer.remaining_seconds()
+        if self._jump:
+            # Resynced after a suspend without changing phase.
+            self._jump = False
+            self._last_tick = None
+        if self._last_tick is not None and \
+                not 0 <= self._last_tick - seconds <= 1:
+            self.violation("display went from %d s to %d s" %
+                           (self._last_tick, seconds))
+        self._last_tick = seconds
+        self.check()
+
+    def check_phase(self, event, minutes):
+        session = self.session
+        jump, self._jump = self._jump, False
+        if jump:
+            if session.pomodoro_cnt < self._cnt:
+                self.violation("finished pomodoros went down in a jump")
+            self._limit = max(session.plan.durations)
+        else:
+            self._limit = minutes * 60
+            late = self.clock.monotonic() - \
+                (session.timer.deadline - minutes * 60)
+            if not -TOLERANCE <= late <= self.clock.latency + TOLERANCE:
+                self.violation("phase changed %.6f s after its deadline" %
+                               late)
+            if event == EVENT_TAKE_A_BREAK:
+                if self._phase != PHASE_WORK:
+                    self.violation("break after a %s" % self._phase)
+                if session.pomodoro_cnt != self._cnt + 1:
+                    self.violation("break after pomodoro %d, had %d" %
+                                   (session.pomodoro_cnt, self._cnt))
+                long_break = session.pomodoro_cnt % POMODOROS_PER_CYCLE == 0
+                if long_break != (session.phase == PHASE_LONG_BREAK):
+                    self.violation("%s after pomodoro %d" %
+                                   (session.phase, session.pomodoro_cnt))
+            else:
+                if self._phase == PHASE_WORK:
+                    self.violation("pomodoro after a pomodoro")
+                if session.pomodoro_cnt != self._cnt:
+                    self.violation("finished pomodoros changed in a break")
+        self.pomodoros += max(0, session.pomodoro_cnt - self._cnt)
+        self._phase = session.phase
+        self._cnt = session.pomodoro_cnt
+        self._last_tick = None
+        self.check()
+
+    def report(self):
+        """
+        Returns the results as a dictionary.
+        """
+        simulated = self.clock.monotonic()
+        cpu = max(self.cpu_time, 1e-9)
+        return {"simulated_days": simulated / DAY,
+                "session_hours": self.session_time / 3600,
+                "pomodoros": self.pomodoros,
+                "actions": sum(self.actions.values()),
+                "wakeups": self.wakeups,
+                "cpu_seconds": self.cpu_time,
+                "session_hours_per_cpu_second":
+                    self.session_time / 3600 / cpu,
+                "wakeups_per_cpu_second": self.wakeups / cpu,
+                "violations": self.violation_count}
@@ -0,0 +1,359 @@
+"""
+This module contains the productivity statistics: a columnar log of finished
+phases held in NumPy arrays, and rollups of it per day, week and task.
+
+Rollups are computed once from the log with vectorised operations and then
+kept up to date one finished phase at a time, so showing them never scans
+the history again. Phases are added by the timer thread while the GUI
+reads, so both take the rollups' lock. Loading them from the history takes
+a while with years of it, so it's meant for a thread of its own.
+"""
+import threading
+import time
+
+import numpy as np
+
+from model.core import PHASE_WORK, PHASE_SHORT_BREAK, PHASE_LONG_BREAK
+from model.history import PHASE_END
+
+__author__ = 'Alen Suljkanovic'
+
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01, day zero, was a Thursday. Shifting days by three makes weeks
+# start on Monday.
+WEEK_SHIFT = 3
+
+WORK, SHORT_BREAK, LONG_BREAK = range(3)
+PHASE_CODES = {PHASE_WORK: WORK, PHASE_SHORT_BREAK: SHORT_BREAK,
+               PHASE_LONG_BREAK: LONG_BREAK}
+
+# Phase codes are computed by SQLite; only task names are coded in Python,
+# while the rows stream into the arrays. The history's events_phase_ends
+# index holds every column, so the table itself isn't read.
+PHASE_ENDS = """
+SELECT ts, duration,
+       CASE phase WHEN '%s' THEN %d WHEN '%s' THEN %d ELSE %d END,
+       COALESCE(task, '')
+FROM events
+WHERE ts >= ? AND ts < ? AND kind = '%s' AND duration IS NOT NULL
+ORDER BY ts
+""" % (PHASE_WORK, WORK, PHASE_SHORT_BREAK, SHORT_BREAK, LONG_BREAK,
+       PHASE_END)
+
+
+# Columns of a SessionLog, as they're loaded.
+LOG_DTYPE = np.dtype([("ts", np.float64), ("duration", np.float32),
+                      ("phase", np.int8), ("task", np.int32)])
+
+
+def local_offset():
+    """
+    Returns the current local UTC offset in seconds.
+    """
+    return time.localtime().tm_gmtoff
+
+
+def day_numbers(ts, offset):
+    """
+    Returns local day numbers (days since 1970-01-01) of UNIX timestamps.
+    """
+    return np.floor_divide(np.asarray(ts, dtype=np.float64) + offset,
+                           SECONDS_PER_DAY).astype(np.int64)
+
+
+def run_lengths(active):
+    """
+    Returns starts and lengths of the runs of True values.
+    """
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+class SessionLog(object):
+    """
+    Finished phases, one array per column, in time order.
+
+    ts: end of the phase, UNIX timestamp.
+    duration: seconds the phase lasted.
+    phase: phase code, WORK, SHORT_BREAK or LONG_BREAK.
+    task: index into task_names.
+    """
+    def __init__(self, ts, duration, phase, task, task_names):
+        super(SessionLog, self).__init__()
+        self.ts = ts
+        self.duration = duration
+        self.phase = phase
+        self.task = task
+        self.task_names = task_names
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Creates log from (ts, duration, phase code, task name) rows, any
+        iterable of them, e.g. a cursor. Tasks are numbered in the order
+        they first appear.
+        """
+        codes = {}
+        code = codes.setdefault
+        columns = np.fromiter(
+            ((ts, duration, phase, code(task, len(codes)))
+             for ts, duration, phase, task in rows), dtype=LOG_DTYPE)
+        return cls(columns["ts"], columns["duration"], columns["phase"],
+                   columns["task"], list(codes))
+
+    @classmethod
+    def from_history(cls, history, start=0, end=float("inf")):
+        """
+        Loads finished phases between two UNIX timestamps from a
+        HistoryStore, on a connection of its own.
+        """
+        history.flush()
+        return cls.from_rows(history.iter_query(PHASE_ENDS, (start, end)))
+
+
+class Rollups(object):
+    """
+    Materialised aggregates of finished phases: focus time, pomodoros and
+    breaks per local day, and focus time and pomodoros per task. Weekly
+    totals, streaks and break adherence are derived from the daily arrays.
+    """
+    def __init__(self, offset=None):
+        """
+        :param offset: UTC offset in seconds used to split days, the
+            current local one by default.
+        """
+        super(Rollups, self).__init__()
+        self.offset = local_offset() if offset is None else offset
+        # Day number of the first element of the daily arrays.
+        self.first_day = None
+        self.focus = np.zeros(0)
+        self.pomodoros = np.zeros(0, dtype=np.int64)
+        self.breaks = np.zeros(0, dtype=np.int64)
+        self.task_names = []
+        self.task_rows = {}
+        self.task_focus = np.zeros(0)
+        self.task_pomodoros = np.zeros(0, dtype=np.int64)
+        # Reentrant, summary reads through the other readers.
+        self._lock = threading.RLock()
+        # Events that came while the rollups were loaded, see
+        # from_history.
+        self._pending = None
+
+    @classmethod
+    def from_log(cls, log, offset=None):
+        """
+        Computes rollups of a SessionLog.
+        """
+        rollups = cls(offset)
+        rollups._load(log)
+        return rollups
+
+    @classmethod
+    def from_history(cls, history, offset=None):
+        """
+        Loads rollups of a HistoryStore and keeps them up to date. Phases
+        that finish while the history is read are added once it's read,
+        so none is missed or counted twice.
+        """
+        rollups = cls(offset)
+        rollups._pending = []
+        history.subscribe(rollups.on_history_event)
+        end = time.time()
+        try:
+            log = SessionLog.from_history(history, end=end)
+        except BaseException:
+            history.unsubscribe(rollups.on_history_event)
+            raise
+        with rollups._lock:
+            rollups._load(log)
+            pending, rollups._pending = rollups._pending, None
+            for event in pending:
+                if event[0] >= end:
+                    rollups.on_history_event(*event)
+        return rollups
+
+    def _load(self, log):
+        if not len(log):
+            return
+        days = day_numbers(log.ts, self.offset)
+        self.first_day = int(days.min())
+        index = days - self.first_day
+        size = int(index.max()) + 1
+        work = log.phase == WORK
+        work_time = np.where(work, log.duration, 0).astype(np.float64)
+
+        self.focus = np.bincount(index, weights=work_time, minlength=size)
+        self.pomodoros = np.bincount(index[work], minlength=size)
+        self.breaks = np.bincount(index[~work], minlength=size)
+
+        tasks = len(log.task_names)
+        self.task_names = list(log.task_names)
+        self.task_rows = {name: row for row, name in enumerate(log.task_names)}
+        self.task_focus = np.bincount(log.task, weights=work_time,
+                                      minlength=tasks)
+        self.task_pomodoros = np.bincount(log.task[work], minlength=tasks)
+
+    def _day_index(self, day):
+        """
+        Returns index of a day in the daily arrays, growing them as needed.
+        """
+        if self.first_day is None:
+            self.first_day = day
+        if day < self.first_day:
+            pad = self.first_day - day
+            self.focus = np.concatenate((np.zeros(pad), self.focus))
+            self.pomodoros = np.concatenate((np.zeros(pad, np.int64),
+                                             self.pomodoros))
+            self.breaks = np.concatenate((np.zeros(pad, np.int64),
+                                          self.breaks))
+            self.first_day = day
+        index = day - self.first_day
+        if index >= len(self.focus):
+            pad = index + 1 - len(self.focus)
+            self.focus = np.concatenate((self.focus, np.zeros(pad)))
+            self.pomodoros = np.concatenate((self.pomodoros,
+                                             np.zeros(pad, np.int64)))
+            self.breaks = np.concatenate((self.breaks,
+                                          np.zeros(pad, np.int64)))
+        return index
+
+    def _task_row(self, task):
+        row = self.task_rows.get(task)
+        if row is None:
+            row = self.task_rows[task] = len(self.task_names)
+            self.task_names.append(task)
+            self.task_focus = np.append(self.task_focus, 0.0)
+            self.task_pomodoros = np.append(self.task_pomodoros, 0)
+        return row
+
+    def add(self, ts, duration, phase, task=""):
+        """
+        Adds one finished phase.
+        :param ts: end of the phase, UNIX timestamp.
+        :param duration: seconds the phase lasted.
+        :param phase: phase code.
+        :param task: task name.
+        """
+        with self._lock:
+            index = self._day_index(int((ts + self.offset) // SECONDS_PER_DAY))
+            if phase != WORK:
+                self.breaks[index] += 1
+                return
+            self.focus[index] += duration
+            self.pomodoros[index] += 1
+            row = self._task_row(task or "")
+            self.task_focus[row] += duration
+            self.task_pomodoros[row] += 1
+
+    def on_history_event(self, ts, kind, phase, duration, task, session):
+        """
+        HistoryStore listener that adds every finished phase.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((ts, kind, phase, duration, task,
+                                      session))
+                return
+        if kind == PHASE_END and duration is not None:
+            self.add(ts, duration, PHASE_CODES.get(phase, LONG_BREAK), task)
+
+    def days(self):
+        """
+        Returns dates of the daily arrays as datetime64[D].
+        """
+        with self._lock:
+            first = 0 if self.first_day is None else self.first_day
+            return (np.arange(len(self.focus)) + first).astype("datetime64[D]")
+
+    def per_week(self):
+        """
+        Returns weekly totals, weeks starting on Monday.
+        :return:
+            (Monday dates as datetime64[D], focus seconds, pomodoros)
+        """
+        with self._lock:
+            if self.first_day is None:
+                return (np.zeros(0, dtype="datetime64[D]"), np.zeros(0),
+                        np.zeros(0, dtype=np.int64))
+            weeks = (np.arange(len(self.focus)) + self.first_day +
+                     WEEK_SHIFT) // 7
+            index = weeks - weeks[0]
+            mondays = (np.arange(index[-1] + 1) + weeks[0]) * 7 - WEEK_SHIFT
+            return (mondays.astype("datetime64[D]"),
+                    np.bincount(index, weights=self.focus),
+                    np.bincount(index,
+                                weights=self.pomodoros).astype(np.int64))
+
+    def per_task(self):
+        """
+        Returns dictionary of task name to (focus seconds, pomodoros).
+        """
+        with self._lock:
+            return {name: (float(self.task_focus[row]),
+                           int(self.task_pomodoros[row]))
+                    for row, name in enumerate(self.task_names)}
+
+    def streaks(self, now=None):
+        """
+        Returns longest and current runs of days with at least one pomodoro.
+        The current streak still counts when the last pomodoro was
+        yesterday, as today isn't over yet.
+        :return:
+            (longest, current) in days.
+        """
+        with self._lock:
+            starts, lengths = run_lengths(self.pomodoros > 0)
+            if not len(lengths):
+                return 0, 0
+            today = int(day_numbers(time.time() if now is None else now,
+                                    self.offset))
+            last_day = self.first_day + starts[-1] + lengths[-1] - 1
+            current = int(lengths[-1]) if last_day >= today - 1 else 0
+            return int(lengths.max()), current
+
+    def break_adherence(self):
+        """
+        Returns breaks taken per finished pomodoro, over days with
+        pomodoros. 1.0 means a break after every pomodoro.
+        :return:
+            (overall ratio, per-day ratios)
+        """
+        with self._lock:
+            worked = self.pomodoros > 0
+            daily = np.zeros(len(self.pomodoros))
+            np.divide(self.breaks, self.pomodoros, out=daily, where=worked)
+            daily = np.minimum(daily, 1.0)
+            total = int(self.pomodoros.sum())
+            overall = min(float(self.breaks[worked].sum()) / total, 1.0) \
+                if total else 0.0
+            return overall, daily
+
+    def summary(self, now=None):
+        """
+        Returns totals for today and the current week, and the streaks.
+        :return:
+            dictionary
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            today = int(day_numbers(now, self.offset))
+            result = {"today_pomodoros": 0, "today_focus": 0.0,
+                      "week_pomodoros": 0, "week_focus": 0.0}
+            if self.first_day is not None:
+                index = today - self.first_day
+                if 0 <= index < len(self.focus):
+                    result["today_pomodoros"] = int(self.pomodoros[index])
+                    result["today_focus"] = float(self.focus[index])
+                monday = today - (today + WEEK_SHIFT) % 7 - self.first_day
+                week = slice(max(monday, 0), max(index + 1, 0))
+                result["week_pomodoros"] = int(self.pomodoros[week].sum())
+                result["week_focus"] = float(self.focus[week].sum())
+            result["longest_streak"], result["current_streak"] = \
+                self.streaks(now)
+            result["break_adherence"] = self.break_adherence()[0]
+            return result
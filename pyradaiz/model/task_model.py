@@ -0,0 +1,176 @@
+"""
+This module contains the Qt table model that shows a TaskStore. Rows are
+exposed to the view in batches as it scrolls, and no per-cell items are
+created at all.
+"""
+import bisect
+import itertools
+from array import array
+
+from PyQt5 import QtCore
+
+from model.tasks import TASKS_INSERTED, TASK_CHANGED
+
+__author__ = 'Alen Suljkanovic'
+
+# Rows handed to the view per fetchMore call.
+FETCH_BATCH = 256
+
+COLUMNS = ("Name", "Description", "Pomodoros")
+NAME_COLUMN, DESCRIPTION_COLUMN, COUNTER_COLUMN = range(len(COLUMNS))
+
+
+class TaskTableModel(QtCore.QAbstractTableModel):
+    """
+    Read-only table model over a TaskStore. Finished tasks are shown
+    checked in the name column.
+    """
+    def __init__(self, store, parent=None):
+        super(TaskTableModel, self).__init__(parent)
+        self.store = store
+        # Rows the view knows about.
+        self.fetched = min(len(store), FETCH_BATCH)
+        # With a filter, store rows of the fetched matches, and the
+        # iterator of the remaining ones.
+        self.rows = None
+        self._matches = None
+        # Tells whether a store row added later matches the filter.
+        self._accept = None
+        store.subscribe(self.on_store_changed)
+
+    def set_filter(self, matches, accept=None):
+        """
+        Shows only the given store rows.
+        :param matches: iterator of store rows in ascending order, e.g. a
+            TaskIndex query, or None to show all tasks.
+        :param accept: function that tells whether a store row matches,
+            e.g. a TaskIndex matcher, for the tasks added from now on.
+            Without it they wait for the next filter.
+        """
+        self.beginResetModel()
+        if matches is None:
+            self.rows = None
+            self._matches = None
+            self._accept = None
+            self.fetched = min(len(self.store), FETCH_BATCH)
+        else:
+            self.rows = array("I")
+            self._matches = iter(matches)
+            self._accept = accept
+            self.fetched = 0
+            self._pull()
+        self.endResetModel()
+
+    def _pull(self):
+        """
+        Takes the next batch of matches.
+        :return:
+            number of new rows.
+        """
+        batch = list(itertools.islice(self._matches, FETCH_BATCH))
+        if len(batch) < FETCH_BATCH:
+            self._matches = None
+        self.rows.extend(batch)
+        self.fetched = len(self.rows)
+        return len(batch)
+
+    def store_row(self, row):
+        """
+        Returns store row shown in the given view row.
+        """
+        return row if self.rows is None else self.rows[row]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = self.store_row(index.row()), index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == NAME_COLUMN:
+                return self.store.names[row]
+            if column == DESCRIPTION_COLUMN:
+                return self.store.descriptions[row]
+            return self.store.counters[row]
+        if role == QtCore.Qt.CheckStateRole and column == NAME_COLUMN:
+            if self.store.finished[row]:
+                return QtCore.Qt.Checked
+            return QtCore.Qt.Unchecked
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and \
+                orientation == QtCore.Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return False
+        if self.rows is not None:
+            return self._matches is not None
+        return self.fetched < len(self.store)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        if self.rows is not None:
+            if self._matches is None:
+                return
+            first = self.fetched
+            # The rows are pulled first to know how many there are, but
+            # rowCount only grows between begin and end.
+            count = self._pull()
+            self.fetched = first
+            if count:
+                self.beginInsertRows(QtCore.QModelIndex(), first,
+                                     first + count - 1)
+                self.fetched = first + count
+                self.endInsertRows()
+            return
+        count = min(FETCH_BATCH, len(self.store) - self.fetched)
+        if count <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.fetched,
+                             self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def on_store_changed(self, event, first, last):
+        """
+        Keeps the view in sync with the store. New rows are announced only
+        when the view has already fetched everything before them. While a
+        filter is set, the new rows it accepts come after its matches.
+        """
+        if event == TASKS_INSERTED:
+            if self.rows is None:
+                if first == self.fetched:
+                    self.fetchMore()
+            elif self._accept is not None:
+                rows = [row for row in range(first, last + 1)
+                        if self._accept(row)]
+                if not rows:
+                    return
+                # Store rows are only appended, they sort after the
+                # matches.
+                if self._matches is None:
+                    self._matches = iter(rows)
+                    self.fetchMore()
+                else:
+                    self._matches = itertools.chain(self._matches, rows)
+        elif event == TASK_CHANGED:
+            if self.rows is not None:
+                for store_row in range(first, last + 1):
+                    row = bisect.bisect_left(self.rows, store_row)
+                    if row < len(self.rows) and self.rows[row] == store_row:
+                        self._changed(row, row)
+            elif first < self.fetched:
+                self._changed(first, min(last, self.fetched - 1))
+
+    def _changed(self, first, last):
+        self.dataChanged.emit(self.index(first, 0),
+                              self.index(last, len(COLUMNS) - 1))
@@ -0,0 +1,120 @@
+"""
+This module contains tasks and the compact task store used by the tasks
+panel. The store keeps one column per field instead of one object per task,
+so tens of thousands of tasks take a few megabytes.
+"""
+import itertools
+from array import array
+
+__author__ = 'Alen Suljkanovic'
+
+# Store events sent to the listeners.
+TASKS_INSERTED = "inserted"
+TASK_CHANGED = "changed"
+
+
+class Task(object):
+    """
+    Class that describes one PyModoro task.
+    """
+    __slots__ = ("name", "description", "counter", "finished")
+
+    def __init__(self, name, description, counter=0, finished=False):
+        """Initialize task object"""
+        self.name = name
+        self.description = description
+        self.counter = counter
+        self.finished = finished
+
+
+class TaskStore(object):
+    """
+    Column store of tasks. Rows are addressed by index and only appended.
+    Listeners are called as listener(event, first, last) after the change.
+    """
+    def __init__(self):
+        super(TaskStore, self).__init__()
+        self.names = []
+        self.descriptions = []
+        self.counters = array("I")
+        self.finished = bytearray()
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, event, first, last):
+        for listener in self.listeners:
+            listener(event, first, last)
+
+    def add(self, name, description="", counter=0, finished=False):
+        """
+        Appends one task.
+        :return:
+            row of the new task.
+        """
+        return self.extend([(name, description, counter, finished)])
+
+    def extend(self, rows):
+        """
+        Appends tasks given as (name, description, counter, finished) tuples
+        and notifies the listeners once.
+        :return:
+            row of the first new task.
+        """
+        first = len(self)
+        for name, description, counter, finished in rows:
+            self.names.append(name)
+            self.descriptions.append(description)
+            self.counters.append(counter)
+            self.finished.append(1 if finished else 0)
+        if len(self) > first:
+            self.notify(TASKS_INSERTED, first, len(self) - 1)
+        return first
+
+    def get(self, row):
+        """
+        Returns a Task copy of the given row.
+        """
+        return Task(self.names[row], self.descriptions[row],
+                    self.counters[row], bool(self.finished[row]))
+
+    def edit(self, row, name=None, description=None):
+        if name is not None:
+            self.names[row] = name
+        if description is not None:
+            self.descriptions[row] = description
+        self.notify(TASK_CHANGED, row, row)
+
+    def increment(self, row):
+        """
+        Counts one more finished pomodoro for the task.
+        """
+        self.counters[row] += 1
+        self.notify(TASK_CHANGED, row, row)
+
+    def set_finished(self, row, finished=True):
+        self.finished[row] = 1 if finished else 0
+        self.notify(TASK_CHANGED, row, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.get(row)
+
+    def rows(self):
+        """
+        Yields (name, description, counter, finished) tuples of the tasks
+        stored when it's called; tasks appended meanwhile aren't included.
+        """
+        count = len(self)
+        columns = zip(self.names, self.descriptions, self.counters,
+                      self.finished)
+        for name, description, counter, finished in \
+                itertools.islice(columns, count):
+            yield name, description, counter, bool(finished)
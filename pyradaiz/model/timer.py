@@ -0,0 +1,105 @@
+"""
+This module contains the deadline based countdown used by the timer thread.
+"""
+import math
+import time
+
+__author__ = 'Alen Suljkanovic'
+
+# Tolerance used when rounding the remaining time to whole seconds. A wake up
+# that lands a hair before the boundary still counts as being on it.
+EPSILON = 0.001
+
+
+class DeadlineTimer(object):
+    """
+    Countdown that keeps an absolute monotonic deadline instead of
+    decrementing a counter. The remaining time is always computed from the
+    clock, so the work done between two ticks never accumulates as drift.
+    """
+    def __init__(self, clock=time.monotonic):
+        """
+        Initialize timer.
+        :param clock: function that returns monotonic time in seconds.
+        """
+        super(DeadlineTimer, self).__init__()
+        self.clock = clock
+        self.deadline = None
+        self._remaining = 0.0
+
+    def start(self, seconds):
+        """
+        Starts counting down from now.
+        :param seconds: phase duration in seconds.
+        """
+        self.deadline = self.clock() + seconds
+
+    def chain(self, seconds):
+        """
+        Starts the next phase at the current deadline rather than now, so
+        a late wake up at a phase boundary is not carried into the next phase.
+        :param seconds: phase duration in seconds.
+        """
+        if self.deadline is None:
+            self._remaining = seconds
+        else:
+            self.deadline += seconds
+
+    def reset(self, seconds):
+        """
+        Stops the countdown and sets the remaining time.
+        :param seconds: remaining time in seconds.
+        """
+        self.deadline = None
+        self._remaining = seconds
+
+    def pause(self):
+        """
+        Freezes the remaining time.
+        """
+        if self.deadline is not None:
+            self._remaining = self.remaining()
+            self.deadline = None
+
+    def resume(self):
+        """
+        Continues counting down from the frozen remaining time.
+        """
+        if self.deadline is None:
+            self.deadline = self.clock() + self._remaining
+
+    @property
+    def running(self):
+        return self.deadline is not None
+
+    def remaining(self):
+        """
+        Returns remaining time in seconds.
+        :return:
+            float
+        """
+        if self.deadline is None:
+            return self._remaining
+        return max(0.0, self.deadline - self.clock())
+
+    def remaining_seconds(self):
+        """
+        Returns remaining time rounded up to whole seconds, so the display
+        shows 25:00 right after the start and 00:00 only on the deadline.
+        :return:
+            int
+        """
+        return max(0, int(math.ceil(self.remaining() - EPSILON)))
+
+    def next_tick(self):
+        """
+        Returns the delay until the next whole-second boundary, measured from
+        the deadline.
+        :return:
+            float
+        """
+        remaining = self.remaining()
+        whole = self.remaining_seconds()
+        if whole == 0:
+            return 0.0
+        return max(0.0, remaining - (whole - 1))
@@ -1,4 +1,5 @@
 import os
+import sys
 
 __author__ = 'Alen Suljkanovic'
 
@@ -8,4 +9,104 @@ def get_root_path():
     Returns project's root path
     """
     path = os.path.split(os.path.abspath(os.path.dirname(__file__)))[0]
-    return path
\ No newline at end of file
+    return path
+
+
+def get_config_path():
+    """
+    Returns per-user directory for pyradaiz configuration.
+    """
+    if os.name == "nt":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "pyradaiz")
+
+
+def get_data_path():
+    """
+    Returns per-user directory for pyradaiz data, e.g. the session history.
+    """
+    if os.name == "nt":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "pyradaiz")
+
+
+def get_cache_path():
+    """
+    Returns per-user directory for pyradaiz caches.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pyradaiz")
+
+
+def get_runtime_path():
+    """
+    Returns per-user directory for sockets and other files that only live
+    as long as pyradaiz runs.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if not base:
+        import tempfile
+        base = tempfile.gettempdir()
+    return base
+
+
+def time_str(minutes, seconds):
+    """
+    Creates string from minutes and seconds in following format: mm:ss.
+    :param minutes: current minute
+    :param seconds: current second
+    :return:
+        string
+    """
+    disp_mins = "0%s" % minutes if minutes < 10  else minutes
+    disp_secs = "0%s" % seconds if seconds < 10 else seconds
+
+    time = "{0}:{1}".format(disp_mins, disp_secs)
+    return time
+
+
+def rss_mb():
+    """
+    Returns the resident set size of the process in megabytes, or the peak
+    size where the current one isn't known.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    scale = 1024.0 if sys.platform != "darwin" else 1024.0 * 1024.0
+    return peak / scale
+
+
+def release_memory():
+    """
+    Collects garbage and asks the C allocator to hand free memory back to
+    the system, which glibc otherwise keeps for later allocations.
+    """
+    import gc
+    gc.collect()
+    if not sys.platform.startswith("linux"):
+        return
+    import ctypes
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
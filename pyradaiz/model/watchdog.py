@@ -0,0 +1,252 @@
+"""
+This module contains the GUI watchdog: it notices when the GUI thread stops
+processing events, samples what the thread is doing while it's stuck, and
+keeps the latency of every display tick, from the timer thread emitting it
+to the GUI showing it.
+
+The GUI thread beats a heartbeat timer. When no beat came for longer than
+the threshold, a watchdog thread samples the stack of the GUI thread every
+interval until the beats resume. Samples, stalls and tick latencies go to
+a rolling trace file in the Chrome trace format, which chrome://tracing,
+Perfetto and speedscope load, and as folded stacks next to it, which
+flamegraph.pl takes.
+
+While running, new events are appended to the file as a JSON array without
+its closing bracket, which the trace viewers accept; the file is started
+over from the kept events when it grows past twice MAX_EVENTS. On close it
+is written once more as a complete trace.
+
+    PYRADAIZ_WATCHDOG=/tmp/pyradaiz.trace.json  watch and write the trace
+    PYRADAIZ_STALL_MS=100                        stall threshold, 200 ms
+"""
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+from model.instrumentation import Histogram
+from model.settings_store import atomic_write
+
+__author__ = 'Alen Suljkanovic'
+
+# Seconds without a beat that count as a stall.
+STALL_THRESHOLD = 0.2
+
+# Seconds between beats, and between stack samples during a stall.
+INTERVAL = 0.05
+
+# Trace events kept; older ones are dropped from the file.
+MAX_EVENTS = 50000
+
+# Seconds between appends to the trace file.
+WRITE_INTERVAL = 5.0
+
+# Frames kept per stack sample, innermost first.
+MAX_DEPTH = 64
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                           frame.f_lineno)
+
+
+class StallWatchdog(object):
+    """
+    Watches a thread that calls beat regularly, the GUI thread by default.
+    """
+    def __init__(self, path=None, threshold=STALL_THRESHOLD,
+                 interval=INTERVAL, thread_id=None, clock=time.monotonic):
+        """
+        :param path: trace file, or None to keep the trace in memory.
+        :param threshold: seconds without a beat that count as a stall.
+        :param interval: seconds between stack samples.
+        :param thread_id: ident of the watched thread, the main thread by
+            default.
+        """
+        super(StallWatchdog, self).__init__()
+        self.path = path
+        self.threshold = threshold
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.clock = clock
+        self.origin = clock()
+        self.pid = os.getpid()
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+        self.folded = collections.Counter()
+        self.stalls = Histogram()
+        self.delivery = Histogram()
+        self.samples = 0
+        self._last_beat = self.origin
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Events not in the trace file yet, the open file, the events in it,
+        # and whether the folded stacks changed since they were written.
+        self._unwritten = collections.deque()
+        self._file = None
+        self._file_events = 0
+        self._folded_changed = False
+        self._thread = threading.Thread(target=self._run, name="watchdog",
+                                         daemon=True)
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Returns a watchdog configured in the environment, or None.
+        """
+        path = os.environ.get("PYRADAIZ_WATCHDOG")
+        if not path:
+            return None
+        threshold = STALL_THRESHOLD
+        try:
+            threshold = int(os.environ["PYRADAIZ_STALL_MS"]) / 1000.0
+        except (KeyError, ValueError):
+            pass
+        return cls(path, threshold=threshold)
+
+    def start(self):
+        # Started late by the window, it may have been closed meanwhile.
+        if self._stop.is_set():
+            return
+        self._last_beat = self.clock()
+        self._thread.start()
+
+    def _ts(self, t):
+        return int((t - self.origin) * 1e6)
+
+    def beat(self):
+        """
+        Called by the watched thread. Ends a stall, if there was one.
+        """
+        now = self.clock()
+        with self._lock:
+            last, self._last_beat = self._last_beat, now
+        gap = now - last
+        if gap > self.threshold:
+            self.stalls.add(gap)
+            self._add({"name": "stall", "ph": "X", "cat": "stall",
+                       "ts": self._ts(last), "dur": int(gap * 1e6),
+                       "pid": self.pid, "tid": self.thread_id,
+                       "args": {"ms": round(gap * 1000, 1)}})
+
+    def record_delivery(self, emitted):
+        """
+        Records how long a tick took to reach the watched thread.
+        :param emitted: time the tick was emitted, on the same clock.
+        """
+        now = self.clock()
+        latency = max(0.0, now - emitted)
+        self.delivery.add(latency)
+        self._add({"name": "tick delivery", "ph": "C", "ts": self._ts(now),
+                   "pid": self.pid,
+                   "args": {"latency_ms": round(latency * 1000, 3)}})
+
+    def _add(self, event):
+        self.events.append(event)
+        if self.path:
+            self._unwritten.append(event)
+
+    def sample(self):
+        """
+        Records the stack of the watched thread.
+        """
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+        stack.reverse()
+        ts = self._ts(self.clock())
+        dur = int(self.interval * 1e6)
+        # Frames of one sample nest, outermost first, which trace viewers
+        # draw as a flame graph.
+        for name in stack:
+            self._add({"name": name, "ph": "X", "cat": "sample", "ts": ts,
+                       "dur": dur, "pid": self.pid, "tid": self.thread_id})
+        self.folded[";".join(stack)] += 1
+        self.samples += 1
+        self._folded_changed = True
+
+    def _run(self):
+        written = self.clock()
+        while not self._stop.wait(self.interval):
+            now = self.clock()
+            with self._lock:
+                stalled = now - self._last_beat > self.threshold
+            if stalled:
+                self.sample()
+            if self.path and now - written >= WRITE_INTERVAL:
+                self.append()
+                written = now
+
+    def trace(self):
+        """
+        Returns the trace in the Chrome trace format.
+        """
+        return {"traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"stall_threshold_ms": self.threshold * 1000}}
+
+    def append(self):
+        """
+        Appends the events recorded since the last call to the trace file,
+        and writes the folded stacks if they changed. Costs only the new
+        events, unless the file is started over.
+        """
+        unwritten = self._unwritten
+        if self._file is None or self._file_events >= 2 * MAX_EVENTS:
+            if self._file is not None:
+                self._file.close()
+            # An event recorded between the two lines is written twice,
+            # which the viewers don't mind.
+            unwritten.clear()
+            events = list(self.events)
+            self._file = open(self.path, "w")
+            self._file.write("[\n")
+            self._file_events = 0
+        else:
+            events = []
+            while unwritten:
+                events.append(unwritten.popleft())
+        if events:
+            self._file.write("".join(json.dumps(event) + ",\n"
+                                     for event in events))
+            self._file.flush()
+            self._file_events += len(events)
+        if self._folded_changed:
+            self._folded_changed = False
+            self._write_folded(self.path)
+
+    def _write_folded(self, path):
+        folded = "".join("%s %d\n" % item for item in self.folded.items())
+        atomic_write(path + ".folded", folded.encode("utf-8"))
+
+    def write(self, path=None):
+        """
+        Writes the whole trace, and the folded stacks to path + ".folded".
+        """
+        path = path or self.path
+        atomic_write(path, json.dumps(self.trace()).encode("utf-8"))
+        self._write_folded(path)
+
+    def as_dict(self):
+        return {"stalls": self.stalls.as_dict(),
+                "delivery_latency": self.delivery.as_dict(),
+                "samples": self.samples}
+
+    def close(self):
+        """
+        Stops watching and writes the trace.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path:
+            self.write()
@@ -0,0 +1,282 @@
+"""
+Asyncio server that hosts many named pomodoro sessions.
+
+Clients talk newline delimited JSON over a Unix domain socket or localhost
+TCP. Every request carries an "id", a "cmd" (start, stop, reset, status,
+subscribe, unsubscribe or close) and a "session" name, and gets exactly one
+reply with the same "id". Subscribed clients are pushed phase changes as
+{"event": "take_a_break" | "go_on", "session": ..., "minutes": ...}.
+
+A session lives while any connection that used it is open, or until one
+of them closes it.
+
+    python server.py --unix /tmp/pyradaiz.sock
+    python server.py --port 5577
+"""
+import argparse
+import asyncio
+import json
+
+from model.consts import POMODORO_DURATION, SHORT_BREAK, LONG_BREAK
+from model.core import (PomodoroSession, Scheduler, EVENT_TAKE_A_BREAK,
+                        EVENT_GO_ON)
+
+__author__ = 'Alen Suljkanovic'
+
+# Clients that let this much unread data pile up are disconnected instead of
+# slowing down everyone else.
+MAX_WRITE_BUFFER = 256 * 1024
+# Thousands of clients tend to connect at once when the server restarts.
+BACKLOG = 4096
+# Sessions one connection may use at once, and sessions in all.
+MAX_SESSIONS_PER_CLIENT = 1000
+MAX_SESSIONS = 100000
+# Length of one timing wheel tick in seconds; phase events are pushed at most
+# this late.
+RESOLUTION = 0.01
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode(line):
+    return json.loads(line.decode())
+
+
+def session_state(session):
+    """
+    Returns the session state as a dictionary.
+    """
+    return {"session": session.name,
+            "phase": session.phase,
+            "time": session.time,
+            "running": session.running,
+            "pomodoro_cnt": session.pomodoro_cnt}
+
+
+class SessionServer(object):
+    """
+    Keeps the sessions and their subscribers. All the sessions share one
+    timing wheel, which the event loop advances every tick while any session
+    is running; a session is only woken up at its phase boundary.
+    """
+    def __init__(self, pomodoro_duration=POMODORO_DURATION,
+                 short_break=SHORT_BREAK, long_break=LONG_BREAK, loop=None):
+        super(SessionServer, self).__init__()
+        self.pomodoro_duration = pomodoro_duration
+        self.short_break = short_break
+        self.long_break = long_break
+        self.loop = loop or asyncio.get_event_loop()
+        self.sessions = {}
+        self.subscribers = {}
+        # Connections that used each session, and sessions each connection
+        # used.
+        self.clients = {}
+        self.used = {}
+        self.scheduler = Scheduler(RESOLUTION, clock=self.loop.time)
+        self._ticker = None
+        self.commands = {
+            "start": self.start,
+            "stop": self.stop,
+            "reset": self.reset,
+            "status": self.status,
+            "subscribe": self.subscribe,
+            "unsubscribe": self.unsubscribe,
+            "close": self.close_session,
+        }
+
+    def get_session(self, name):
+        """
+        Returns session with the given name, creating it when needed.
+        """
+        session = self.sessions.get(name)
+        if session is None:
+            session = PomodoroSession(self.pomodoro_duration,
+                                      self.short_break, self.long_break,
+                                      name=name, clock=self.loop.time)
+            session.ticks = False
+            session.subscribe(self.on_session_event)
+            self.sessions[name] = session
+            self.subscribers[name] = set()
+            self.clients[name] = set()
+        return session
+
+    def free_session(self, name):
+        """
+        Stops the session and forgets it.
+        """
+        session = self.sessions.pop(name)
+        self.scheduler.cancel(session)
+        del self.subscribers[name]
+        for writer in self.clients.pop(name):
+            self.used[writer].discard(name)
+
+    def release(self, writer):
+        """
+        Lets go of the sessions of a closed connection; those no other
+        connection uses are freed.
+        """
+        for name in self.used.pop(writer, ()):
+            self.subscribers[name].discard(writer)
+            clients = self.clients[name]
+            clients.discard(writer)
+            if not clients:
+                self.free_session(name)
+
+    def on_session_event(self, session, event, value):
+        """
+        Pushes phase changes to the subscribers of the session.
+        """
+        if event not in (EVENT_TAKE_A_BREAK, EVENT_GO_ON):
+            return
+        data = encode({"event": event, "session": session.name,
+                       "minutes": value})
+        for writer in list(self.subscribers[session.name]):
+            self.send(writer, data)
+
+    def send(self, writer, data):
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            writer.close()
+            return
+        writer.write(data)
+
+    def _arm(self):
+        """
+        Makes sure the wheel is advanced while it holds any timers.
+        """
+        if self._ticker is None and len(self.scheduler.wheel):
+            self._ticker = self.loop.call_later(RESOLUTION, self._tick)
+
+    def _tick(self):
+        self._ticker = None
+        self.scheduler.advance()
+        self._arm()
+
+    def start(self, session, writer):
+        self.scheduler.schedule(session)
+        self._arm()
+
+    def stop(self, session, writer):
+        self.scheduler.cancel(session)
+
+    def reset(self, session, writer):
+        self.scheduler.reset(session)
+
+    def status(self, session, writer):
+        pass
+
+    def subscribe(self, session, writer):
+        self.subscribers[session.name].add(writer)
+
+    def unsubscribe(self, session, writer):
+        self.subscribers[session.name].discard(writer)
+
+    def close_session(self, session, writer):
+        self.free_session(session.name)
+
+    def dispatch(self, request, writer):
+        """
+        Executes one request and returns the reply.
+        """
+        if not isinstance(request, dict):
+            return {"id": None, "ok": False,
+                    "error": "request must be a JSON object"}
+        reply = {"id": request.get("id")}
+        cmd = request.get("cmd")
+        name = request.get("session")
+        if not isinstance(name, str):
+            reply.update(ok=False, error="session name must be a string")
+            return reply
+
+        if not isinstance(cmd, str) or cmd not in self.commands:
+            reply.update(ok=False, error="unknown command %r" % cmd)
+            return reply
+
+        used = self.used.setdefault(writer, set())
+        if name not in used:
+            if len(used) >= MAX_SESSIONS_PER_CLIENT:
+                reply.update(ok=False, error="too many sessions, at most %d "
+                             "per connection" % MAX_SESSIONS_PER_CLIENT)
+                return reply
+            if name not in self.sessions and \
+                    len(self.sessions) >= MAX_SESSIONS:
+                reply.update(ok=False, error="too many sessions, at most %d "
+                             "in all" % MAX_SESSIONS)
+                return reply
+        session = self.get_session(name)
+        used.add(name)
+        self.clients[name].add(writer)
+        self.commands[cmd](session, writer)
+
+        reply["ok"] = True
+        reply.update(session_state(session))
+        return reply
+
+    async def handle_client(self, reader, writer):
+        """
+        Serves one client until it disconnects.
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Over the stream limit, 64 KiB by default. The rest of
+                    # the line can't be told apart from the next request.
+                    self.send(writer, encode({"id": None, "ok": False,
+                                              "error": "request too long"}))
+                    break
+                if not line:
+                    break
+                try:
+                    request = decode(line)
+                except ValueError:
+                    reply = {"id": None, "ok": False, "error": "invalid JSON"}
+                else:
+                    reply = self.dispatch(request, writer)
+                self.send(writer, encode(reply))
+        except ConnectionError:
+            pass
+        finally:
+            self.release(writer)
+            writer.close()
+
+    async def serve(self, path=None, host="127.0.0.1", port=5577):
+        """
+        Starts listening on a Unix socket if path is given, otherwise on TCP.
+        """
+        if path:
+            return await asyncio.start_unix_server(self.handle_client, path,
+                                                   backlog=BACKLOG)
+        return await asyncio.start_server(self.handle_client, host, port,
+                                          backlog=BACKLOG)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pyradaiz session server")
+    parser.add_argument("--unix", help="Unix domain socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5577)
+    parser.add_argument("--pomodoro", type=float, default=POMODORO_DURATION,
+                        help="pomodoro duration in minutes")
+    parser.add_argument("--short-break", type=float, default=SHORT_BREAK)
+    parser.add_argument("--long-break", type=float, default=LONG_BREAK)
+    args = parser.parse_args()
+
+    async def run():
+        server = SessionServer(args.pomodoro, args.short_break,
+                               args.long_break,
+                               loop=asyncio.get_running_loop())
+        listener = await server.serve(args.unix, args.host, args.port)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
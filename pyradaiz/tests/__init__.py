@@ -0,0 +1,7 @@
+"""
+Tests for pyradaiz. Run them from the pyradaiz directory, e.g.:
+
+    python -m pytest -q
+    python -m unittest discover -s tests -t .
+"""
+__author__ = 'Alen Suljkanovic'
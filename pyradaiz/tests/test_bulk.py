@@ -0,0 +1,169 @@
+"""
+Tests of the validation of bulk imported tasks and history.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from model import bulk
+from model.bulk import (ImportReport, detect_kind, history_row, import_history,
+                        import_tasks, task_row, KIND_HISTORY, KIND_TASKS)
+from model.core import PHASE_WORK
+from model.history import HistoryStore, PHASE_END, PHASE_START
+from model.tasks import TaskStore
+
+__author__ = 'Alen Suljkanovic'
+
+
+class RowTest(unittest.TestCase):
+    def test_task_defaults(self):
+        self.assertEqual(task_row({"name": "write"}),
+                         ("write", "", 0, False))
+
+    def test_task_from_csv_text(self):
+        record = {"name": "write", "description": "docs", "counter": " 7 ",
+                  "finished": "Yes"}
+        self.assertEqual(task_row(record), ("write", "docs", 7, True))
+
+    def test_task_rejects(self):
+        for record, message in [
+                ({"name": "  "}, "name is missing"),
+                ({"name": 3}, "name must be text"),
+                ({"name": "a", "counter": True}, "counter must be a whole"),
+                ({"name": "a", "counter": 1.5}, "counter must be a whole"),
+                ({"name": "a", "counter": "-1"}, "counter must be a whole"),
+                ({"name": "a", "counter": 2 ** 32}, "counter out of range"),
+                ({"name": "a", "finished": "maybe"}, "finished must be"),
+                ({"name": "a", "finished": 2}, "finished must be")]:
+            with self.assertRaisesRegex(ValueError, message):
+                task_row(record)
+
+    def test_history(self):
+        record = {"ts": "100.5", "kind": PHASE_END, "phase": PHASE_WORK,
+                  "duration": 1500, "task": "write", "session": ""}
+        self.assertEqual(history_row(record),
+                         (100.5, PHASE_END, PHASE_WORK, 1500.0, "write",
+                          None))
+
+    def test_history_rejects(self):
+        for record, message in [
+                ({"ts": 1, "kind": "stop"}, "kind must be one of"),
+                ({"ts": 1, "kind": PHASE_END, "phase": "nap"},
+                 "phase must be one of"),
+                ({"kind": PHASE_END}, "ts is missing"),
+                ({"ts": "", "kind": PHASE_END}, "ts is missing"),
+                ({"ts": 1, "kind": PHASE_END, "task": 5}, "task must be text")]:
+            with self.assertRaisesRegex(ValueError, message):
+                history_row(record)
+
+    def test_number_rejects(self):
+        # A bool is an int, but no number here; nan and inf aren't finite.
+        for value in [True, -1, "-0.5", "inf", "nan", float("nan"), "ten",
+                      [1]]:
+            with self.assertRaises(ValueError) as raised:
+                history_row({"ts": 1, "kind": PHASE_END, "duration": value})
+            self.assertEqual(str(raised.exception),
+                             "duration must be zero or a positive number, "
+                             "got %r" % (value,))
+
+    def test_number_optional(self):
+        for value in [None, ""]:
+            row = history_row({"ts": 1, "kind": PHASE_END,
+                               "duration": value})
+            self.assertIsNone(row[3])
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+    def write_jsonl(self, name, lines):
+        return self.write(name, "\n".join(
+            line if isinstance(line, str) else json.dumps(line)
+            for line in lines) + "\n")
+
+    def test_detect_kind(self):
+        tasks = self.write("tasks.csv", "name,counter\nwrite,1\n")
+        history = self.write_jsonl("history.jsonl",
+                                   [{"ts": 1, "kind": PHASE_END}])
+        other = self.write_jsonl("other.jsonl", [{"id": 1}])
+        self.assertEqual(detect_kind(tasks), KIND_TASKS)
+        self.assertEqual(detect_kind(history), KIND_HISTORY)
+        self.assertIsNone(detect_kind(other))
+        with self.assertRaisesRegex(ValueError, "expected a .csv"):
+            detect_kind(self.write("tasks.txt", "name\nwrite\n"))
+
+    def test_import_tasks_skips_bad_rows(self):
+        path = self.write("tasks.csv",
+                          "Name,Description,Counter,Finished\n"
+                          "write,docs,2,no\n"
+                          ",no name,0,no\n"
+                          "test,,x,no\n"
+                          "short,row\n"
+                          "\n"
+                          "review,,0,yes\n")
+        store = TaskStore()
+        report = import_tasks(path, store, chunk_size=1)
+        self.assertEqual(store.names, ["write", "review"])
+        self.assertEqual(list(store.counters), [2, 0])
+        self.assertEqual(list(store.finished), [0, 1])
+        self.assertEqual((report.rows, report.imported, report.error_count),
+                         (5, 2, 3))
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5])
+        self.assertEqual(report.errors[0][1], "name is missing")
+        self.assertEqual(report.errors[2][1], "expected 4 fields, got 2")
+        self.assertIn("Imported 2 of 5 rows of tasks", report.summary())
+        self.assertTrue(report.summary().endswith(", 3 rejected"))
+
+    def test_import_history_skips_bad_rows(self):
+        path = self.write_jsonl("history.jsonl", [
+            {"ts": 10, "kind": PHASE_START, "phase": PHASE_WORK,
+             "duration": 1500, "task": "write"},
+            "{not json",
+            [1, 2],
+            {"ts": -1, "kind": PHASE_END},
+            {"ts": 20, "kind": "stop"},
+            {"ts": 30, "kind": PHASE_END, "phase": PHASE_WORK,
+             "duration": 1500.0, "task": "write", "session": "s"}])
+        history = HistoryStore(os.path.join(self.directory, "history.db"))
+        self.addCleanup(history.close)
+        report = import_history(path, history, chunk_size=1)
+        self.assertEqual((report.rows, report.imported, report.error_count),
+                         (6, 2, 4))
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4, 5])
+        self.assertTrue(report.errors[0][1].startswith("not JSON"))
+        self.assertEqual(report.errors[1][1], "not a JSON object")
+        self.assertEqual(report.errors[2][1],
+                         "ts must be zero or a positive number, got -1")
+        self.assertEqual(history.events(0, 100), [
+            (10.0, PHASE_START, PHASE_WORK, 1500.0, "write", None),
+            (30.0, PHASE_END, PHASE_WORK, 1500.0, "write", "s")])
+
+    def test_errors_kept_are_capped(self):
+        path = self.write("tasks.csv",
+                          "name,counter\n" + "a,x\n" * 5 + "b,1\n")
+        with mock.patch.object(bulk, "MAX_ERRORS", 2):
+            report = import_tasks(path, TaskStore())
+        self.assertEqual(report.error_count, 5)
+        self.assertEqual(len(report.errors), 2)
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(list(report.lines())[-1], "... 3 more")
+
+    def test_empty_report(self):
+        report = ImportReport("tasks.csv", KIND_TASKS)
+        self.assertEqual(report.rate, 0.0)
+        self.assertEqual(list(report.lines()), [report.summary()])
+
+
+if __name__ == "__main__":
+    unittest.main()
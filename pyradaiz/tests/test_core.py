@@ -0,0 +1,190 @@
+"""
+Tests of the Qt-free session core.
+"""
+import random
+import unittest
+
+from model.core import CyclePlan, PomodoroSession, Scheduler, TimingWheel, \
+    PHASE_WORK, PHASE_SHORT_BREAK, PHASE_LONG_BREAK
+
+__author__ = 'Alen Suljkanovic'
+
+
+class CyclePlanTest(unittest.TestCase):
+    def setUp(self):
+        # 25, 5 and 15 minutes: a cycle is 3 * 25 + 2 * 5 + 15 = 100 minutes.
+        self.plan = CyclePlan(25, 5, 15)
+
+    def test_cycle_length(self):
+        self.assertEqual(self.plan.length, 6000)
+        self.assertEqual(self.plan.phases,
+                         (PHASE_WORK, PHASE_SHORT_BREAK) * 2 +
+                         (PHASE_WORK, PHASE_LONG_BREAK))
+
+    def test_locate_start(self):
+        self.assertEqual(self.plan.locate(0), (PHASE_WORK, 1500, 0))
+
+    def test_locate_negative_is_start(self):
+        self.assertEqual(self.plan.locate(-10), (PHASE_WORK, 1500, 0))
+
+    def test_locate_inside_phase(self):
+        self.assertEqual(self.plan.locate(100), (PHASE_WORK, 1400, 0))
+        self.assertEqual(self.plan.locate(1600),
+                         (PHASE_SHORT_BREAK, 200, 1))
+
+    def test_locate_boundary_starts_next_phase(self):
+        self.assertEqual(self.plan.locate(1500),
+                         (PHASE_SHORT_BREAK, 300, 1))
+        self.assertEqual(self.plan.locate(1800), (PHASE_WORK, 1500, 1))
+
+    def test_long_break_after_third_pomodoro(self):
+        self.assertEqual(self.plan.locate(5100),
+                         (PHASE_LONG_BREAK, 900, 3))
+
+    def test_locate_later_cycles(self):
+        self.assertEqual(self.plan.locate(6000), (PHASE_WORK, 1500, 3))
+        self.assertEqual(self.plan.locate(10 * 6000 + 5100 + 1),
+                         (PHASE_LONG_BREAK, 899, 33))
+
+    def test_elapsed_is_inverse_of_locate(self):
+        for elapsed in range(0, 3 * 6000, 37):
+            position = self.plan.locate(elapsed)
+            self.assertAlmostEqual(
+                self.plan.elapsed(position.pomodoro_cnt, position.phase,
+                                  position.remaining), elapsed)
+
+    def test_elapsed_of_long_break(self):
+        # The long break belongs to the cycle its pomodoros are in.
+        self.assertEqual(self.plan.elapsed(3, PHASE_LONG_BREAK, 900), 5100)
+        self.assertEqual(self.plan.elapsed(6, PHASE_LONG_BREAK, 0), 12000)
+
+    def test_fractional_minutes(self):
+        plan = CyclePlan(0.5, 0.25, 1)
+        self.assertEqual(plan.locate(40), (PHASE_SHORT_BREAK, 5, 1))
+
+    def test_invalid_durations(self):
+        for durations in ((0, 5, 15), (25, -1, 15), (25, 5, float("inf")),
+                          (25, 5, "15"), (True, 5, 15)):
+            with self.assertRaises(ValueError):
+                CyclePlan(*durations)
+
+
+class TimingWheelTest(unittest.TestCase):
+    def setUp(self):
+        # One second ticks and 4 slots on 3 levels: timers more than 4
+        # ticks away cascade, more than 64 wait in the farthest slot.
+        self.wheel = TimingWheel(resolution=1.0, bits=2, levels=3)
+        self.fired = []
+
+    def schedule(self, when):
+        return self.wheel.schedule(when, self.fired.append, when)
+
+    def run_until(self, end):
+        """
+        Advances one tick at a time and returns {tick: [when, ...]}.
+        """
+        fired = {}
+        for now in range(1, end + 1):
+            for timer in self.wheel.advance(now):
+                timer.callback(*timer.args)
+                fired.setdefault(now, []).append(timer.args[0])
+        return fired
+
+    def test_fires_at_its_tick(self):
+        for when in (1, 3, 4, 5, 17, 64, 65, 200):
+            self.schedule(when)
+        self.assertEqual(len(self.wheel), 8)
+        fired = self.run_until(300)
+        self.assertEqual(fired, {when: [when]
+                                 for when in (1, 3, 4, 5, 17, 64, 65, 200)})
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_random_timers_fire_on_time(self):
+        rng = random.Random(1)
+        whens = [rng.randint(1, 500) for _ in range(2000)]
+        for when in whens:
+            self.schedule(when)
+        fired = self.run_until(500)
+        for tick, timers in fired.items():
+            self.assertTrue(all(when == tick for when in timers))
+        self.assertEqual(sorted(self.fired), sorted(whens))
+
+    def test_past_timer_fires_on_next_tick(self):
+        self.wheel.advance(10)
+        self.schedule(3)
+        self.assertEqual(self.wheel.advance(10), [])
+        self.assertEqual([t.args[0] for t in self.wheel.advance(11)], [3])
+
+    def test_cancel(self):
+        keep = self.schedule(20)
+        cancelled = self.schedule(20)
+        self.wheel.cancel(cancelled)
+        self.assertEqual(len(self.wheel), 1)
+        # Cancelling twice, or after firing, changes nothing.
+        self.wheel.cancel(cancelled)
+        self.assertEqual(len(self.wheel), 1)
+        fired = self.wheel.advance(20)
+        self.assertEqual(fired, [keep])
+        self.wheel.cancel(keep)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_advance_jumps_when_empty(self):
+        self.assertEqual(self.wheel.advance(1000000), [])
+        self.assertEqual(self.wheel.current, 1000000)
+        self.schedule(1000002)
+        self.assertEqual(self.wheel.advance(1000001), [])
+        self.assertEqual(len(self.wheel.advance(1000002)), 1)
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.scheduler = Scheduler(resolution=0.5, clock=self.clock)
+
+    def clock(self):
+        return self.now
+
+    def session(self, name):
+        # One minute phases, woken up only at the boundaries.
+        session = PomodoroSession(1, 1, 1, name=name, clock=self.clock,
+                                  wall_clock=lambda: 1e9 + self.now)
+        session.ticks = False
+        return session
+
+    def test_polls_sessions_at_phase_boundaries(self):
+        sessions = [self.session("s%d" % i) for i in range(100)]
+        for session in sessions:
+            self.scheduler.schedule(session)
+        self.now = 59.0
+        self.assertEqual(self.scheduler.advance(), 0)
+        self.now = 60.5
+        self.assertEqual(self.scheduler.advance(), 100)
+        for session in sessions:
+            self.assertEqual(session.phase, PHASE_SHORT_BREAK)
+            self.assertTrue(session.running)
+        self.assertEqual(len(self.scheduler.wheel), 100)
+
+    def test_cancel_pauses_and_unschedules(self):
+        session = self.session("a")
+        self.scheduler.schedule(session)
+        self.now = 30.0
+        self.scheduler.cancel(session)
+        self.assertFalse(session.running)
+        self.assertEqual(len(self.scheduler.wheel), 0)
+        self.now = 120.0
+        self.assertEqual(self.scheduler.advance(), 0)
+        self.assertEqual(session.phase, PHASE_WORK)
+
+    def test_reset(self):
+        session = self.session("a")
+        self.scheduler.schedule(session)
+        self.now = 61.0
+        self.scheduler.advance()
+        self.scheduler.reset(session)
+        self.assertEqual((session.phase, session.pomodoro_cnt, session.time),
+                         (PHASE_WORK, 0, "01:00"))
+        self.assertEqual(len(self.scheduler.wheel), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
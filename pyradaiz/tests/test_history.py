@@ -0,0 +1,105 @@
+"""
+Tests of the history's writer thread when the database can't be written.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from model import history
+from model.core import PHASE_WORK
+from model.history import HistoryStore, PHASE_END
+
+__author__ = 'Alen Suljkanovic'
+
+
+class WriterFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Locked writes fail fast and are tried again soon.
+        for name, value in [("BUSY_TIMEOUT", 0.05), ("RETRY_DELAY", 0.1),
+                            ("WRITE_ATTEMPTS", 3)]:
+            patch = mock.patch.object(history, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store = HistoryStore(os.path.join(self.directory, "history.db"),
+                                  flush_interval=0.01)
+        self.addCleanup(self.store.close)
+        # The writer has made the database.
+        self.assertTrue(self.store.flush(5))
+
+    def lock(self):
+        """
+        Takes the database's write lock on a connection of the test.
+        """
+        db = sqlite3.connect(self.store.path, timeout=0,
+                             check_same_thread=False)
+        self.addCleanup(db.close)
+        db.execute("BEGIN IMMEDIATE")
+        return db
+
+    def record(self, ts):
+        self.store.record(PHASE_END, PHASE_WORK, 1500, task="write", ts=ts)
+
+    def events(self):
+        return [event[0] for event in self.store.events(0, 1000)]
+
+    def test_locked_batch_is_retried(self):
+        locker = self.lock()
+        # Let go after the first attempt failed, before the last one.
+        unlock = threading.Timer(0.12, locker.rollback)
+        unlock.start()
+        self.addCleanup(unlock.join)
+        self.record(1)
+        self.assertTrue(self.store.flush(5))
+        self.assertEqual(self.store.dropped, 0)
+        self.assertEqual(self.events(), [1.0])
+
+    def test_locked_batch_is_dropped(self):
+        locker = self.lock()
+        with self.assertLogs("model.history", "ERROR") as logs:
+            self.record(1)
+            self.record(2)
+            self.assertTrue(self.store.flush(5))
+        self.assertEqual(self.store.dropped, 2)
+        self.assertIn("Dropped 2 history events", logs.output[0])
+        self.assertIn("locked", logs.output[0])
+
+        # The writer keeps going once the lock is gone.
+        locker.rollback()
+        self.record(3)
+        self.assertTrue(self.store.flush(5))
+        self.assertEqual(self.store.dropped, 2)
+        self.assertEqual(self.events(), [3.0])
+
+    def test_other_errors_are_not_retried(self):
+        started = time.monotonic()
+        with mock.patch.object(history, "RETRY_DELAY", 10), \
+                self.assertLogs("model.history", "ERROR"):
+            # Can't be bound as a parameter.
+            self.store.record(PHASE_END, session=object(), ts=1)
+            self.assertTrue(self.store.flush(5))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.store.dropped, 1)
+
+    def test_flush_times_out(self):
+        locker = self.lock()
+        self.record(1)
+        self.assertFalse(self.store.flush(0.05))
+        locker.rollback()
+        self.assertTrue(self.store.flush(5))
+
+    def test_flush_after_close(self):
+        self.record(1)
+        self.store.close()
+        self.assertFalse(self.store.flush(5))
+        self.assertEqual(self.events(), [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
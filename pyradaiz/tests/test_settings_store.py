@@ -0,0 +1,111 @@
+"""
+Tests of the settings store and its parsed settings cache.
+"""
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from model import settings_store
+from model.settings_store import SettingsStore, build_xml
+
+__author__ = 'Alen Suljkanovic'
+
+VALUES = {"pomodoro_duration": 25, "short_break": 5, "long_break": 15,
+          "always_on_top": "No"}
+
+
+class SettingsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = SettingsStore(self.directory)
+        self.write_config(VALUES)
+
+    def write_config(self, values, path=None):
+        with open(path or self.store.path, "wb") as f:
+            f.write(build_xml(values))
+
+    def load_without_parsing(self):
+        """
+        Loads with parse_xml failing the test, so only the cache can answer.
+        """
+        with mock.patch.object(settings_store, "parse_xml",
+                               side_effect=AssertionError("parsed")):
+            return SettingsStore(self.directory).load()
+
+    def load_parsed(self):
+        """
+        Loads and tells whether config.xml was parsed.
+        """
+        with mock.patch.object(settings_store, "parse_xml",
+                               wraps=settings_store.parse_xml) as parse:
+            values = SettingsStore(self.directory).load()
+        return values, parse.called
+
+    def test_first_load_parses_and_caches(self):
+        values, parsed = self.load_parsed()
+        self.assertTrue(parsed)
+        self.assertEqual(values["pomodoro_duration"], 25)
+        self.assertTrue(os.path.exists(self.store.cache_path))
+        self.assertEqual(self.load_without_parsing(), values)
+
+    def test_edit_in_place_invalidates(self):
+        self.store.load()
+        # Another size, so the test doesn't depend on the mtime resolution.
+        self.write_config(dict(VALUES, pomodoro_duration=125))
+        values, parsed = self.load_parsed()
+        self.assertTrue(parsed)
+        self.assertEqual(values["pomodoro_duration"], 125)
+
+    def test_replaced_file_with_old_mtime_invalidates(self):
+        self.store.load()
+        st = os.stat(self.store.path)
+        # Same size and modification time, but a new inode, the way
+        # configuration management pushes a file.
+        pushed = os.path.join(self.directory, "pushed.xml")
+        self.write_config(dict(VALUES, pomodoro_duration=30), pushed)
+        os.utime(pushed, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(pushed, self.store.path)
+        self.assertEqual(os.stat(self.store.path).st_size, st.st_size)
+        values, parsed = self.load_parsed()
+        self.assertTrue(parsed)
+        self.assertEqual(values["pomodoro_duration"], 30)
+
+    def test_corrupt_cache_falls_back_to_xml(self):
+        self.store.load()
+        with open(self.store.cache_path, "wb") as f:
+            f.write(b"\x00garbage")
+        values, parsed = self.load_parsed()
+        self.assertTrue(parsed)
+        self.assertEqual(values["short_break"], 5)
+
+    def test_invalid_cached_values_are_ignored(self):
+        self.store.load()
+        signature = settings_store.file_signature(self.store.path)
+        with open(self.store.cache_path, "wb") as f:
+            marshal.dump((signature, dict(VALUES, pomodoro_duration=0)), f)
+        values, parsed = self.load_parsed()
+        self.assertTrue(parsed)
+        self.assertEqual(values["pomodoro_duration"], 25)
+
+    def test_save_updates_cache(self):
+        self.store.load()
+        self.store.save(dict(VALUES, long_break=20))
+        self.assertEqual(self.load_without_parsing()["long_break"], 20)
+        self.assertFalse(self.store.changed())
+
+    def test_reload_only_after_a_change(self):
+        self.store.load()
+        self.assertIsNone(self.store.reload())
+        self.write_config(dict(VALUES, short_break=10))
+        self.assertTrue(self.store.changed())
+        self.assertEqual(self.store.reload()["short_break"], 10)
+        self.assertIsNone(self.store.reload())
+        self.assertEqual(self.load_without_parsing()["short_break"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests of the deadline based countdown.
+"""
+import unittest
+
+from model.timer import DeadlineTimer
+
+__author__ = 'Alen Suljkanovic'
+
+
+class DeadlineTimerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.timer = DeadlineTimer(clock=lambda: self.now)
+
+    def test_counts_down_from_the_clock(self):
+        self.timer.start(60)
+        self.assertTrue(self.timer.running)
+        self.now += 10.25
+        self.assertAlmostEqual(self.timer.remaining(), 49.75)
+        self.assertEqual(self.timer.remaining_seconds(), 50)
+        self.now += 100
+        self.assertEqual(self.timer.remaining(), 0.0)
+
+    def test_chain_starts_at_the_deadline(self):
+        self.timer.start(60)
+        # Woken up late, the next phase still starts at the boundary.
+        self.now += 60.4
+        self.timer.chain(30)
+        self.assertEqual(self.timer.deadline, 190.0)
+        self.assertAlmostEqual(self.timer.remaining(), 29.6)
+
+    def test_chain_does_not_drift(self):
+        self.timer.start(1)
+        for _ in range(1000):
+            self.now = self.timer.deadline + 0.3
+            self.timer.chain(1)
+        self.assertEqual(self.timer.deadline, 100.0 + 1001)
+
+    def test_chain_while_stopped_sets_remaining(self):
+        self.timer.reset(60)
+        self.timer.chain(30)
+        self.assertFalse(self.timer.running)
+        self.assertEqual(self.timer.remaining(), 30)
+
+    def test_pause_freezes_remaining(self):
+        self.timer.start(60)
+        self.now += 20
+        self.timer.pause()
+        self.assertFalse(self.timer.running)
+        self.now += 1000
+        self.assertEqual(self.timer.remaining(), 40)
+        # Pausing again changes nothing.
+        self.timer.pause()
+        self.assertEqual(self.timer.remaining(), 40)
+
+    def test_resume_continues_from_remaining(self):
+        self.timer.start(60)
+        self.now += 20
+        self.timer.pause()
+        self.now += 1000
+        self.timer.resume()
+        self.assertEqual(self.timer.deadline, self.now + 40)
+        deadline = self.timer.deadline
+        # Resuming a running timer keeps its deadline.
+        self.now += 5
+        self.timer.resume()
+        self.assertEqual(self.timer.deadline, deadline)
+
+    def test_reset_stops(self):
+        self.timer.start(60)
+        self.timer.reset(25 * 60)
+        self.assertFalse(self.timer.running)
+        self.assertEqual(self.timer.remaining_seconds(), 1500)
+
+    def test_remaining_seconds_rounds_up(self):
+        self.timer.start(60)
+        self.assertEqual(self.timer.remaining_seconds(), 60)
+        self.now += 0.5
+        self.assertEqual(self.timer.remaining_seconds(), 60)
+        # A wake up a hair before the boundary counts as on it.
+        self.now = self.timer.deadline - 1 - 0.0001
+        self.assertEqual(self.timer.remaining_seconds(), 1)
+        self.now = self.timer.deadline - 0.0001
+        self.assertEqual(self.timer.remaining_seconds(), 0)
+
+    def test_next_tick_is_measured_from_the_deadline(self):
+        self.timer.start(60)
+        self.now += 0.3
+        self.assertAlmostEqual(self.timer.next_tick(), 0.7)
+        self.now = self.timer.deadline
+        self.assertEqual(self.timer.next_tick(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()